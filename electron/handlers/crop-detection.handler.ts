@@ -5,6 +5,7 @@ import { ipcMain } from 'electron';
 import { execFile } from 'child_process';
 import * as fs from 'fs';
 import * as path from 'path';
+import * as os from 'os';
 import log from 'electron-log/main';
 import {
   getScriptsPath,
@@ -15,7 +16,9 @@ import {
   writeTempJson,
   cleanupTemp,
   parseLastJsonResult,
+  BATCH_MEMORY_RATIO,
 } from './crop-utils';
+import { runStreamedBatch } from '../utils/ndjson-batch';
 
 export function registerCropDetectionHandlers(): void {
 
@@ -139,29 +142,44 @@ export function registerCropDetectionHandlers(): void {
       }
 
       const batchPath = writeTempJson(params.items);
-      const args = [scriptPath, '--batch-json', batchPath];
+
+      // Detektalas szalakon: felannyi worker, mint mag; a memoriat a Python oldal figyeli
+      const workers = Math.max(1, Math.min(Math.floor(os.cpus().length / 2), params.items.length));
+      const memoryBudgetMb = Math.floor((os.totalmem() * BATCH_MEMORY_RATIO) / (1024 * 1024));
+      const args = [
+        scriptPath,
+        '--batch-json', batchPath,
+        '--workers', String(workers),
+        '--memory-budget-mb', String(memoryBudgetMb),
+        '--stream',
+      ];
 
       // Timeout: min 60s + item*10s, max 300s
       const timeout = Math.min(60000 + params.items.length * 10000, 300000);
 
-      execFile(getPythonPath(), args, { timeout, maxBuffer: 10 * 1024 * 1024 }, (error, stdout, stderr) => {
-        cleanupTemp(batchPath);
+      // Elemenkenti eredmeny azonnal a renderernek: a main process nem gyujti ossze a batch-et
+      const sendProgress = (result: Record<string, unknown>, index: number, progress: number, total: number) => {
+        if (_event.sender.isDestroyed()) return;
+        _event.sender.send('crop-batch-progress', { index, progress, total, result });
+      };
 
-        if (error) {
-          log.error('Crop detect-batch failed:', error.message);
-          if (stderr) log.error('stderr:', stderr);
-          resolve({ success: false, error: error.message });
-          return;
-        }
+      runStreamedBatch<Record<string, unknown>>(getPythonPath(), args, timeout, sendProgress).then((batch) => {
+        cleanupTemp(batchPath);
 
-        const result = parseLastJsonResult(stdout);
-        if (!result) {
-          log.error('Crop batch parse error. stdout:', stdout.slice(0, 500));
-          resolve({ success: false, error: 'Ervenytelen valasz a Python scripttol' });
+        if (!batch.success) {
+          log.error('Crop detect-batch failed:', batch.error);
+          resolve({ success: false, error: batch.error });
           return;
         }
 
-        resolve(result);
+        resolve({
+          success: true,
+          total: batch.summary['total'],
+          successful: batch.summary['successful'],
+          failed: batch.failures.length,
+          failures: batch.failures,
+          timings_summary: batch.summary['timings_summary'],
+        });
       });
     });
   });
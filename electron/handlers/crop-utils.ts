@@ -30,6 +30,9 @@ export const MAX_DOWNLOAD_SIZE = 50 * 1024 * 1024;
 /** Max read size: 30 MB */
 export const MAX_READ_SIZE = 30 * 1024 * 1024;
 
+/** Batch memoria keret a fizikai RAM aranyaban (a Python utemezo ez alapjan enged be kepeket) */
+export const BATCH_MEMORY_RATIO = 0.6;
+
 /** Python script base path (extraResources or dev) */
 export function getScriptsPath(): string {
   return app.isPackaged
@@ -23,6 +23,9 @@ export const MAX_DOWNLOAD_SIZE = 50 * 1024 * 1024;
 /** Max read size for readProcessedFile: 30 MB */
 export const MAX_READ_SIZE = 30 * 1024 * 1024;
 
+/** Batch memoria keret a fizikai RAM aranyaban (a Python utemezo ez alapjan enged be kepeket) */
+export const BATCH_MEMORY_RATIO = 0.6;
+
 /** Check if a file path is within allowed directories */
 export function isAllowedPath(filePath: string): boolean {
   const resolved = path.resolve(filePath);
@@ -107,6 +110,7 @@ export function sanitizeSettings(settings: Record<string, unknown>): Record<stri
   const VALID_BG_TYPES = ['preset', 'color', 'image', 'gradient'];
   const VALID_PRESETS = ['black', 'charcoal', 'dark_gray', 'navy', 'dark_blue', 'white', 'light_gray'];
   const VALID_DIRECTIONS = ['vertical', 'horizontal', 'radial'];
+  const VALID_ENGINES = ['torch', 'onnx'];
 
   const clampNum = (val: unknown, min: number, max: number, fallback: number): number => {
     const num = Number(val);
@@ -138,6 +142,8 @@ export function sanitizeSettings(settings: Record<string, unknown>): Record<stri
     feather_radius: clampNum(settings.feather_radius, 0, 50, 3),
     edge_smoothing: clampNum(settings.edge_smoothing, 0, 10, 2),
     output_quality: clampNum(settings.output_quality, 50, 100, 95),
+    inference_max_side: clampNum(settings.inference_max_side, 0, 10000, 0),
+    tile_rows: clampNum(settings.tile_rows, 0, 8192, 512),
 
     // Float ertekek (0-1)
     decontaminate: Boolean(settings.decontaminate),
@@ -150,6 +156,11 @@ export function sanitizeSettings(settings: Record<string, unknown>): Record<stri
     target_brightness: clampNum(settings.target_brightness, 0, 255, 35),
   };
 
+  // Inferencia motor: csak explicit ervenyes ertek (kulonben a Python env/default dont)
+  if (VALID_ENGINES.includes(String(settings.inference_engine))) {
+    sanitized.inference_engine = settings.inference_engine;
+  }
+
   // background_image_path validacio (path traversal vedelem)
   if (typeof settings.background_image_path === 'string' && isAllowedPath(settings.background_image_path)) {
     sanitized.background_image_path = settings.background_image_path;
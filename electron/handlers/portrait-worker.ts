@@ -0,0 +1,299 @@
+/**
+ * Portrait worker — hosszu eletu `process_portrait.py --serve` folyamat.
+ *
+ * A modell egyszer toltodik be, utana az egyedi kepek csak az inferencia idejet fizetik.
+ * Protokoll: soronkent egy JSON feladat stdin-en, soronkent egy JSON valasz stdout-on.
+ */
+import { spawn, ChildProcessWithoutNullStreams } from 'child_process';
+import * as fs from 'fs';
+import * as path from 'path';
+import * as readline from 'readline';
+import log from 'electron-log/main';
+
+import { getScriptsPath, getPythonPath, ensureVenv } from './portrait-python';
+import { writeTempJson, cleanupTemp } from './portrait-utils';
+
+/** Modell betoltes + warmup max ideje */
+const STARTUP_TIMEOUT = 120000;
+
+/** Tetlen worker leallitasa (a betoltott modell ~1 GB RAM) */
+const IDLE_TIMEOUT = 10 * 60 * 1000;
+
+interface QueuedJob {
+  id: number;
+  /** A feladat altal valasztott inferencia motor ('' = env / alapertelmezett) */
+  engine: string;
+  payload: Record<string, unknown>;
+  timeoutMs: number;
+  resolve: (result: Record<string, unknown>) => void;
+}
+
+interface RunningJob extends QueuedJob {
+  timer: NodeJS.Timeout;
+}
+
+function jobEngine(payload: Record<string, unknown>): string {
+  const settings = payload['settings'] as Record<string, unknown> | undefined;
+  return typeof settings?.['inference_engine'] === 'string' ? settings['inference_engine'] : '';
+}
+
+class PortraitWorker {
+  private proc: ChildProcessWithoutNullStreams | null = null;
+  private ready: Promise<boolean> | null = null;
+  /** A worker egyszerre egy feladatot dolgoz fel: a tobbi itt var, nem a stdin-en */
+  private queue: QueuedJob[] = [];
+  private running: RunningJob | null = null;
+  private nextId = 1;
+  private idleTimer: NodeJS.Timeout | null = null;
+  /** Utoljara valasztott motor: a kovetkezo inditas (es a warm) ezt tolti be */
+  private engine = '';
+  /** A futo worker altal betoltott motor */
+  private procEngine = '';
+
+  /**
+   * Feldolgoz egy kepet a worker-rel.
+   * null-t ad vissza, ha a worker nem indithato — ilyenkor a hivo az egyszeri folyamatra esik vissza.
+   */
+  process(
+    inputPath: string,
+    outputPath: string,
+    settings: Record<string, unknown>,
+    timeoutMs: number,
+  ): Promise<Record<string, unknown> | null> {
+    return this.request({ input: inputPath, output: outputPath, settings }, timeoutMs);
+  }
+
+  /** Alacsony felbontasu elonezet (a proxy kep es a maszk a workerben cache-elve marad) */
+  preview(
+    inputPath: string,
+    settings: Record<string, unknown>,
+    size: number,
+    timeoutMs: number,
+  ): Promise<Record<string, unknown> | null> {
+    return this.request({ command: 'preview', input: inputPath, settings, size }, timeoutMs);
+  }
+
+  private async request(
+    payload: Record<string, unknown>,
+    timeoutMs: number,
+  ): Promise<Record<string, unknown> | null> {
+    const engine = jobEngine(payload);
+    this.engine = engine;
+    const ok = await this.start();
+    if (!ok || !this.proc) return null;
+
+    this.clearIdleTimer();
+    return new Promise((resolve) => {
+      this.queue.push({ id: this.nextId++, engine, payload, timeoutMs, resolve });
+      this.dispatch();
+    });
+  }
+
+  /** Kovetkezo feladat kuldese, ha a worker kesz es szabad; az idozito csak most indul */
+  private dispatch(): void {
+    const proc = this.proc;
+    if (this.running || !proc || this.queue.length === 0) return;
+    void this.ready?.then((ok) => {
+      if (!ok || this.proc !== proc || this.running) return;
+      const next = this.queue[0];
+      if (!next) return;
+
+      // Mas motort valasztott feladat: a worker azzal indul ujra (bemelegitve), nem hidegen tolti be
+      if (next.engine !== this.procEngine) {
+        log.info(`Portrait worker motor valtas: ${this.procEngine || 'alapertelmezett'} -> ${next.engine || 'alapertelmezett'}`);
+        this.engine = next.engine;
+        this.shutdown();
+        void this.start().then((started) => {
+          if (started) this.dispatch();
+          else this.failPending('Portrait worker nem indithato ujra');
+        });
+        return;
+      }
+
+      const job = this.queue.shift();
+      if (!job) return;
+
+      const timer = setTimeout(() => {
+        log.warn(`Portrait worker timeout (job ${job.id}), ujrainditas`);
+        this.workerLost(proc, 'Idotullepes a feldolgozas soran');
+      }, job.timeoutMs);
+      this.running = { ...job, timer };
+      proc.stdin.write(JSON.stringify({ ...job.payload, id: job.id }) + '\n');
+    });
+  }
+
+  /**
+   * Worker elinditasa hatterben (modell betoltes + dummy inferencia), hogy az elso
+   * valodi keres mar meleg kernelekkel fusson. Tetlen marad -> IDLE_TIMEOUT utan leall.
+   */
+  warm(): void {
+    void this.start().then((ok) => {
+      if (ok && this.isIdle()) this.armIdleTimer();
+    });
+  }
+
+  /** Worker leallitasa (app kilepes, idle): minden varo feladat hibaval zarul */
+  stop(): void {
+    this.shutdown();
+    this.failPending('Portrait worker leallt');
+  }
+
+  private shutdown(): void {
+    this.clearIdleTimer();
+    const proc = this.proc;
+    this.proc = null;
+    this.ready = null;
+    if (proc) {
+      try { proc.stdin.end(JSON.stringify({ command: 'shutdown' }) + '\n'); } catch { /* ignore */ }
+      setTimeout(() => { if (proc.exitCode === null) proc.kill(); }, 5000).unref();
+    }
+  }
+
+  /**
+   * A futo feladat nem fejezheto be (timeout, kilepes, stdin hiba): csak az zarul hibaval,
+   * a sorban allok egy uj workeren futnak tovabb.
+   */
+  private workerLost(proc: ChildProcessWithoutNullStreams, error: string): void {
+    if (this.proc !== proc) return;
+    this.shutdown();
+    const job = this.running;
+    this.running = null;
+    if (job) {
+      clearTimeout(job.timer);
+      job.resolve({ success: false, error });
+    }
+    if (this.queue.length === 0) return;
+    void this.start().then((ok) => {
+      if (ok) this.dispatch();
+      else this.failPending('Portrait worker nem indithato ujra');
+    });
+  }
+
+  private start(): Promise<boolean> {
+    if (this.ready) return this.ready;
+
+    const scriptPath = path.join(getScriptsPath(), 'process_portrait.py');
+    if (!fs.existsSync(scriptPath)) return Promise.resolve(false);
+
+    ensureVenv();
+
+    // A warmup a kivalasztott motort tolti be (a --settings-json a feladatok alapbeallitasa is)
+    const engine = this.engine;
+    const settingsPath = engine ? writeTempJson({ inference_engine: engine }) : null;
+    const args = settingsPath ? [scriptPath, '--serve', '--settings-json', settingsPath] : [scriptPath, '--serve'];
+
+    this.ready = new Promise<boolean>((resolve) => {
+      let settled = false;
+      const settle = (ok: boolean) => {
+        if (settled) return;
+        settled = true;
+        clearTimeout(startupTimer);
+        if (settingsPath) cleanupTemp(settingsPath);
+        resolve(ok);
+      };
+
+      const proc = spawn(getPythonPath(), args);
+      this.proc = proc;
+      this.procEngine = engine;
+
+      const startupTimer = setTimeout(() => {
+        log.warn('Portrait worker nem indult el idoben');
+        if (this.proc === proc) this.shutdown();
+        settle(false);
+      }, STARTUP_TIMEOUT);
+
+      proc.on('error', (err) => {
+        log.error('Portrait worker inditas sikertelen:', err.message);
+        if (this.proc === proc) this.shutdown();
+        settle(false);
+      });
+
+      // Indulas kozben elveszett worker nem indul ujra (nincs ujrainditasi hurok): a start() false
+      const lost = () => {
+        if (settled) this.workerLost(proc, 'Portrait worker varatlanul kilepett');
+        else if (this.proc === proc) this.shutdown();
+        settle(false);
+      };
+
+      proc.on('exit', (code) => {
+        log.info(`Portrait worker kilepett (code=${code})`);
+        lost();
+      });
+
+      // Feladatok kozott meghalt worker: a write EPIPE 'error' esemenyt ad, ami kezeletlenul
+      // a main process-t dontene le
+      proc.stdin.on('error', (err) => {
+        log.warn('Portrait worker stdin hiba:', err.message);
+        lost();
+      });
+
+      proc.stderr.on('data', (chunk: Buffer) => {
+        log.debug('[portrait-worker]', chunk.toString().trimEnd());
+      });
+
+      readline.createInterface({ input: proc.stdout }).on('line', (line) => {
+        let msg: Record<string, unknown>;
+        try {
+          msg = JSON.parse(line);
+        } catch {
+          return;
+        }
+
+        if ('ready' in msg) {
+          if (msg.ready === true) {
+            log.info('Portrait worker kesz (modell betoltve)');
+            settle(true);
+          } else {
+            log.warn('Portrait worker warmup sikertelen:', msg.error);
+            if (this.proc === proc) this.shutdown();
+            settle(false);
+          }
+          return;
+        }
+
+        const job = this.running;
+        if (!job || msg.id !== job.id || this.proc !== proc) return;
+        clearTimeout(job.timer);
+        this.running = null;
+        job.resolve(msg);
+        this.dispatch();
+        if (this.isIdle()) this.armIdleTimer();
+      });
+    });
+
+    return this.ready;
+  }
+
+  private isIdle(): boolean {
+    return !this.running && this.queue.length === 0;
+  }
+
+  private failPending(error: string): void {
+    const jobs: QueuedJob[] = [...this.queue];
+    if (this.running) {
+      clearTimeout(this.running.timer);
+      jobs.unshift(this.running);
+      this.running = null;
+    }
+    this.queue = [];
+    for (const job of jobs) job.resolve({ success: false, error });
+  }
+
+  private armIdleTimer(): void {
+    this.clearIdleTimer();
+    this.idleTimer = setTimeout(() => {
+      log.info('Portrait worker tetlen, leallitas');
+      this.stop();
+    }, IDLE_TIMEOUT);
+    this.idleTimer.unref();
+  }
+
+  private clearIdleTimer(): void {
+    if (this.idleTimer) {
+      clearTimeout(this.idleTimer);
+      this.idleTimer = null;
+    }
+  }
+}
+
+export const portraitWorker = new PortraitWorker();
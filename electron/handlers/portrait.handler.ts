@@ -6,9 +6,12 @@ import * as os from 'os';
 import log from 'electron-log/main';
 
 import { getScriptsPath, getPythonPath, ensureVenv } from './portrait-python';
+import { portraitWorker } from './portrait-worker';
+import { runStreamedBatch, StreamedBatchFailure } from '../utils/ndjson-batch';
 import {
   SUPPORTED_EXTENSIONS,
   MAX_READ_SIZE,
+  BATCH_MEMORY_RATIO,
   isAllowedPath,
   isInsideTempDir,
   encodeUrlPath,
@@ -21,12 +24,51 @@ import {
   downloadFile,
 } from './portrait-utils';
 
+/** Batch elem eredmenye (a `--stream` result rekordjaibol) */
+interface PortraitBatchItemResult {
+  success: boolean; input: string; output?: string; error?: string; processing_time?: number;
+  timings?: Record<string, unknown>;
+  skipped?: boolean;
+  duplicate_of?: string;
+}
+
+/** Egyszeri `process_portrait.py` futtatas (worker fallback), settings temp JSON-ban */
+function runPortraitScript(
+  args: string[],
+  settings: Record<string, unknown>,
+): Promise<Record<string, unknown>> {
+  return new Promise((resolve) => {
+    const settingsPath = writeTempJson(settings);
+
+    execFile(getPythonPath(), [...args, '--settings-json', settingsPath], { timeout: 300000, maxBuffer: 10 * 1024 * 1024 }, (error, stdout, stderr) => {
+      cleanupTemp(settingsPath);
+
+      if (error) {
+        log.error('Portrait process failed:', error.message);
+        if (stderr) log.error('stderr:', stderr);
+        resolve({ success: false, error: error.message });
+        return;
+      }
+
+      const result = parseLastJsonResult(stdout);
+      if (!result) {
+        log.error('Portrait output parse error. stdout:', stdout.slice(0, 500));
+        resolve({ success: false, error: 'Ervenytelen valasz a Python scripttol' });
+        return;
+      }
+
+      resolve(result);
+    });
+  });
+}
+
 export function registerPortraitHandlers(): void {
   // Induláskori régi temp fájlok törlése
   cleanupOldTempFiles();
 
   // Kilépéskori cleanup
   app.on('will-quit', () => {
+    portraitWorker.stop();
     const portraitTmpDir = path.join(os.tmpdir(), 'photostack-portrait');
     try { fs.rmSync(portraitTmpDir, { recursive: true, force: true }); } catch { /* ignore */ }
   });
@@ -52,7 +94,10 @@ export function registerPortraitHandlers(): void {
         }
         try {
           const result = JSON.parse(stdout.trim());
-          resolve({ available: result.available === true });
+          const available = result.available === true;
+          // A --check nem tolt modellt: a worker hatterben bemelegszik az elso keresig
+          if (available) portraitWorker.warm();
+          resolve({ available });
         } catch {
           resolve({ available: false, error: 'Ervenytelen valasz a Python scripttol' });
         }
@@ -66,7 +111,9 @@ export function registerPortraitHandlers(): void {
     outputPath: string;
     settings: Record<string, unknown>;
   }) => {
-    return new Promise<{ success: boolean; error?: string; processing_time?: number }>((resolve) => {
+    return new Promise<{
+      success: boolean; error?: string; processing_time?: number; timings?: Record<string, unknown>;
+    }>((resolve) => {
       if (!params || typeof params.inputPath !== 'string' || typeof params.outputPath !== 'string') {
         resolve({ success: false, error: 'Ervenytelen parameterek' });
         return;
@@ -100,40 +147,83 @@ export function registerPortraitHandlers(): void {
         return;
       }
 
-      const settingsPath = writeTempJson(sanitizeSettings(params.settings || {}));
-
-      const args = [
-        scriptPath,
-        '--input', params.inputPath,
-        '--output', params.outputPath,
-        '--settings-json', settingsPath,
-      ];
+      const settings = sanitizeSettings(params.settings || {});
 
       log.info(`Portrait feldolgozas: ${path.basename(params.inputPath)}`);
 
-      execFile(getPythonPath(), args, { timeout: 300000, maxBuffer: 10 * 1024 * 1024 }, (error, stdout, stderr) => {
-        cleanupTemp(settingsPath);
+      // Elsodlegesen a hosszu eletu worker (modell egyszer betoltve), fallback: egyszeri folyamat
+      portraitWorker.process(params.inputPath, params.outputPath, settings, 300000)
+        .then((workerResult) => workerResult ?? runPortraitScript(
+          [scriptPath, '--input', params.inputPath, '--output', params.outputPath],
+          settings,
+        ))
+        .then((result) => {
+          resolve({
+            success: result.success === true,
+            error: result.error ? String(result.error).slice(0, 500) : undefined,
+            processing_time: typeof result.processing_time === 'number' ? result.processing_time : undefined,
+            timings: result.timings && typeof result.timings === 'object'
+              ? result.timings as Record<string, unknown>
+              : undefined,
+          });
+        });
+    });
+  });
 
-        if (error) {
-          log.error('Portrait process failed:', error.message);
-          if (stderr) log.error('stderr:', stderr);
-          resolve({ success: false, error: error.message });
-          return;
-        }
+  // ============ Low-res preview (settings UI) ============
+  ipcMain.handle('portrait:preview', (_event, params: {
+    inputPath: string;
+    settings: Record<string, unknown>;
+    size?: number;
+  }) => {
+    return new Promise<{
+      success: boolean; error?: string; outputPath?: string; width?: number; height?: number; processing_time?: number;
+    }>((resolve) => {
+      if (!params || typeof params.inputPath !== 'string') {
+        resolve({ success: false, error: 'Ervenytelen parameterek' });
+        return;
+      }
 
-        const result = parseLastJsonResult(stdout);
-        if (!result) {
-          log.error('Portrait output parse error. stdout:', stdout.slice(0, 500));
-          resolve({ success: false, error: 'Ervenytelen valasz a Python scripttol' });
-          return;
-        }
+      if (!isAllowedPath(params.inputPath)) {
+        resolve({ success: false, error: 'Path traversal nem megengedett (input)' });
+        return;
+      }
 
-        resolve({
-          success: result.success === true,
-          error: result.error ? String(result.error).slice(0, 500) : undefined,
-          processing_time: typeof result.processing_time === 'number' ? result.processing_time : undefined,
+      const ext = path.extname(params.inputPath).toLowerCase();
+      if (!SUPPORTED_EXTENSIONS.has(ext)) {
+        resolve({ success: false, error: `Nem tamogatott fajlformatum: ${ext}` });
+        return;
+      }
+
+      if (!fs.existsSync(params.inputPath)) {
+        resolve({ success: false, error: 'Bemeneti fajl nem talalhato' });
+        return;
+      }
+
+      const scriptPath = path.join(getScriptsPath(), 'process_portrait.py');
+      if (!fs.existsSync(scriptPath)) {
+        resolve({ success: false, error: 'Python script nem talalhato' });
+        return;
+      }
+
+      const settings = sanitizeSettings(params.settings || {});
+      const size = Math.round(Math.max(200, Math.min(2000, Number(params.size) || 800)));
+
+      portraitWorker.preview(params.inputPath, settings, size, 120000)
+        .then((workerResult) => workerResult ?? runPortraitScript(
+          [scriptPath, '--preview', '--input', params.inputPath, '--preview-size', String(size)],
+          settings,
+        ))
+        .then((result) => {
+          resolve({
+            success: result.success === true,
+            error: result.error ? String(result.error).slice(0, 500) : undefined,
+            outputPath: typeof result.output === 'string' ? result.output : undefined,
+            width: typeof result.width === 'number' ? result.width : undefined,
+            height: typeof result.height === 'number' ? result.height : undefined,
+            processing_time: typeof result.processing_time === 'number' ? result.processing_time : undefined,
+          });
         });
-      });
     });
   });
 
@@ -145,9 +235,11 @@ export function registerPortraitHandlers(): void {
     return new Promise<{
       success: boolean;
       error?: string;
-      results?: Array<{ success: boolean; input: string; output?: string; error?: string; processing_time?: number }>;
       total?: number;
       successful?: number;
+      failed?: number;
+      failures?: StreamedBatchFailure[];
+      timings_summary?: Record<string, unknown>;
     }>((resolve) => {
       if (!params || !Array.isArray(params.items) || params.items.length === 0) {
         resolve({ success: false, error: 'Nincsenek feldolgozando elemek' });
@@ -190,40 +282,48 @@ export function registerPortraitHandlers(): void {
       const settingsPath = writeTempJson(sanitizeSettings(params.settings || {}));
       const batchPath = writeTempJson(params.items);
 
+      // Parhuzamos workerek: ~4 mag workerenkent. A memoriat a Python oldali utemezo
+      // kezeli: kepmeret alapjan enged be elemet, es szukseg eseten kevesebb workert indit.
+      const workers = Math.max(1, Math.min(Math.floor(os.cpus().length / 4), params.items.length));
+      const memoryBudgetMb = Math.floor((os.totalmem() * BATCH_MEMORY_RATIO) / (1024 * 1024));
+
       const args = [
         scriptPath,
         '--batch-json', batchPath,
         '--settings-json', settingsPath,
+        '--workers', String(workers),
+        '--memory-budget-mb', String(memoryBudgetMb),
+        '--stream',
       ];
 
-      log.info(`Portrait batch feldolgozas: ${params.items.length} elem`);
+      log.info(`Portrait batch feldolgozas: ${params.items.length} elem, max ${workers} worker, ${memoryBudgetMb} MB keret`);
 
       // Minimum 5 perc (modell első betöltése lassú) + elemenként 2 perc, max 10 perc
       const timeout = Math.min(300000 + params.items.length * 120000, 600000);
 
-      execFile(getPythonPath(), args, { timeout, maxBuffer: 10 * 1024 * 1024 }, (error, stdout, stderr) => {
+      // Elemenkenti eredmeny azonnal a renderernek: a main process nem gyujti ossze a batch-et
+      const sendProgress = (result: PortraitBatchItemResult, index: number, progress: number, total: number) => {
+        if (_event.sender.isDestroyed()) return;
+        _event.sender.send('portrait-batch-progress', { index, progress, total, result });
+      };
+
+      runStreamedBatch<PortraitBatchItemResult>(getPythonPath(), args, timeout, sendProgress).then((batch) => {
         cleanupTemp(settingsPath);
         cleanupTemp(batchPath);
 
-        if (error) {
-          log.error('Portrait batch failed:', error.message);
-          if (stderr) log.error('stderr:', stderr);
-          resolve({ success: false, error: error.message });
-          return;
-        }
-
-        const result = parseLastJsonResult(stdout);
-        if (!result) {
-          log.error('Portrait batch parse error. stdout:', stdout.slice(0, 500));
-          resolve({ success: false, error: 'Ervenytelen valasz a Python scripttol' });
+        if (!batch.success) {
+          log.error('Portrait batch failed:', batch.error);
+          resolve({ success: false, error: batch.error });
           return;
         }
 
-        resolve(result as {
-          success: boolean;
-          results?: Array<{ success: boolean; input: string; output?: string; error?: string; processing_time?: number }>;
-          total?: number;
-          successful?: number;
+        resolve({
+          success: true,
+          total: batch.summary['total'] as number,
+          successful: batch.summary['successful'] as number,
+          failed: batch.failures.length,
+          failures: batch.failures,
+          timings_summary: batch.summary['timings_summary'] as Record<string, unknown>,
         });
       });
     });
@@ -505,12 +505,22 @@ contextBridge.exposeInMainWorld('electronAPI', {
       ipcRenderer.invoke('portrait:process-single', params) as Promise<{
         success: boolean; error?: string; processing_time?: number;
       }>,
+    preview: (params: { inputPath: string; settings: Record<string, unknown>; size?: number }) =>
+      ipcRenderer.invoke('portrait:preview', params) as Promise<{
+        success: boolean; error?: string; outputPath?: string; width?: number; height?: number; processing_time?: number;
+      }>,
     processBatch: (params: { items: Array<{ input: string; output: string }>; settings: Record<string, unknown> }) =>
       ipcRenderer.invoke('portrait:process-batch', params) as Promise<{
         success: boolean; error?: string;
-        results?: Array<{ success: boolean; input: string; output?: string; error?: string; processing_time?: number }>;
-        total?: number; successful?: number;
+        total?: number; successful?: number; failed?: number;
+        failures?: Array<{ index: number; error: string }>;
+        timings_summary?: Record<string, unknown>;
       }>,
+    onBatchProgress: (callback: (data: { index: number; progress: number; total: number; result: { success: boolean; input: string; output?: string; error?: string; processing_time?: number; skipped?: boolean; duplicate_of?: string } }) => void) => {
+      const handler = (_event: any, data: { index: number; progress: number; total: number; result: { success: boolean; input: string; output?: string; error?: string; processing_time?: number; skipped?: boolean; duplicate_of?: string } }) => callback(data);
+      ipcRenderer.on('portrait-batch-progress', handler);
+      return () => { ipcRenderer.removeListener('portrait-batch-progress', handler); };
+    },
     downloadBackground: (params: { url: string; outputPath: string }) =>
       ipcRenderer.invoke('portrait:download-background', params) as Promise<{
         success: boolean; error?: string; path?: string;
@@ -541,9 +551,15 @@ contextBridge.exposeInMainWorld('electronAPI', {
     detectBatch: (params: { items: Array<{ input: string }> }) =>
       ipcRenderer.invoke('crop:detect-batch', params) as Promise<{
         success: boolean; error?: string;
-        results?: Array<Record<string, unknown>>;
-        total?: number; successful?: number;
+        total?: number; successful?: number; failed?: number;
+        failures?: Array<{ index: number; error: string }>;
+        timings_summary?: Record<string, unknown>;
       }>,
+    onBatchProgress: (callback: (data: { index: number; progress: number; total: number; result: Record<string, unknown> }) => void) => {
+      const handler = (_event: any, data: { index: number; progress: number; total: number; result: Record<string, unknown> }) => callback(data);
+      ipcRenderer.on('crop-batch-progress', handler);
+      return () => { ipcRenderer.removeListener('crop-batch-progress', handler); };
+    },
     executeCrop: (params: {
       inputPath: string; outputPath: string; thumbnailPath?: string;
       face: Record<string, unknown>; settings: Record<string, unknown>;
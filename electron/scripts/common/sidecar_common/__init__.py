@@ -0,0 +1,8 @@
+"""Batch helpers shared by the Python sidecars (portrait, crop).
+
+The sidecars put electron/scripts/common on sys.path and import the
+modules directly: timings (stage timings + batch summary), budget (memory
+budget), sources (directory / glob batch inputs) and duplicates (repeated
+input detection). Only the standard library is imported at module level,
+so the --check / --help fast paths stay light.
+"""
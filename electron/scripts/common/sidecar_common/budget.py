@@ -0,0 +1,84 @@
+"""Memory budget for batch admission control.
+
+The sidecars estimate each item's peak memory from its header dimensions
+and hand items to workers only while the running total of the in-flight
+estimates fits into the budget. The per-pixel figures are the sidecar's
+own; the budget, its default and the admission gate are shared here.
+"""
+
+import os
+import threading
+from typing import Optional
+
+MB = 1024 * 1024
+
+# Alapertelmezett keret: a fizikai memoria ennyi resze (ha nincs --memory-budget-mb / env)
+DEFAULT_BUDGET_RATIO = 0.6
+FALLBACK_BUDGET_MB = 4096
+
+
+def image_pixels(path) -> int:
+    """Pixel count from the image header, 0 if unreadable (the item fails later anyway)."""
+    from PIL import Image  # csak a fejlec olvasasahoz, a --check utvonal nem tolti be
+    try:
+        with Image.open(path) as img:
+            w, h = img.size
+        return w * h
+    except Exception:
+        return 0
+
+
+def default_budget(env: Optional[str] = None, fallback_mb: int = FALLBACK_BUDGET_MB) -> int:
+    """Budget in bytes: the env variable (MB) if set, else DEFAULT_BUDGET_RATIO of physical RAM."""
+    try:
+        env_mb = int(os.environ.get(env) or 0) if env else 0
+    except ValueError:
+        env_mb = 0
+    if env_mb > 0:
+        return env_mb * MB
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        return int(total * DEFAULT_BUDGET_RATIO)
+    except (AttributeError, ValueError, OSError):
+        # Windows: nincs sysconf; az Electron oldal --memory-budget-mb-t ad at
+        return fallback_mb * MB
+
+
+def fit_workers(workers: int, budget: int, engine_base: int, largest_item: int) -> int:
+    """Cap worker count so every worker's model plus the largest item fit the budget."""
+    fit = max(1, (budget - largest_item) // max(1, engine_base))
+    return max(1, min(workers, fit))
+
+
+class MemoryBudget:
+    """Counting admission gate in bytes.
+
+    acquire() succeeds while used + amount fits the capacity — or when
+    nothing is in flight, so an item larger than the whole budget still
+    runs (alone) instead of blocking the batch forever.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(0, int(capacity))
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def _fits(self, amount: int) -> bool:
+        return self.used == 0 or self.used + amount <= self.capacity
+
+    def acquire(self, amount: int, block: bool = True) -> bool:
+        with self._cond:
+            if block:
+                self._cond.wait_for(lambda: self._fits(amount))
+            elif not self._fits(amount):
+                return False
+            self.used += amount
+            return True
+
+    def release(self, amount: int) -> None:
+        with self._cond:
+            self.used = max(0, self.used - amount)
+            self._cond.notify_all()
+
+    def __repr__(self) -> str:
+        return f"MemoryBudget({self.used // MB}/{self.capacity // MB} MB)"
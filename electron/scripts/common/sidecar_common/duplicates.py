@@ -0,0 +1,72 @@
+"""Duplicate input detection within one batch.
+
+The same file is often dropped into a batch twice, or one photo is reused
+for siblings and teachers. Inputs are matched by size first (stat only);
+on a size collision by a hash of their first and last bytes, and only if
+that matches too by a hash of the whole files. Every later copy of an input
+points at the first item with the same bytes, whose result is then reused
+instead of being processed again.
+"""
+
+import hashlib
+import os
+from typing import Optional
+
+# A fejlec (EXIF: ido, sorozatszam) es a fajl vege mar szinte mindig megkulonbozteti a kepeket
+PARTIAL_HASH_BYTES = 64 * 1024
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def file_hash(path) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while chunk := f.read(_HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def partial_hash(path, size: int) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        digest.update(f.read(PARTIAL_HASH_BYTES))
+        if size > 2 * PARTIAL_HASH_BYTES:
+            f.seek(-PARTIAL_HASH_BYTES, os.SEEK_END)
+            digest.update(f.read(PARTIAL_HASH_BYTES))
+    return digest.hexdigest()
+
+
+class DuplicateInputs:
+    """First item index per distinct input content, filled as items arrive."""
+
+    def __init__(self):
+        self._by_size = {}   # meret -> [(index, realpath)] elso elofordulasok
+        self._partial = {}   # realpath -> reszleges hash (csak meret utkozeskor)
+        self._full = {}      # realpath -> teljes hash (csak reszleges hash utkozeskor)
+
+    def _partial_hash(self, path: str, size: int) -> str:
+        if path not in self._partial:
+            self._partial[path] = partial_hash(path, size)
+        return self._partial[path]
+
+    def _full_hash(self, path: str) -> str:
+        if path not in self._full:
+            self._full[path] = file_hash(path)
+        return self._full[path]
+
+    def first_of(self, index: int, input_path: str) -> Optional[int]:
+        """Index of an earlier item with the same input bytes, else None (index becomes a first)."""
+        try:
+            path = os.path.realpath(input_path)
+            size = os.path.getsize(path)
+            candidates = self._by_size.setdefault(size, [])
+            for first, first_path in candidates:
+                if first_path == path or (
+                    self._partial_hash(first_path, size) == self._partial_hash(path, size)
+                    and self._full_hash(first_path) == self._full_hash(path)
+                ):
+                    return first
+        except OSError:
+            return None  # olvashatatlan bemenet: a feldolgozas adja a hibat
+        candidates.append((index, path))
+        return None
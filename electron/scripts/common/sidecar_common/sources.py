@@ -0,0 +1,94 @@
+"""Batch items from a directory or a glob pattern instead of a JSON array.
+
+A BatchSource lists the matching image paths once (strings only, sorted, so
+indexes and template outputs are stable between runs) and renders the
+{"input", "output"} items on the fly while the batch pulls them. Images and
+results are never held for the whole batch, so one process can work through
+a whole school without the MAX_BATCH_SIZE limit of --batch-json.
+
+Output template fields: {name} (file name), {stem}, {ext} (without the
+dot), {dir} (subdirectory relative to the source root, "" at the root) and
+{index}, e.g. "/out/{dir}/{stem}.jpg".
+"""
+
+import glob
+import os
+from pathlib import Path
+from typing import Optional
+
+# Ugyanaz, mint a SUPPORTED_EXTENSIONS (electron/handlers/portrait-utils.ts)
+IMAGE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tiff", ".tif"})
+
+_GLOB_CHARS = "*?["
+
+
+def _is_pattern(spec: str) -> bool:
+    return any(c in spec for c in _GLOB_CHARS)
+
+
+def _pattern_root(pattern: str) -> Path:
+    """Leading path components of a glob pattern without wildcards."""
+    root = []
+    for part in Path(pattern).parts:
+        if _is_pattern(part):
+            break
+        root.append(part)
+    return Path(*root) if root else Path(".")
+
+
+def render_output(template: str, input_path: str, root: Path, index: int) -> str:
+    path = Path(input_path)
+    rel_dir = os.path.relpath(path.parent, root)
+    return os.path.normpath(template.format(
+        name=path.name, stem=path.stem, ext=path.suffix.lstrip("."),
+        dir="" if rel_dir == "." else rel_dir, index=index,
+    ))
+
+
+class BatchSource:
+    """Images of a directory (not recursive) or a glob pattern (** recurses) as batch items."""
+
+    def __init__(self, spec: str, output_template: Optional[str] = None):
+        if _is_pattern(spec):
+            self.root = _pattern_root(spec)
+            self.pattern = spec
+        else:
+            self.root = Path(spec)
+            self.pattern = None
+            if not self.root.is_dir():
+                raise ValueError(f"Bemeneti mappa nem található: {spec}")
+
+        if output_template is not None:
+            try:
+                render_output(output_template, str(self.root / "x.jpg"), self.root, 0)
+            except (KeyError, IndexError, ValueError) as e:
+                raise ValueError(f"Érvénytelen kimeneti sablon ({e}): {output_template}") from None
+            # Enelkul minden elem ugyanabba a fajlba irna
+            if not any(f"{{{field}" in output_template for field in ("name", "stem", "index")):
+                raise ValueError("A kimeneti sablonban kell {name}, {stem} vagy {index} mező")
+        self.output_template = output_template
+        self._paths = None
+
+    def paths(self) -> list:
+        """Matching image paths, listed once (later files, e.g. our own outputs, are not picked up)."""
+        if self._paths is None:
+            if self.pattern is None:
+                with os.scandir(self.root) as entries:
+                    found = [entry.path for entry in entries if entry.is_file()]
+            else:
+                found = [p for p in glob.iglob(self.pattern, recursive=True) if os.path.isfile(p)]
+            self._paths = sorted(p for p in found if Path(p).suffix.lower() in IMAGE_EXTENSIONS)
+        return self._paths
+
+    def __len__(self) -> int:
+        return len(self.paths())
+
+    def __iter__(self):
+        for index, path in enumerate(self.paths()):
+            item = {"input": path}
+            if self.output_template is not None:
+                item["output"] = render_output(self.output_template, path, self.root, index)
+                # A sablon nem irhatja felul az eredetit (az elem hibaval zarul)
+                if os.path.abspath(item["output"]) == os.path.abspath(path):
+                    item["error"] = "A kimenet megegyezik a bemenettel"
+            yield item
@@ -0,0 +1,102 @@
+"""Per-stage wall time and peak-RSS accounting for result JSON.
+
+Every result gets a "timings" object ({stage: {"wall_ms", "peak_rss_delta_mb"}})
+and batches add a p50/p95 summary per stage. The RSS figure is the growth of
+the process high-water mark during the stage (getrusage), so it is 0 when a
+stage stays below an earlier peak, and shared by all threads of the process.
+"""
+
+import math
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ru_maxrss: Linux-on KB, macOS-en bajt
+_RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_UNIT
+
+
+class StageTimings:
+    """Ordered per-stage measurements of one item."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        rss_before = peak_rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall_ms = (time.perf_counter() - start) * 1000
+            rss_delta = None
+            if rss_before is not None:
+                rss_delta = round((peak_rss_bytes() - rss_before) / (1024 * 1024), 1)
+            # Ismetelt stage (pl. tobb lepesbol allo) osszeadodik
+            prev = self.stages.get(name)
+            if prev:
+                wall_ms += prev["wall_ms"]
+                if rss_delta is not None and prev["peak_rss_delta_mb"] is not None:
+                    rss_delta = round(rss_delta + prev["peak_rss_delta_mb"], 1)
+            self.stages[name] = {"wall_ms": round(wall_ms, 1), "peak_rss_delta_mb": rss_delta}
+
+    def as_dict(self) -> dict:
+        return dict(self.stages)
+
+
+def stage(timings, name: str):
+    """timings.stage(name), or a no-op context when timings is None."""
+    return timings.stage(name) if timings is not None else nullcontext()
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    # Nearest-rank percentilis: nem kell hozza numpy, es mindig valos mert ertek
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class TimingsSummary:
+    """Batch summary built item by item: keeps per-stage wall times, not the results."""
+
+    def __init__(self):
+        self._walls = {}
+        self._max_rss = {}
+
+    def add(self, result: dict) -> None:
+        for name, values in ((result or {}).get("timings") or {}).items():
+            self._walls.setdefault(name, []).append(values["wall_ms"])
+            rss = values.get("peak_rss_delta_mb")
+            if rss is not None:
+                self._max_rss[name] = max(rss, self._max_rss.get(name, rss))
+
+    def as_dict(self) -> dict:
+        """{stage: {"count", "p50_ms", "p95_ms", "max_peak_rss_delta_mb"}}."""
+        summary = {}
+        for name, walls in self._walls.items():
+            walls = sorted(walls)
+            summary[name] = {
+                "count": len(walls),
+                "p50_ms": _percentile(walls, 0.50),
+                "p95_ms": _percentile(walls, 0.95),
+                "max_peak_rss_delta_mb": self._max_rss.get(name),
+            }
+        return summary
+
+
+def summarize(results: list) -> dict:
+    """Batch summary of finished results, see TimingsSummary."""
+    summary = TimingsSummary()
+    for result in results:
+        summary.add(result)
+    return summary.as_dict()
@@ -9,6 +9,14 @@ Usage:
   python3 auto_crop.py --check                    # MediaPipe elérhető-e
   python3 auto_crop.py --input photo.jpg           # 1 kép detektálás
   python3 auto_crop.py --batch-json /tmp/batch.json # Batch detektálás
+  python3 auto_crop.py --batch-json /tmp/batch.json --workers 4 --memory-budget-mb 4096
+  python3 auto_crop.py --batch-json /tmp/batch.json --stream  # NDJSON rekordok
+  python3 auto_crop.py --batch-dir "/photos/**/*.jpg" --stream  # mappa / glob minta, MAX_BATCH_SIZE nélkül
+
+Stream mód (--stream): a stdout-on csak NDJSON rekordok vannak, elemenként egy
+(befejezési sorrendben), a végén egy összesítő az eredmények nélkül:
+  {"type": "result", "index": 3, "progress": 1, "total": 500, "result": {...}}
+  {"type": "summary", "success": true, "total": 500, "successful": 480, "failed": 20, "timings_summary": {...}}
 """
 
 import argparse
@@ -17,20 +25,34 @@ import logging
 import os
 import sys
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
-import cv2
-import numpy as np
-from PIL import Image
+# Közös batch segédek (időmérés, memória keret, mappa / glob bemenet, ismétlődések): electron/scripts/common
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "common"))
+
+from sidecar_common.budget import MB, default_budget, image_pixels
+from sidecar_common.duplicates import DuplicateInputs
+from sidecar_common.sources import BatchSource
+from sidecar_common.timings import StageTimings, TimingsSummary, summarize as summarize_timings
+
+# cv2 / numpy / PIL / mediapipe csak a detektálás útvonalán töltődik be:
+# a --check és az argumentum hibák nem fizetik az importjukat
 
 # Képméretkorlát: max 50 megapixel (védelem image bomb ellen)
-Image.MAX_IMAGE_PIXELS = 50_000_000
+MAX_IMAGE_PIXELS = 50_000_000
 
 MAX_BATCH_SIZE = 500
 
 # Downscale target a gyorsaság érdekében
 DETECTION_MAX_SIZE = 1024
 
+# Batch ütemezés: elemenkénti csúcs memória becslés (teljes BGR dekód + detektáló kép + Face Mesh)
+CROP_BYTES_PER_PIXEL = 4
+CROP_ITEM_BASE_BYTES = 96 * MB
+# Keret, ha a fizikai memória nem kérdezhető le (Windows) és nincs --memory-budget-mb
+FALLBACK_BUDGET_MB = 2048
+
 # Kulcs landmark indexek (MediaPipe Face Mesh 468 pont)
 LM_FOREHEAD = 10
 LM_CHIN = 152
@@ -67,6 +89,13 @@ logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
 
 
+def _pil_image():
+    """PIL.Image, imported on first use, with the pixel limit applied."""
+    from PIL import Image
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    return Image
+
+
 def check_available() -> bool:
     """Ellenőrzi, hogy a MediaPipe Face Mesh elérhető-e."""
     try:
@@ -79,6 +108,8 @@ def check_available() -> bool:
 
 def compute_ear(landmarks, img_w, img_h, eye_top, eye_bottom, eye_left, eye_right):
     """Eye Aspect Ratio (EAR) számítás — csukott szem detektálás."""
+    import numpy as np
+
     top = np.array([landmarks[eye_top].x * img_w, landmarks[eye_top].y * img_h])
     bottom = np.array([landmarks[eye_bottom].x * img_w, landmarks[eye_bottom].y * img_h])
     left = np.array([landmarks[eye_left].x * img_w, landmarks[eye_left].y * img_h])
@@ -93,9 +124,13 @@ def compute_ear(landmarks, img_w, img_h, eye_top, eye_bottom, eye_left, eye_righ
 
 def detect_faces(input_path: str) -> dict:
     """Egy kép arcdetektálása MediaPipe Face Mesh-sel."""
+    import cv2
     import mediapipe as mp
+    import numpy as np
+    Image = _pil_image()
 
     start_time = time.time()
+    timings = StageTimings()
 
     if not _is_allowed_path(input_path):
         return {"success": False, "input": input_path, "error": "Nem engedélyezett útvonal", "processing_time": 0}
@@ -106,8 +141,9 @@ def detect_faces(input_path: str) -> dict:
 
     try:
         # Kép betöltés és méret megállapítás
-        pil_img = Image.open(input_path)
-        original_width, original_height = pil_img.size
+        with timings.stage("decode"):
+            pil_img = Image.open(input_path)
+            original_width, original_height = pil_img.size
 
         # Downscale detektáláshoz
         scale = 1.0
@@ -115,25 +151,28 @@ def detect_faces(input_path: str) -> dict:
             scale = DETECTION_MAX_SIZE / max(original_width, original_height)
 
         # OpenCV-vel dolgozunk (MediaPipe RGB-t vár)
-        img_bgr = cv2.imread(str(input_path))
+        with timings.stage("decode"):
+            img_bgr = cv2.imread(str(input_path))
         if img_bgr is None:
             return {"success": False, "input": str(input_path), "error": "Kép betöltés sikertelen", "processing_time": 0}
 
-        if scale < 1.0:
-            new_w = int(img_bgr.shape[1] * scale)
-            new_h = int(img_bgr.shape[0] * scale)
-            img_bgr = cv2.resize(img_bgr, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        with timings.stage("resize"):
+            if scale < 1.0:
+                new_w = int(img_bgr.shape[1] * scale)
+                new_h = int(img_bgr.shape[0] * scale)
+                img_bgr = cv2.resize(img_bgr, (new_w, new_h), interpolation=cv2.INTER_AREA)
 
-        img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-        det_h, det_w = img_rgb.shape[:2]
+            img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+            det_h, det_w = img_rgb.shape[:2]
 
         # Quality scores: blur + exposure (a detektáláshoz használt képen)
-        gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
-        laplacian_var = float(cv2.Laplacian(gray, cv2.CV_64F).var())
-        exposure_mean = float(np.mean(gray))
+        with timings.stage("quality"):
+            gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+            laplacian_var = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+            exposure_mean = float(np.mean(gray))
 
         # MediaPipe Face Mesh
-        with mp.solutions.face_mesh.FaceMesh(
+        with timings.stage("face_mesh"), mp.solutions.face_mesh.FaceMesh(
             static_image_mode=True,
             max_num_faces=5,
             refine_landmarks=True,
@@ -158,72 +197,74 @@ def detect_faces(input_path: str) -> dict:
                     "is_overexposed": exposure_mean > 220,
                 },
                 "processing_time": round(elapsed, 3),
+                "timings": timings.as_dict(),
             }
 
-        faces = []
-        for face_landmarks in results.multi_face_landmarks:
-            lm = face_landmarks.landmark
-
-            # Kulcs pontok (eredeti képméretben)
-            forehead = {
-                "x": round(lm[LM_FOREHEAD].x * original_width, 1),
-                "y": round(lm[LM_FOREHEAD].y * original_height, 1),
-            }
-            chin = {
-                "x": round(lm[LM_CHIN].x * original_width, 1),
-                "y": round(lm[LM_CHIN].y * original_height, 1),
-            }
-            left_ear = {
-                "x": round(lm[LM_LEFT_EAR].x * original_width, 1),
-                "y": round(lm[LM_LEFT_EAR].y * original_height, 1),
-            }
-            right_ear = {
-                "x": round(lm[LM_RIGHT_EAR].x * original_width, 1),
-                "y": round(lm[LM_RIGHT_EAR].y * original_height, 1),
-            }
-
-            # Arc méret (eredeti képméretben)
-            face_height = abs(chin["y"] - forehead["y"])
-            face_width = abs(right_ear["x"] - left_ear["x"])
-
-            # Arc közép
-            face_center_x = round((left_ear["x"] + right_ear["x"]) / 2, 1)
-            face_center_y = round((forehead["y"] + chin["y"]) / 2, 1)
-
-            # Bounding box (összes landmark alapján)
-            xs = [l.x * original_width for l in lm]
-            ys = [l.y * original_height for l in lm]
-            bbox = {
-                "x": round(min(xs), 1),
-                "y": round(min(ys), 1),
-                "width": round(max(xs) - min(xs), 1),
-                "height": round(max(ys) - min(ys), 1),
-            }
-
-            # EAR (Eye Aspect Ratio) — csukott szem detektálás
-            left_ear_val = compute_ear(lm, det_w, det_h, LEFT_EYE_TOP, LEFT_EYE_BOTTOM, LEFT_EYE_LEFT, LEFT_EYE_RIGHT)
-            right_ear_val = compute_ear(lm, det_w, det_h, RIGHT_EYE_TOP, RIGHT_EYE_BOTTOM, RIGHT_EYE_LEFT, RIGHT_EYE_RIGHT)
-            avg_ear = (left_ear_val + right_ear_val) / 2
-
-            # Arc terület aránya a képhez
-            face_area_ratio = (face_width * face_height) / (original_width * original_height)
-
-            faces.append({
-                "forehead": forehead,
-                "chin": chin,
-                "left_ear": left_ear,
-                "right_ear": right_ear,
-                "face_center": {"x": face_center_x, "y": face_center_y},
-                "face_width": round(face_width, 1),
-                "face_height": round(face_height, 1),
-                "face_area_ratio": round(face_area_ratio, 4),
-                "bbox": bbox,
-                "ear": round(avg_ear, 3),
-                "eyes_closed": avg_ear < 0.18,
-            })
-
-        # Rendezés: legnagyobb arc (face_area_ratio) elöl
-        faces.sort(key=lambda f: f["face_area_ratio"], reverse=True)
+        with timings.stage("landmarks"):
+            faces = []
+            for face_landmarks in results.multi_face_landmarks:
+                lm = face_landmarks.landmark
+
+                # Kulcs pontok (eredeti képméretben)
+                forehead = {
+                    "x": round(lm[LM_FOREHEAD].x * original_width, 1),
+                    "y": round(lm[LM_FOREHEAD].y * original_height, 1),
+                }
+                chin = {
+                    "x": round(lm[LM_CHIN].x * original_width, 1),
+                    "y": round(lm[LM_CHIN].y * original_height, 1),
+                }
+                left_ear = {
+                    "x": round(lm[LM_LEFT_EAR].x * original_width, 1),
+                    "y": round(lm[LM_LEFT_EAR].y * original_height, 1),
+                }
+                right_ear = {
+                    "x": round(lm[LM_RIGHT_EAR].x * original_width, 1),
+                    "y": round(lm[LM_RIGHT_EAR].y * original_height, 1),
+                }
+
+                # Arc méret (eredeti képméretben)
+                face_height = abs(chin["y"] - forehead["y"])
+                face_width = abs(right_ear["x"] - left_ear["x"])
+
+                # Arc közép
+                face_center_x = round((left_ear["x"] + right_ear["x"]) / 2, 1)
+                face_center_y = round((forehead["y"] + chin["y"]) / 2, 1)
+
+                # Bounding box (összes landmark alapján)
+                xs = [l.x * original_width for l in lm]
+                ys = [l.y * original_height for l in lm]
+                bbox = {
+                    "x": round(min(xs), 1),
+                    "y": round(min(ys), 1),
+                    "width": round(max(xs) - min(xs), 1),
+                    "height": round(max(ys) - min(ys), 1),
+                }
+
+                # EAR (Eye Aspect Ratio) — csukott szem detektálás
+                left_ear_val = compute_ear(lm, det_w, det_h, LEFT_EYE_TOP, LEFT_EYE_BOTTOM, LEFT_EYE_LEFT, LEFT_EYE_RIGHT)
+                right_ear_val = compute_ear(lm, det_w, det_h, RIGHT_EYE_TOP, RIGHT_EYE_BOTTOM, RIGHT_EYE_LEFT, RIGHT_EYE_RIGHT)
+                avg_ear = (left_ear_val + right_ear_val) / 2
+
+                # Arc terület aránya a képhez
+                face_area_ratio = (face_width * face_height) / (original_width * original_height)
+
+                faces.append({
+                    "forehead": forehead,
+                    "chin": chin,
+                    "left_ear": left_ear,
+                    "right_ear": right_ear,
+                    "face_center": {"x": face_center_x, "y": face_center_y},
+                    "face_width": round(face_width, 1),
+                    "face_height": round(face_height, 1),
+                    "face_area_ratio": round(face_area_ratio, 4),
+                    "bbox": bbox,
+                    "ear": round(avg_ear, 3),
+                    "eyes_closed": avg_ear < 0.18,
+                })
+
+            # Rendezés: legnagyobb arc (face_area_ratio) elöl
+            faces.sort(key=lambda f: f["face_area_ratio"], reverse=True)
 
         elapsed = time.time() - start_time
         return {
@@ -241,6 +282,7 @@ def detect_faces(input_path: str) -> dict:
                 "is_overexposed": exposure_mean > 220,
             },
             "processing_time": round(elapsed, 3),
+            "timings": timings.as_dict(),
         }
 
     except Exception as e:
@@ -249,14 +291,141 @@ def detect_faces(input_path: str) -> dict:
             "input": str(input_path),
             "error": str(e),
             "processing_time": round(time.time() - start_time, 3),
+            "timings": timings.as_dict(),
         }
 
 
+def _estimate_item_bytes(input_path: str) -> int:
+    """Csúcs memória becslés a fejlécből (PIL nem dekódol), ismeretlen méretnél csak az alap."""
+    if not _is_allowed_path(input_path):
+        return 0
+    return CROP_ITEM_BASE_BYTES + image_pixels(input_path) * CROP_BYTES_PER_PIXEL
+
+
+def _duplicate_result(first_result: dict, input_path: str) -> dict:
+    """Result of an input whose bytes equal an earlier one's: that item's result, with its own input."""
+    copy = dict(first_result)
+    copy.update(input=input_path, processing_time=0, duplicate_of=first_result.get("input"))
+    return copy
+
+
+def run_batch(inputs: list, workers: int = 1, memory_budget: int = None, on_result=None) -> list:
+    """Detect faces for every input, printing one progress line per finished item.
+
+    Items run on a thread pool (OpenCV and MediaPipe release the GIL) and are
+    admitted in order only while the sum of their estimated peak memory fits
+    memory_budget (estimated from the header just before admission); a lone
+    item is always admitted. Returns results in input order.
+
+    With on_result(index, result, done) every result is handed over in
+    completion order instead and not kept (streaming); returns None.
+
+    Repeated inputs (DuplicateInputs, checked as each item comes up for
+    admission) are detected once: their result is the first occurrence's,
+    reported with "duplicate_of" as soon as that one is finished.
+    """
+    total = len(inputs)
+    results = None
+    if on_result is None:
+        results = [None] * total
+
+        def on_result(index, result, done):
+            results[index] = result
+            # Progress flush per item
+            print(json.dumps({"progress": done, "total": total, "current": result}), flush=True)
+
+    if memory_budget is None:
+        memory_budget = default_budget(fallback_mb=FALLBACK_BUDGET_MB)
+    workers = max(1, min(workers, total))
+    duplicates = DuplicateInputs()
+    # kész első előfordulás indexe -> eredménye időmérések nélkül (arc adatok, elemenként ~1 KB);
+    # a később jövő ismétlődések ebből kapják a sajátjukat
+    firsts = {}
+    waiting = {}  # még futó első előfordulás indexe -> ismétlődéseinek indexei
+
+    used = 0
+    done = 0
+    next_index = 0
+    upcoming = None  # a következő elem becslése (fejléc olvasás csak a beengedés előtt)
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while next_index < total or running:
+            while next_index < total and len(running) < workers:
+                if upcoming is None:
+                    input_path = inputs[next_index]
+                    # Nem engedélyezett útvonalat nem olvasunk: az elem úgyis hibával zárul
+                    first = duplicates.first_of(next_index, input_path) if _is_allowed_path(input_path) else None
+                    if first is not None:
+                        if first in firsts:
+                            done += 1
+                            on_result(next_index, _duplicate_result(firsts[first], input_path), done)
+                        else:
+                            waiting.setdefault(first, []).append(next_index)
+                        next_index += 1
+                        continue
+                    upcoming = _estimate_item_bytes(input_path)
+                if running and used + upcoming > memory_budget:
+                    break
+                running[pool.submit(detect_faces, inputs[next_index])] = (next_index, upcoming)
+                used += upcoming
+                next_index += 1
+                upcoming = None
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index, estimate = running.pop(future)
+                used -= estimate
+                result = future.result()
+                done += 1
+                on_result(index, result, done)
+                firsts[index] = {key: value for key, value in result.items() if key != "timings"}
+                for copy_index in waiting.pop(index, ()):
+                    done += 1
+                    on_result(copy_index, _duplicate_result(firsts[index], inputs[copy_index]), done)
+    return results
+
+
+def stream_batch(inputs: list, workers: int, memory_budget) -> int:
+    """Batch stream módban: elemenként egy NDJSON rekord, a végén egy összesítő rekord."""
+    # A stdout csak a protokollé (MediaPipe / TFLite kiírások stderr-re)
+    out = sys.stdout
+    sys.stdout = sys.stderr
+
+    def emit(record: dict):
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+
+    total = len(inputs)
+    successful = failed = 0
+    summary = TimingsSummary()
+
+    def on_result(index, result, done):
+        nonlocal successful, failed
+        # successful: mint a nem stream módban (van arc); failed: a detektálás hibára futott
+        successful += 1 if result.get("success") and result.get("face_count", 0) > 0 else 0
+        failed += 0 if result.get("success") else 1
+        summary.add(result)
+        emit({"type": "result", "index": index, "progress": done, "total": total, "result": result})
+
+    run_batch(inputs, workers=workers, memory_budget=memory_budget, on_result=on_result)
+    emit({
+        "type": "summary", "success": True, "total": total, "successful": successful,
+        "failed": failed, "timings_summary": summary.as_dict(),
+    })
+    return 0
+
+
 def main():
     parser = argparse.ArgumentParser(description="Auto Portrait Crop - Face Detection")
     parser.add_argument("--check", action="store_true", help="MediaPipe elérhetőség ellenőrzés")
     parser.add_argument("--input", help="Bemeneti kép útvonala")
     parser.add_argument("--batch-json", help="Batch JSON fájl útvonala (tömb [{input: ...}])")
+    parser.add_argument("--batch-dir", help="Batch egy mappa vagy glob minta képeire")
+    parser.add_argument("--workers", type=int, default=1, help="Párhuzamos detektálások száma (alapból 1)")
+    parser.add_argument("--memory-budget-mb", type=int, help="Batch memória keret MB-ban (alapból a RAM 60%%-a)")
+    parser.add_argument("--stream", action="store_true", help="Batch: csak NDJSON eredmény rekordok + összesítő")
 
     args = parser.parse_args()
 
@@ -266,7 +435,13 @@ def main():
         sys.exit(0 if available else 1)
 
     # Batch mód
-    if args.batch_json:
+    if args.batch_dir:
+        try:
+            inputs = BatchSource(args.batch_dir).paths()
+        except ValueError as e:
+            print(json.dumps({"success": False, "error": str(e)}))
+            sys.exit(1)
+    elif args.batch_json:
         batch_path = Path(args.batch_json)
         if not batch_path.exists():
             print(json.dumps({"success": False, "error": "Batch JSON nem található"}))
@@ -276,21 +451,23 @@ def main():
             print(json.dumps({"success": False, "error": f"Túl sok elem (max {MAX_BATCH_SIZE})"}))
             sys.exit(1)
 
-        results = []
-        for item in items:
-            input_path = item.get("input") or item
-            result = detect_faces(str(input_path))
-            results.append(result)
-            # Progress flush per item
-            print(json.dumps({"progress": len(results), "total": len(items), "current": result}), flush=True)
+        inputs = [str(item.get("input") if isinstance(item, dict) else item) for item in items]
+    if args.batch_dir or args.batch_json:
+        budget = args.memory_budget_mb * MB if args.memory_budget_mb else None
+        if args.stream:
+            sys.exit(stream_batch(inputs, args.workers, budget))
+        results = run_batch(inputs, workers=args.workers, memory_budget=budget)
 
         successful = sum(1 for r in results if r.get("success") and r.get("face_count", 0) > 0)
-        print(json.dumps({"success": True, "results": results, "total": len(results), "successful": successful}))
+        print(json.dumps({
+            "success": True, "results": results, "total": len(results), "successful": successful,
+            "timings_summary": summarize_timings(results),
+        }))
         sys.exit(0)
 
     # Egyedi mód
     if not args.input:
-        parser.error("--input szükséges (vagy --check / --batch-json)")
+        parser.error("--input szükséges (vagy --check / --batch-json / --batch-dir)")
 
     result = detect_faces(args.input)
     print(json.dumps(result))
@@ -33,25 +33,8 @@ import struct
 import sys
 from pathlib import Path
 
-from psd_tools import PSDImage
-from psd_tools.api.layers import TypeLayer
-from psd_tools.constants import (
-    BlendMode, ChannelID, Compression, Resource, Tag,
-)
-from psd_tools.psd.descriptor import (
-    DescriptorBlock, RawData, String as DescString,
-)
-from psd_tools.psd.engine_data import (
-    Bool, Dict as EDict, EngineData, Float, Integer,
-    List as EList, Property, String,
-)
-from psd_tools.psd.image_resources import ImageResource
-from psd_tools.psd.layer_and_mask import (
-    ChannelData, ChannelDataList, ChannelInfo, LayerRecord,
-)
-from psd_tools.psd.tagged_blocks import (
-    TaggedBlock, TaggedBlocks, TypeToolObjectSetting,
-)
+# psd_tools (numpy, PIL, attrs) csak a PSD epitesekor toltodik be:
+# argumentum / meret hibak es --help nem fizetik az importot
 
 
 # Magyar ekezet-terkep az ASCII-re
@@ -65,15 +48,19 @@ ACCENT_MAP = {
 
 # EngineData helper fuggvenyek
 def _prop(name):
+    from psd_tools.psd.engine_data import Property
     return Property.frombytes(('/' + name).encode('ascii'))
 
 def _estr(value):
+    from psd_tools.psd.engine_data import String
     return String.frombytes(value.encode('utf-16-be'))
 
 def _efloat(value):
+    from psd_tools.psd.engine_data import Float
     return Float(value)
 
 def _eint(value):
+    from psd_tools.psd.engine_data import Integer
     return Integer(value)
 
 
@@ -98,6 +85,8 @@ def sanitize_name(name: str, person_id: int) -> str:
 
 def _build_engine_data(text, font_name='ArialMT', font_size=25.0):
     """Minimal EngineData feleptese TypeLayer-hez."""
+    from psd_tools.psd.engine_data import Bool, Dict as EDict, EngineData, List as EList
+
     text_cr = text + '\r'
     text_len = len(text_cr)
 
@@ -181,6 +170,12 @@ def create_type_layer(psd, layer_name, display_text,
     - font_name: betutipus (alapertelmezett: ArialMT)
     - font_size: betumeret pt-ben (alapertelmezett: 25)
     """
+    from psd_tools.api.layers import TypeLayer
+    from psd_tools.constants import BlendMode, ChannelID, Compression, Tag
+    from psd_tools.psd.descriptor import DescriptorBlock, RawData, String as DescString
+    from psd_tools.psd.layer_and_mask import ChannelData, ChannelDataList, ChannelInfo, LayerRecord
+    from psd_tools.psd.tagged_blocks import TaggedBlock, TaggedBlocks, TypeToolObjectSetting
+
     ed = _build_engine_data(display_text, font_name, font_size)
     buf = io.BytesIO()
     ed.write(buf)
@@ -322,6 +317,10 @@ def main() -> None:
         print('[DEBUG] Nincs persons-json parameter — ures Names/ mappastruktura')
 
     # --- PSD letrehozasa ---
+    from psd_tools import PSDImage
+    from psd_tools.constants import Resource
+    from psd_tools.psd.image_resources import ImageResource
+
     print(f'[DEBUG] PSD letrehozasa: {width_px}x{height_px}px, {mode}')
     psd = PSDImage.new(mode=mode, size=(width_px, height_px))
 
@@ -0,0 +1,172 @@
+"""Process-wide background registry shared by every item of a batch.
+
+Each background source (preset / RGB tuple, image file, gradient spec) is
+decoded once; cover-resized variants are kept per target size in an LRU
+bounded by BG_CACHE_MB_ENV. Returned images are shared — callers must not
+modify them in place.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Hashable, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+BG_CACHE_MB_ENV = "PORTRAIT_BG_CACHE_MB"
+DEFAULT_BG_CACHE_MB = 256
+
+# Radialis gradiens: tavolsag kvantalas (255 szinlepcsohoz boven eleg) es sorcsik magassag
+RADIAL_LUT_STEPS = 4096
+GRADIENT_STRIP_ROWS = 256
+
+BackgroundSource = Union[str, Path, Tuple[int, int, int], dict]
+
+
+def _color_lut(start_color, end_color, steps: int) -> np.ndarray:
+    """steps x 3 uint8 table: start -> end, same rounding as the float path."""
+    t = np.linspace(0.0, 1.0, steps, dtype=np.float32)[:, np.newaxis]
+    start = np.asarray(start_color, dtype=np.float32)
+    end = np.asarray(end_color, dtype=np.float32)
+    return np.clip(start * (1 - t) + end * t, 0, 255).astype(np.uint8)
+
+
+def create_gradient_image(size, start_color, end_color, direction="vertical"):
+    """Create a gradient image.
+
+    Linear gradients are a 1-D uint8 ramp broadcast over the other axis;
+    radial ones look colors up from the normalized center distance, quantized
+    to RADIAL_LUT_STEPS levels, strip by strip. Memoized per size by the
+    registry (key: start, end, direction).
+    """
+    w, h = size
+    out = np.empty((h, w, 3), dtype=np.uint8)
+
+    if direction == "radial":
+        cx, cy = w / 2, h / 2
+        max_dist = ((cx ** 2) + (cy ** 2)) ** 0.5
+        lut = _color_lut(start_color, end_color, RADIAL_LUT_STEPS)
+        # Normalt, LUT-indexre skalazott negyzetes tavolsag, tengelyenkent kulon
+        scale = (RADIAL_LUT_STEPS - 1) / max_dist
+        dx2 = ((np.arange(w, dtype=np.float32) - cx) * scale) ** 2
+        dy2 = ((np.arange(h, dtype=np.float32) - cy) * scale) ** 2
+        for y in range(0, h, GRADIENT_STRIP_ROWS):
+            d = dy2[y:y + GRADIENT_STRIP_ROWS, np.newaxis] + dx2
+            np.sqrt(d, out=d)
+            d += 0.5
+            idx = np.minimum(d, RADIAL_LUT_STEPS - 1).astype(np.uint16)
+            np.take(lut, idx, axis=0, out=out[y:y + GRADIENT_STRIP_ROWS])
+    elif direction == "horizontal":
+        out[:] = _color_lut(start_color, end_color, w)[np.newaxis, :, :]
+    else:  # vertical
+        out[:] = _color_lut(start_color, end_color, h)[:, np.newaxis, :]
+
+    return Image.fromarray(out, mode="RGB")
+
+
+def resize_cover(bg: Image.Image, target: Tuple[int, int]) -> Image.Image:
+    """Scale to cover target (aspect kept), then center-crop."""
+    tw, th = target
+    bw, bh = bg.size
+    scale = max(tw / bw, th / bh)
+    new_size = (int(bw * scale), int(bh * scale))
+    resized = bg.resize(new_size, Image.Resampling.LANCZOS)
+    left = (resized.width - tw) // 2
+    top = (resized.height - th) // 2
+    return resized.crop((left, top, left + tw, top + th))
+
+
+def _image_bytes(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+class BackgroundRegistry:
+    """Memory-bounded LRU of decoded backgrounds and their per-size variants."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._used = 0
+        # A pipelined batch render szala es a serve mod is hasznalja
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def source_key(source: BackgroundSource) -> Hashable:
+        if isinstance(source, tuple):
+            return ("color", tuple(int(c) for c in source))
+        if isinstance(source, dict):
+            # Gradiens memoizalas kulcsa: (start, end, direction) + a get() meret parametere
+            direction = source.get("direction") if source.get("direction") in ("horizontal", "radial") else "vertical"
+            return ("gradient", tuple(int(c) for c in source["start"]), tuple(int(c) for c in source["end"]), direction)
+        path = Path(source)
+        try:
+            st = path.stat()
+        except OSError:
+            raise FileNotFoundError(f"Háttérkép nem található: {path}")
+        # mtime/meret: a helyben felulirt hatterkep ne a regi valtozatot adja
+        return ("file", os.path.realpath(path), st.st_mtime_ns, st.st_size)
+
+    def get(self, source: BackgroundSource, size: Tuple[int, int]) -> Image.Image:
+        """Return the background for source at exactly size (RGB, shared)."""
+        size = (int(size[0]), int(size[1]))
+        key = self.source_key(source)
+        variant = self._lookup((key, size))
+        if variant is not None:
+            return variant
+
+        if key[0] == "color":
+            variant = Image.new("RGB", size, key[1])
+        elif key[0] == "gradient":
+            variant = create_gradient_image(size, key[1], key[2], key[3])
+        else:
+            decoded = self._lookup((key, None))
+            if decoded is None:
+                logger.info(f"Háttérkép dekódolása: {Path(source).name}")
+                with Image.open(source) as img:
+                    decoded = img.convert("RGB")
+                self._store((key, None), decoded)
+            variant = resize_cover(decoded, size) if decoded.size != size else decoded
+        self._store((key, size), variant)
+        return variant
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._used = 0
+
+    def _lookup(self, key) -> Union[Image.Image, None]:
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+            return image
+
+    def _store(self, key, image: Image.Image) -> None:
+        cost = _image_bytes(image)
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._used -= _image_bytes(old)
+            self._entries[key] = image
+            self._used += cost
+            while self._used > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._used -= _image_bytes(evicted)
+
+
+def _budget_from_env() -> int:
+    try:
+        return max(0, int(os.environ.get(BG_CACHE_MB_ENV, DEFAULT_BG_CACHE_MB))) * 1024 * 1024
+    except ValueError:
+        return DEFAULT_BG_CACHE_MB * 1024 * 1024
+
+
+# Folyamatszintu peldany: minden Compositor ezt hasznalja (batch workerenkent egy)
+registry = BackgroundRegistry(_budget_from_env())
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""Offline benchmark for the portrait pipeline stages.
+
+Generates synthetic portraits (white border, textured background, subject
+mask from the stub segmentation engine) at several sizes and measures wall
+time and peak memory of each post-inference stage. Results are JSON; with a
+baseline file they are compared against it and the exit code is 1 on a
+regression beyond the thresholds. Without one the run is not compared: a
+warning goes to stderr and the JSON has "baseline": null, "compared": false.
+
+Usage:
+  python3 benchmark.py                                   # 2, 12, 24, 50 MP, JSON on stdout
+  python3 benchmark.py --sizes 2,12 --repeat 5 --output bench.json
+  python3 benchmark.py --save-baseline                   # store as benchmark_baseline.json
+  python3 benchmark.py --baseline benchmark_baseline.json --time-threshold 1.25
+
+Peak memory: on Linux the process high-water mark (VmHWM) is reset before
+every run, so PIL and numpy buffers are both counted; elsewhere tracemalloc
+is used, which only sees numpy / Python allocations (memory_method in the
+output tells which one a result came from).
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from birefnet import StubEngine
+from border_crop import detect_and_crop_border
+from compositor import Compositor, darken_background
+from processing import EdgeProcessor
+
+logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+BENCHMARK_VERSION = 1
+DEFAULT_SIZES = (2, 12, 24, 50)
+DEFAULT_REPEAT = 3
+DEFAULT_BASELINE = Path(__file__).parent / "benchmark_baseline.json"
+
+# Regresszio: lassulas / memoria novekedes aranya a baseline-hoz, plusz abszolut turesek a zajra
+TIME_THRESHOLD = 1.25
+MEMORY_THRESHOLD = 1.25
+TIME_SLACK_S = 0.005
+MEMORY_SLACK_MB = 8
+
+# Szintetikus kep: 2:3 allo portre, a rovidebb oldal 3%-a feher keret
+BORDER_RATIO = 0.03
+BACKGROUND_PRESET = "charcoal"
+
+_CLEAR_REFS = Path("/proc/self/clear_refs")
+_STATUS = Path("/proc/self/status")
+
+
+class PeakMemory:
+    """Peak memory of one measured call, in bytes above the level at start."""
+
+    def __init__(self):
+        self.method = "vmhwm" if self._hwm_resettable() else "tracemalloc"
+        self._malloc_trim = None
+        if self.method == "vmhwm":
+            libc = ctypes.util.find_library("c")
+            self._malloc_trim = getattr(ctypes.CDLL(libc), "malloc_trim", None) if libc else None
+
+    @staticmethod
+    def _hwm_resettable() -> bool:
+        try:
+            _CLEAR_REFS.write_text("5")
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def _status_kb(field: str) -> int:
+        for line in _STATUS.read_text().splitlines():
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+        return 0
+
+    def start(self) -> None:
+        if self.method == "vmhwm":
+            # Felszabaditott, de rezidens heap lapok vissza az OS-nek, kulonben
+            # a mert lepes ujrahasznalja oket es a csucs alulbecsult
+            if self._malloc_trim is not None:
+                self._malloc_trim(0)
+            # "5" a clear_refs-be: a VmHWM visszaall a pillanatnyi RSS-re
+            _CLEAR_REFS.write_text("5")
+            self._base = self._status_kb("VmRSS")
+        else:
+            tracemalloc.start()
+
+    def stop(self) -> int:
+        if self.method == "vmhwm":
+            return max(0, self._status_kb("VmHWM") - self._base) * 1024
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+
+def portrait_size(megapixels: float) -> tuple:
+    width = int(round((megapixels * 1e6 * 2 / 3) ** 0.5))
+    return width, int(round(width * 1.5))
+
+
+def synthetic_portrait(megapixels: float, seed: int = 0):
+    """(bordered image, cropped image, alpha mask, RGBA foreground) at the given size."""
+    width, height = portrait_size(megapixels)
+    rng = np.random.default_rng(seed)
+    # Kis zajkep felskalazva: sima atmenetek, de nem uniform (a szurok valos munkat vegeznek)
+    texture = rng.integers(20, 200, (max(2, height // 64), max(2, width // 64), 3), dtype=np.uint8)
+    content = cv2.resize(texture, (width, height), interpolation=cv2.INTER_LINEAR)
+    border = max(8, int(min(width, height) * BORDER_RATIO))
+    content[:border] = 255
+    content[-border:] = 255
+    content[:, :border] = 255
+    content[:, -border:] = 255
+    bordered = Image.fromarray(content, mode="RGB")
+    del content
+
+    cropped = bordered.crop((border, border, width - border, height - border))
+    alpha = StubEngine().predict_alpha(cropped)
+    foreground = cropped.convert("RGBA")
+    foreground.putalpha(alpha)
+    return bordered, cropped, alpha, foreground
+
+
+def _stages(bordered, cropped, alpha, foreground):
+    """name -> zero-argument callable; every call works on fresh inputs (stages do not mutate them)."""
+    compositor = Compositor(BACKGROUND_PRESET)
+
+    def jpeg_save():
+        buf = io.BytesIO()
+        cropped.save(buf, "JPEG", quality=95)
+
+    return {
+        "border_crop": lambda: detect_and_crop_border(bordered),
+        "edge_process": lambda: EdgeProcessor().process(foreground, alpha, original_image=cropped),
+        "composite": lambda: compositor.composite(foreground, alpha),
+        "composite_tiled": lambda: compositor.composite_tiled(cropped, np.asarray(alpha)),
+        "composite_with_shadow": lambda: compositor.composite_with_shadow(foreground, alpha),
+        "darken_background": lambda: darken_background(cropped, alpha),
+        "jpeg_save": jpeg_save,
+    }
+
+
+def run(sizes, repeat: int, only=None) -> dict:
+    memory = PeakMemory()
+    results = []
+    for megapixels in sizes:
+        inputs = synthetic_portrait(megapixels)
+        width, height = inputs[1].size
+        for name, call in _stages(*inputs).items():
+            if only and name not in only:
+                continue
+            times, peaks = [], []
+            for _ in range(repeat):
+                memory.start()
+                start = time.perf_counter()
+                out = call()
+                times.append(time.perf_counter() - start)
+                peaks.append(memory.stop())
+                del out
+            median = statistics.median(times)
+            results.append({
+                "stage": name,
+                "megapixels": megapixels,
+                "width": width,
+                "height": height,
+                "repeat": repeat,
+                "median_s": round(median, 4),
+                "min_s": round(min(times), 4),
+                "mpix_per_s": round(width * height / 1e6 / median, 2) if median > 0 else None,
+                "peak_mb": round(max(peaks) / (1024 * 1024), 1),
+            })
+            logger.warning(f"{name} @ {megapixels} MP: {median:.3f}s, {results[-1]['peak_mb']} MB")
+        del inputs
+
+    return {
+        "version": BENCHMARK_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pillow": Image.__version__,
+            "opencv": cv2.__version__,
+        },
+        "memory_method": memory.method,
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, time_threshold: float, memory_threshold: float) -> list:
+    """Regressions of report against baseline (matched by stage + megapixels)."""
+    reference = {(r["stage"], r["megapixels"]): r for r in baseline.get("results", [])}
+    same_memory_method = baseline.get("memory_method") == report["memory_method"]
+    regressions = []
+    for result in report["results"]:
+        base = reference.get((result["stage"], result["megapixels"]))
+        if base is None:
+            continue
+        if result["median_s"] > base["median_s"] * time_threshold + TIME_SLACK_S:
+            regressions.append({
+                "stage": result["stage"], "megapixels": result["megapixels"], "metric": "median_s",
+                "baseline": base["median_s"], "current": result["median_s"],
+                "ratio": round(result["median_s"] / max(base["median_s"], 1e-9), 2),
+            })
+        if same_memory_method and result["peak_mb"] > base["peak_mb"] * memory_threshold + MEMORY_SLACK_MB:
+            regressions.append({
+                "stage": result["stage"], "megapixels": result["megapixels"], "metric": "peak_mb",
+                "baseline": base["peak_mb"], "current": result["peak_mb"],
+                "ratio": round(result["peak_mb"] / max(base["peak_mb"], 1e-9), 2),
+            })
+    return regressions
+
+
+def _parse_sizes(value: str) -> list:
+    try:
+        sizes = [float(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError("vesszővel elválasztott megapixel értékek kellenek")
+    if not sizes or any(s <= 0 or s > 50 for s in sizes):
+        raise argparse.ArgumentTypeError("a méretek 0 < MP <= 50 tartományban legyenek")
+    return [int(s) if s.is_integer() else s for s in sizes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Portrait pipeline benchmark (offline, stub engine)")
+    parser.add_argument("--sizes", type=_parse_sizes, default=list(DEFAULT_SIZES), help="Megapixels, e.g. 2,12,24,50")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per stage and size (median is reported)")
+    parser.add_argument("--stages", help="Comma-separated subset of stages")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout only)")
+    parser.add_argument("--baseline", help=f"Baseline JSON to compare against (default: {DEFAULT_BASELINE.name} if present)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--time-threshold", type=float, default=TIME_THRESHOLD, help="Allowed slowdown ratio")
+    parser.add_argument("--memory-threshold", type=float, default=MEMORY_THRESHOLD, help="Allowed peak memory ratio")
+    args = parser.parse_args()
+
+    only = {s.strip() for s in args.stages.split(",")} if args.stages else None
+    report = run(args.sizes, max(1, args.repeat), only)
+
+    baseline_path = Path(args.baseline) if args.baseline else DEFAULT_BASELINE
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(report, indent=2) + "\n", "utf-8")
+        logger.warning(f"Baseline mentve: {baseline_path}")
+    elif args.baseline and not baseline_path.exists():
+        parser.error(f"Baseline nem található: {baseline_path}")
+
+    # A CI a "compared" mezobol latja, ha nem volt osszehasonlitas (a 0 kilepesi kod nem "megfelelt")
+    report["baseline"] = None
+    report["compared"] = False
+    if not args.save_baseline:
+        if baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text("utf-8"))
+            report["baseline"] = str(baseline_path)
+            report["compared"] = True
+            report["regressions"] = compare(report, baseline, args.time_threshold, args.memory_threshold)
+        else:
+            print(f"FIGYELEM: nincs baseline ({baseline_path.name}), az eredmeny nincs osszehasonlitva; "
+                  f"mentsd el egy referencia gepen: --save-baseline", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", "utf-8")
+    print(text)
+    sys.exit(1 if report.get("regressions") else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,300 @@
 """Local AI background removal using InSPyReNet (transparent-background).
 
-First run downloads the model (~200MB). Runs on MPS (Apple Silicon),
-CUDA (NVIDIA), or CPU automatically.
+First run downloads the model (~200MB). Inference runs on CPU through a
+pluggable engine: eager PyTorch (default), ONNX Runtime (optionally int8
+quantized) or a deterministic stub for tests and benchmarks.
+
+numpy / PIL / cv2 are imported on first inference only: --check goes
+through probe() and must not pay for them.
 """
 
+from __future__ import annotations
+
+import importlib.util
 import logging
+import os
+import sys
+import time
+import uuid
+from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Union
+from typing import TYPE_CHECKING, Optional, Union
 
-from PIL import Image
+if TYPE_CHECKING:
+    from PIL import Image
 
 logger = logging.getLogger(__name__)
 
-_remover = None
+# Motor valasztas: settings["inference_engine"] > PORTRAIT_ENGINE env > torch
+ENGINE_ENV = "PORTRAIT_ENGINE"
+DEFAULT_ENGINE = "torch"
+
+# transparent_background sulyok helye: $TRANSPARENT_BACKGROUND_FILE_PATH (vagy ~)/.transparent-background
+TB_HOME_ENV = "TRANSPARENT_BACKGROUND_FILE_PATH"
+
+# ONNX motor: modell utvonal es pontossag (fp32 | int8)
+ONNX_MODEL_ENV = "PORTRAIT_ONNX_MODEL"
+ONNX_PRECISION_ENV = "PORTRAIT_ONNX_PRECISION"
+
+_IMAGENET_MEAN = (0.485, 0.456, 0.406)
+_IMAGENET_STD = (0.229, 0.224, 0.225)
+
+_engines = {}
+_num_threads = None
 
 
 class BiRefNetError(Exception):
     pass
 
 
-def _load_remover(mode: str = "base"):
-    global _remover
-    if _remover is not None:
-        return _remover
-
+def _file_identity(path: Path) -> str:
+    """size-mtime of a weights file for cache tags ("missing" if absent); a replaced file changes it."""
     try:
-        from transparent_background import Remover
-    except ImportError:
-        raise BiRefNetError(
-            "transparent-background csomag szükséges.\n"
-            "Telepítés: pip install transparent-background"
-        )
-
-    logger.info(f"InSPyReNet modell betöltése (mode={mode})...")
-    # MPS (Apple Silicon) elakad Python 3.9 + torch 2.8 kombóval,
-    # CPU-n 3-4 mp a betöltés és stabil a feldolgozás
-    _remover = Remover(mode=mode, device="cpu")
-    logger.info("InSPyReNet modell betöltve (CPU)")
-    return _remover
-
-
-def remove_background(image_or_path: Union[str, Path, Image.Image]) -> tuple[Image.Image, Image.Image]:
+        st = path.stat()
+    except OSError:
+        return "missing"
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+class InferenceEngine(ABC):
+    """Segmentation backend: RGB image in, same-size L alpha mask out."""
+
+    name = ""
+
+    @classmethod
+    def cache_tag(cls) -> str:
+        """Identifies the model/weights for mask caching, without loading anything."""
+        return cls.name
+
+    @classmethod
+    def probe(cls) -> dict:
+        """Cheap availability check: packages and weights, without loading the model.
+
+        Raises BiRefNetError if the engine cannot run at all.
+        """
+        return {"weights_cached": True}
+
+    @abstractmethod
+    def predict_alpha(self, image: Image.Image) -> Image.Image:
+        """Alpha mask (mode L, image.size) for an RGB image."""
+
+
+def _require_modules(*names: str) -> None:
+    # find_spec: a csomag megvan-e, importalas (torch: tobb mp) nelkul
+    missing = [n for n in names if importlib.util.find_spec(n) is None]
+    if missing:
+        raise BiRefNetError(f"Hiányzó csomag: {', '.join(missing)}")
+
+
+class TorchEngine(InferenceEngine):
+    """Eager PyTorch InSPyReNet via transparent_background.Remover."""
+
+    name = "torch"
+    mode = "base"
+
+    @classmethod
+    def cache_tag(cls) -> str:
+        # Lecserelt / ujra letoltott sulyfajl mellett a regi maszkok nem ervenyesek
+        return f"{cls.name}-{cls.mode}-{_file_identity(cls.weights_path())}"
+
+    @classmethod
+    def weights_path(cls) -> Path:
+        home = os.environ.get(TB_HOME_ENV) or os.path.expanduser("~")
+        return Path(home) / ".transparent-background" / f"ckpt_{cls.mode}.pth"
+
+    @classmethod
+    def probe(cls) -> dict:
+        _require_modules("torch", "transparent_background")
+        # Hianyzo suly nem hiba: az elso betolteskor letoltodik (~200MB)
+        return {"weights_cached": cls.weights_path().is_file()}
+
+    def __init__(self, mode: str = mode):
+        try:
+            from transparent_background import Remover
+        except ImportError:
+            raise BiRefNetError(
+                "transparent-background csomag szükséges.\n"
+                "Telepítés: pip install transparent-background"
+            )
+
+        if _num_threads:
+            import torch
+            torch.set_num_threads(_num_threads)
+
+        logger.info(f"InSPyReNet modell betöltése (mode={mode})...")
+        # MPS (Apple Silicon) elakad Python 3.9 + torch 2.8 kombóval,
+        # CPU-n 3-4 mp a betöltés és stabil a feldolgozás
+        self.remover = Remover(mode=mode, device="cpu")
+        logger.info("InSPyReNet modell betöltve (CPU)")
+
+    def predict_alpha(self, image: Image.Image) -> Image.Image:
+        result = self.remover.process(image, type='rgba')
+        if result.mode != "RGBA":
+            result = result.convert("RGBA")
+        return result.split()[3]
+
+
+class OnnxEngine(InferenceEngine):
+    """InSPyReNet exported to ONNX, run by ONNX Runtime on CPU.
+
+    The graph takes a 1x3xHxW ImageNet-normalized tensor and returns a 1x1xHxW
+    map in [0, 1]. With precision "int8" a dynamically quantized copy of the
+    weights is created next to the model on first use and reused afterwards.
+    """
+
+    name = "onnx"
+
+    @classmethod
+    def cache_tag(cls) -> str:
+        model = Path(os.environ.get(ONNX_MODEL_ENV) or "")
+        precision = (os.environ.get(ONNX_PRECISION_ENV) or "fp32").lower()
+        # Azonos neven ujraexportalt modell: a meret / mtime valtozik, a regi maszkok nem ervenyesek
+        return f"{cls.name}-{model.name}-{_file_identity(model)}-{precision}"
+
+    @classmethod
+    def probe(cls) -> dict:
+        _require_modules("onnxruntime")
+        model_path = os.environ.get(ONNX_MODEL_ENV)
+        if not model_path or not Path(model_path).exists():
+            raise BiRefNetError(f"ONNX modell nem található ({ONNX_MODEL_ENV}={model_path})")
+        return {"weights_cached": True}
+
+    def __init__(self, model_path: Optional[str] = None, precision: Optional[str] = None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise BiRefNetError(
+                "onnxruntime csomag szükséges az ONNX motorhoz.\n"
+                "Telepítés: pip install onnxruntime"
+            )
+
+        model_path = model_path or os.environ.get(ONNX_MODEL_ENV)
+        if not model_path or not Path(model_path).exists():
+            raise BiRefNetError(f"ONNX modell nem található ({ONNX_MODEL_ENV}={model_path})")
+        precision = (precision or os.environ.get(ONNX_PRECISION_ENV) or "fp32").lower()
+        if precision == "int8":
+            model_path = self._quantized(Path(model_path))
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if _num_threads:
+            options.intra_op_num_threads = _num_threads
+            options.inter_op_num_threads = 1
+
+        logger.info(f"ONNX modell betöltése: {Path(model_path).name} ({precision})")
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        h, w = model_input.shape[2:4]
+        # Dinamikus tengelyek eseten a transparent_background base felbontasa
+        self.input_size = (w if isinstance(w, int) else 1024, h if isinstance(h, int) else 1024)
+
+    @staticmethod
+    def _quantized(model_path: Path) -> Path:
+        target = model_path.with_suffix(".int8.onnx")
+        # A forras modell lecserelese utan a regi kvantalt masolat elavult
+        if not target.exists() or target.stat().st_mtime_ns < model_path.stat().st_mtime_ns:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            logger.info(f"ONNX int8 kvantálás: {target.name}")
+            # Hivasonkent sajat temp fajl + os.replace: parhuzamos workerek nem irjak egymasra,
+            # es egyik sem tolt be felig irt modellt
+            tmp = target.with_name(f".{target.stem}.{uuid.uuid4().hex}.onnx")
+            try:
+                quantize_dynamic(str(model_path), str(tmp), weight_type=QuantType.QInt8)
+                os.replace(tmp, target)
+            finally:
+                tmp.unlink(missing_ok=True)
+        return target
+
+    def predict_alpha(self, image: Image.Image) -> Image.Image:
+        import numpy as np
+        from PIL import Image
+
+        resized = image.convert("RGB").resize(self.input_size, Image.Resampling.BILINEAR)
+        x = np.asarray(resized, dtype=np.float32) / 255.0
+        x -= np.array(_IMAGENET_MEAN, dtype=np.float32)
+        x /= np.array(_IMAGENET_STD, dtype=np.float32)
+        x = np.ascontiguousarray(x.transpose(2, 0, 1)[np.newaxis])
+
+        pred = self.session.run(None, {self.input_name: x})[0].squeeze()
+        pred = np.clip(pred * 255.0, 0, 255).astype(np.uint8)
+        return Image.fromarray(pred, mode="L").resize(image.size, Image.Resampling.BILINEAR)
+
+
+class StubEngine(InferenceEngine):
+    """Deterministic, model-free engine for tests and offline benchmarks.
+
+    Returns a centered head-and-shoulders ellipse with a soft 1% edge ramp,
+    independent of pixel content.
+    """
+
+    name = "stub"
+
+    def predict_alpha(self, image: Image.Image) -> Image.Image:
+        import numpy as np
+        from PIL import Image
+
+        w, h = image.size
+        yy, xx = np.ogrid[0:h, 0:w]
+        dist = np.sqrt(((xx - w * 0.5) / (w * 0.32)) ** 2 + ((yy - h * 0.6) / (h * 0.45)) ** 2, dtype=np.float32)
+        ramp = max(0.01, 2.0 / min(w, h))
+        alpha = np.clip((1.0 - dist) / ramp, 0.0, 1.0) * 255.0
+        return Image.fromarray(alpha.astype(np.uint8), mode="L")
+
+
+ENGINES = {
+    TorchEngine.name: TorchEngine,
+    OnnxEngine.name: OnnxEngine,
+    StubEngine.name: StubEngine,
+}
+
+
+def resolve_engine_name(name: Optional[str] = None) -> str:
+    name = (name or os.environ.get(ENGINE_ENV) or DEFAULT_ENGINE).lower()
+    if name not in ENGINES:
+        raise BiRefNetError(f"Ismeretlen inferencia motor: {name}")
+    return name
+
+
+def set_num_threads(threads: int) -> None:
+    """Bound inference intra-op threads (batch workers share the cores)."""
+    global _num_threads
+    _num_threads = max(1, int(threads))
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(_num_threads)
+
+
+def engine_cache_tag(name: Optional[str] = None) -> str:
+    """Cache tag of the engine get_engine(name) would return."""
+    return ENGINES[resolve_engine_name(name)].cache_tag()
+
+
+def get_engine(name: Optional[str] = None) -> InferenceEngine:
+    """Return the (process-wide cached) engine selected by name / environment."""
+    name = resolve_engine_name(name)
+    if name not in _engines:
+        _engines[name] = ENGINES[name]()
+    return _engines[name]
+
+
+def remove_background(image_or_path: Union[str, Path, Image.Image],
+                      max_side: Optional[int] = None,
+                      engine: Optional[str] = None) -> tuple[Image.Image, Image.Image]:
     """Remove background from image file or PIL Image object.
 
     Args:
         image_or_path: File path (str/Path) or PIL Image object.
+        max_side: If set and the image is larger, segmentation runs on a copy
+            downscaled to this longest side and the alpha is guided-upsampled
+            back to full resolution.
+        engine: Inference engine name (torch / onnx / stub), see get_engine().
 
     Returns: (foreground_rgba, alpha_mask)
     """
+    from PIL import Image
+
+    from processing import guided_upsample
+
     if isinstance(image_or_path, Image.Image):
         image = image_or_path
     else:
@@ -59,20 +306,47 @@ def remove_background(image_or_path: Union[str, Path, Image.Image]) -> tuple[Ima
     if image.mode not in ("RGB", "RGBA"):
         image = image.convert("RGB")
 
-    remover = _load_remover()
-    result = remover.process(image, type='rgba')
+    segmenter = get_engine(engine)
+    if max_side and max(image.size) > max_side:
+        # A modell ugyis ~1024 px-en dolgozik: a teljes felbontasu bemenet csak
+        # memoriat es atmeretezesi idot visz, a reszletet a guided filter hozza vissza
+        scale = max_side / max(image.size)
+        low_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        low = image.resize(low_size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+        alpha_mask = guided_upsample(segmenter.predict_alpha(low), image)
+    else:
+        alpha_mask = segmenter.predict_alpha(image)
+
+    foreground = image.convert("RGBA")
+    foreground.putalpha(alpha_mask)
+    return foreground, alpha_mask
+
 
-    if result.mode != "RGBA":
-        result = result.convert("RGBA")
+def warmup(engine: Optional[str] = None) -> dict:
+    """Load the model and run one dummy inference (hot kernels before the first real job).
 
-    alpha_mask = result.split()[3]
-    return result, alpha_mask
+    Returns load and inference wall times in seconds.
+    """
+    from PIL import Image
+
+    start = time.perf_counter()
+    segmenter = get_engine(engine)
+    loaded = time.perf_counter()
+    dummy = Image.new("RGB", (64, 64), (128, 128, 128))
+    segmenter.predict_alpha(dummy)
+    return {"load_time": round(loaded - start, 3), "inference_time": round(time.perf_counter() - loaded, 3)}
 
 
-def check_available() -> bool:
-    """Check if InSPyReNet model can be loaded."""
+def check_status(engine: Optional[str] = None) -> dict:
+    """Availability of the selected engine without instantiating it (see InferenceEngine.probe)."""
+    name = (engine or os.environ.get(ENGINE_ENV) or DEFAULT_ENGINE).lower()
     try:
-        _load_remover()
-        return True
-    except Exception:
-        return False
+        status = ENGINES[resolve_engine_name(name)].probe()
+    except BiRefNetError as e:
+        return {"available": False, "engine": name, "error": str(e)}
+    return {"available": True, "engine": name, **status}
+
+
+def check_available(engine: Optional[str] = None) -> bool:
+    """Check if the selected inference engine can run (packages + weights, no model load)."""
+    return check_status(engine)["available"]
@@ -2,56 +2,84 @@
 
 import logging
 from pathlib import Path
-from typing import Optional, Tuple, Union
+from typing import Callable, Optional, Tuple, Union
 
 import cv2
 import numpy as np
 from PIL import Image, ImageFilter
 
-from constants import PRESET_BACKGROUNDS
+from backgrounds import BackgroundRegistry, resize_cover, registry as default_registry
+from constants import DEFAULT_SHADOW_BLUR, DEFAULT_SHADOW_OFFSET, PRESET_BACKGROUNDS
 
 logger = logging.getLogger(__name__)
 
 
+# Sorcsikok merete a fixpontos keveresnel: az uint16 atmeneti pufferek cache-ben maradnak
+BLEND_STRIP_ROWS = 32
+
+# Savos (tiled) kompozitalas sormagassaga: a csikonkenti RSS ~ szelesseg * TILE_ROWS * 3 * 3 bajt
+TILE_ROWS = 512
+
+# darken_background: sorcsik magassag es a maszk elmosas (21x21 Gauss) atfedese
+DARKEN_STRIP_ROWS = 128
+DARKEN_BLUR_KSIZE = 21
+DARKEN_BLUR_HALO = DARKEN_BLUR_KSIZE // 2
+
+
+def alpha_blend(fg_rgb: np.ndarray, bg_rgb: np.ndarray, alpha: np.ndarray,
+                out: Optional[np.ndarray] = None) -> np.ndarray:
+    """out = fg * a + bg * (1 - a) on uint8 buffers with 8-bit fixed-point math.
+
+    Works strip by strip in uint16 (fg*a + bg*(255-a) fits), divides by 255
+    with rounding, and broadcasts the single alpha plane over the channels.
+    """
+    if out is None:
+        out = np.empty(bg_rgb.shape, dtype=np.uint8)
+    for y in range(0, out.shape[0], BLEND_STRIP_ROWS):
+        rows = slice(y, y + BLEND_STRIP_ROWS)
+        a = alpha[rows, :, np.newaxis].astype(np.uint16)
+        acc = fg_rgb[rows].astype(np.uint16)
+        acc *= a
+        np.subtract(255, a, out=a)
+        tmp = bg_rgb[rows].astype(np.uint16)
+        tmp *= a
+        acc += tmp
+        # x / 255 kerekitve: (x + 128 + ((x + 128) >> 8)) >> 8, x <= 255 * 255
+        acc += 128
+        acc += acc >> 8
+        acc >>= 8
+        np.copyto(out[rows], acc, casting="unsafe")
+    return out
+
+
 class Compositor:
-    """Composites foreground images onto backgrounds using alpha blending."""
+    """Composites foreground images onto backgrounds using alpha blending.
 
-    def __init__(self, background: Union[str, Path, Image.Image, Tuple[int, int, int]]):
+    Preset, color, file and gradient-spec backgrounds come from the shared
+    BackgroundRegistry, so the cost is paid once per distinct size per process.
+    """
+
+    def __init__(self, background: Union[str, Path, Image.Image, Tuple[int, int, int], dict],
+                 registry: Optional[BackgroundRegistry] = None):
         if isinstance(background, str) and background in PRESET_BACKGROUNDS:
             self.background_source = PRESET_BACKGROUNDS[background]
         else:
             self.background_source = background
+        self._registry = registry if registry is not None else default_registry
         self._bg_cache = {}
 
     def _load_background(self, size: Tuple[int, int]) -> Image.Image:
-        if size in self._bg_cache:
-            return self._bg_cache[size].copy()
+        """Background at size (RGB). Shared with other items: do not modify in place."""
+        if not isinstance(self.background_source, Image.Image):
+            return self._registry.get(self.background_source, size)
 
-        if isinstance(self.background_source, tuple):
-            bg = Image.new("RGB", size, self.background_source)
-        elif isinstance(self.background_source, Image.Image):
-            bg = self._resize_cover(self.background_source, size)
-        else:
-            path = Path(self.background_source)
-            if not path.exists():
-                raise FileNotFoundError(f"Háttérkép nem található: {path}")
-            bg = self._resize_cover(Image.open(path), size)
-
-        if bg.mode != "RGB":
-            bg = bg.convert("RGB")
-        self._bg_cache[size] = bg.copy()
-        return bg
-
-    @staticmethod
-    def _resize_cover(bg: Image.Image, target: Tuple[int, int]) -> Image.Image:
-        tw, th = target
-        bw, bh = bg.size
-        scale = max(tw / bw, th / bh)
-        new_size = (int(bw * scale), int(bh * scale))
-        resized = bg.resize(new_size, Image.Resampling.LANCZOS)
-        left = (resized.width - tw) // 2
-        top = (resized.height - th) // 2
-        return resized.crop((left, top, left + tw, top + th))
+        # Hivo altal atadott PIL kep: nincs stabil kulcsa, csak peldanyszinten cache-elheto
+        if size not in self._bg_cache:
+            bg = resize_cover(self.background_source, size)
+            self._bg_cache[size] = bg if bg.mode == "RGB" else bg.convert("RGB")
+        return self._bg_cache[size]
+
+    _resize_cover = staticmethod(resize_cover)
 
     def composite(self, foreground: Image.Image, alpha_mask: Optional[Image.Image] = None) -> Image.Image:
         if foreground.mode != "RGBA":
@@ -59,15 +87,36 @@ class Compositor:
         if alpha_mask is None:
             alpha_mask = foreground.split()[3]
         bg = self._load_background(foreground.size)
-        fg_arr = np.array(foreground).astype(np.float32)
-        bg_arr = np.array(bg).astype(np.float32)
-        alpha_arr = np.array(alpha_mask).astype(np.float32) / 255.0
-        alpha_3ch = np.stack([alpha_arr] * 3, axis=2)
-        result = fg_arr[:, :, :3] * alpha_3ch + bg_arr * (1 - alpha_3ch)
-        return Image.fromarray(np.clip(result, 0, 255).astype(np.uint8), mode="RGB")
+        fg_arr = np.asarray(foreground)
+        out = np.empty((foreground.height, foreground.width, 3), dtype=np.uint8)
+        alpha_blend(fg_arr[:, :, :3], np.asarray(bg), np.asarray(alpha_mask), out=out)
+        return Image.fromarray(out, mode="RGB")
+
+    def composite_tiled(self, original: Image.Image, alpha: np.ndarray, tile_rows: int = TILE_ROWS,
+                        fg_filter: Optional[Callable[[np.ndarray, int, int], None]] = None) -> Image.Image:
+        """composite() without a full-resolution foreground: streamed in row strips.
+
+        The foreground color of each strip is cropped from original, passed
+        to fg_filter(rgb, y0, y1) for in-place color work (decontamination),
+        blended and pasted into the result. Output equals composite() of the
+        equivalently processed RGBA foreground.
+        """
+        w, h = original.size
+        bg = self._load_background((w, h))
+        result = Image.new("RGB", (w, h))
+        for y0 in range(0, h, tile_rows):
+            y1 = min(h, y0 + tile_rows)
+            box = (0, y0, w, y1)
+            strip = original.crop(box)
+            fg = np.array(strip if strip.mode == "RGB" else strip.convert("RGB"))
+            if fg_filter is not None:
+                fg_filter(fg, y0, y1)
+            alpha_blend(fg, np.asarray(bg.crop(box)), alpha[y0:y1], out=fg)
+            result.paste(Image.fromarray(fg, mode="RGB"), (0, y0))
+        return result
 
     def composite_with_shadow(self, foreground: Image.Image, alpha_mask: Optional[Image.Image] = None,
-                               shadow_offset=(5, 5), shadow_blur=10, shadow_opacity=0.3) -> Image.Image:
+                               shadow_offset=DEFAULT_SHADOW_OFFSET, shadow_blur=DEFAULT_SHADOW_BLUR, shadow_opacity=0.3) -> Image.Image:
         if foreground.mode != "RGBA":
             foreground = foreground.convert("RGBA")
         if alpha_mask is None:
@@ -90,14 +139,31 @@ class Compositor:
 
 def darken_background(original: Image.Image, alpha_mask: Image.Image,
                        darken_amount=0.6, target_brightness=40) -> Image.Image:
-    img_arr = np.array(original.convert("RGB")).astype(np.float32)
-    mask_arr = np.array(alpha_mask).astype(np.float32) / 255.0
-    mask_smooth = cv2.GaussianBlur(mask_arr, (21, 21), 0)
-    bg_mask = 1.0 - mask_smooth
-    gray = np.mean(img_arr, axis=2)
-    darkening = np.clip(target_brightness / (gray + 1), 0.1, 1.0)
-    for i in range(3):
-        darkened = img_arr[:, :, i] * darkening
-        strength = bg_mask * darken_amount
-        img_arr[:, :, i] = img_arr[:, :, i] * (1 - strength) + darkened * strength
-    return Image.fromarray(np.clip(img_arr, 0, 255).astype(np.uint8), mode="RGB")
+    """Darken the background (1 - blurred alpha) toward target_brightness.
+
+    Fused and strip-wise: each DARKEN_STRIP_ROWS band is blurred with a
+    DARKEN_BLUR_HALO row overlap and written straight to the uint8 output, so
+    the float temporaries are bounded by width, not by image height.
+    """
+    if original.mode != "RGB":
+        original = original.convert("RGB")
+    w, h = original.size
+    out = np.empty((h, w, 3), dtype=np.uint8)
+    for y0 in range(0, h, DARKEN_STRIP_ROWS):
+        y1 = min(h, y0 + DARKEN_STRIP_ROWS)
+        # Atfedes a 21x21 Gauss-hoz; a kep szelen a cv2 tukrozes ugyanaz, mint egyben
+        h0, h1 = max(0, y0 - DARKEN_BLUR_HALO), min(h, y1 + DARKEN_BLUR_HALO)
+        # PIL crop: csak a sav masolodik tombbe, nem a teljes kep
+        mask = np.asarray(alpha_mask.crop((0, h0, w, h1)), dtype=np.float32) / 255.0
+        mask = cv2.GaussianBlur(mask, (DARKEN_BLUR_KSIZE, DARKEN_BLUR_KSIZE), 0)[y0 - h0:y1 - h0]
+        strength = (1.0 - mask) * darken_amount
+
+        strip = np.asarray(original.crop((0, y0, w, y1)), dtype=np.float32)
+        gray = np.mean(strip, axis=2)
+        darkening = np.clip(target_brightness / (gray + 1), 0.1, 1.0)
+        # c * (1 - s) + c * d * s  ==  c * (1 - s * (1 - d)): egy szorzas csatornankent
+        factor = 1.0 - strength * (1.0 - darkening)
+        strip *= factor[:, :, np.newaxis]
+        np.clip(strip, 0, 255, out=strip)
+        np.copyto(out[y0:y1], strip, casting="unsafe")
+    return Image.fromarray(out, mode="RGB")
@@ -2,6 +2,8 @@
 
 DEFAULT_FEATHER_RADIUS = 3
 DEFAULT_DECONTAMINATE_STRENGTH = 0.8
+DEFAULT_SHADOW_OFFSET = (5, 5)
+DEFAULT_SHADOW_BLUR = 10
 
 PRESET_BACKGROUNDS = {
     "black": (0, 0, 0),             # #000000
@@ -14,3 +16,6 @@ PRESET_BACKGROUNDS = {
 }
 
 DEFAULT_PRESET = "charcoal"
+
+# Elonezet: proxy kep leghosszabb oldala
+PREVIEW_SIZE = 800
@@ -0,0 +1,137 @@
+"""Per-output-directory batch manifest for resumable portrait batches.
+
+Every successfully written output gets a line in MANIFEST_NAME next to it:
+input content hash, settings hash, output path and output hash (plus the
+size / mtime of both files). A later batch skips an item when its output is
+still the one recorded for the same input bytes and the same settings, so a
+re-run after a crash or a small roster change only processes what changed.
+
+The file is append-only JSON lines (last entry per output wins) and is
+compacted when the batch closes. Hashes are only recomputed when a file's
+size or mtime differs from the recorded one.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+from sidecar_common.duplicates import file_hash
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".portrait-manifest.jsonl"
+
+# Emeld, ha a pipeline kimenete azonos beallitasokkal is valtozik (regi kimenetek ujrageneralodnak)
+MANIFEST_VERSION = 1
+
+
+def settings_hash(settings: dict, engine_tag: str) -> str:
+    """Hash of everything besides the input that determines the output bytes."""
+    raw = json.dumps({"v": MANIFEST_VERSION, "engine": engine_tag, "settings": settings}, sort_keys=True, default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=20).hexdigest()
+
+
+def _file_state(path: Path, recorded_hash: Optional[str] = None, recorded: Optional[dict] = None,
+                prefix: str = "") -> Optional[dict]:
+    """{prefix+"hash", prefix+"size", prefix+"mtime_ns"} of path; the hash is reused if size/mtime match."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    if (recorded_hash and recorded and recorded.get(prefix + "size") == st.st_size
+            and recorded.get(prefix + "mtime_ns") == st.st_mtime_ns):
+        digest = recorded_hash
+    else:
+        try:
+            digest = file_hash(path)
+        except OSError:
+            return None
+    return {prefix + "hash": digest, prefix + "size": st.st_size, prefix + "mtime_ns": st.st_mtime_ns}
+
+
+class BatchManifest:
+    """Manifests of every output directory touched by one batch."""
+
+    def __init__(self, settings_digest: str):
+        self.settings_digest = settings_digest
+        self._entries = {}   # kimeneti mappa -> {fajlnev: bejegyzes}
+        self._lines = {}     # kimeneti mappa -> sorok szama a fajlban (tomorites)
+        self._files = {}
+
+    def _load(self, directory: Path) -> dict:
+        if directory in self._entries:
+            return self._entries[directory]
+        entries, lines = {}, 0
+        try:
+            with open(directory / MANIFEST_NAME, encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                        entries[entry["output"]] = entry
+                    except (ValueError, KeyError, TypeError):
+                        continue  # felbe szakadt utolso sor (crash)
+        except OSError:
+            pass
+        self._entries[directory] = entries
+        self._lines[directory] = lines
+        return entries
+
+    def lookup(self, item: dict) -> Optional[dict]:
+        """Skipped-item result if item's output is valid for its input and the settings, else None."""
+        output = Path(item["output"])
+        entry = self._load(output.parent).get(output.name)
+        if not entry or entry.get("settings_hash") != self.settings_digest:
+            return None
+        if entry.get("input") != os.path.realpath(item["input"]):
+            return None
+        current_output = _file_state(output, entry.get("output_hash"), entry, "output_")
+        if current_output is None or current_output["output_hash"] != entry.get("output_hash"):
+            return None
+        current_input = _file_state(Path(item["input"]), entry.get("input_hash"), entry, "input_")
+        if current_input is None or current_input["input_hash"] != entry.get("input_hash"):
+            return None
+        return {"success": True, "input": item["input"], "output": str(output), "processing_time": 0, "skipped": True}
+
+    def record(self, item: dict) -> None:
+        """Append the entry of a freshly written output (best effort: I/O errors only warn)."""
+        output = Path(item["output"])
+        input_state = _file_state(Path(item["input"]), prefix="input_")
+        output_state = _file_state(output, prefix="output_")
+        if input_state is None or output_state is None:
+            return
+        entry = {
+            "output": output.name, "input": os.path.realpath(item["input"]),
+            "settings_hash": self.settings_digest, **input_state, **output_state,
+        }
+        directory = output.parent
+        self._load(directory)[output.name] = entry
+        try:
+            f = self._files.get(directory)
+            if f is None:
+                f = self._files[directory] = open(directory / MANIFEST_NAME, "a", encoding="utf-8")
+            f.write(json.dumps(entry) + "\n")
+            # Soronkent flush: a kovetkezo futas a crash elotti allapotot latja
+            f.flush()
+            self._lines[directory] += 1
+        except OSError as e:
+            logger.warning(f"Manifest írás sikertelen ({directory}): {e}")
+
+    def close(self) -> None:
+        """Close the files and compact manifests that have superseded lines."""
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+        for directory, entries in self._entries.items():
+            if self._lines.get(directory, 0) <= len(entries):
+                continue
+            path = directory / MANIFEST_NAME
+            tmp = path.with_suffix(".tmp")
+            try:
+                tmp.write_text("".join(json.dumps(e) + "\n" for e in entries.values()), "utf-8")
+                os.replace(tmp, path)
+            except OSError as e:
+                logger.warning(f"Manifest tömörítés sikertelen ({directory}): {e}")
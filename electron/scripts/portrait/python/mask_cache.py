@@ -0,0 +1,114 @@
+"""Content-addressed on-disk cache for raw segmentation alpha masks.
+
+Settings-only re-runs (feather, smoothing, background, shadow) produce the
+same mask, so the expensive inference is skipped when the key matches.
+Entries are lossless PNGs; the directory is kept under a size budget with
+LRU eviction (file mtime is touched on every hit).
+"""
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_ENV = "PORTRAIT_MASK_CACHE_DIR"
+CACHE_MB_ENV = "PORTRAIT_MASK_CACHE_MB"
+DEFAULT_CACHE_MB = 512
+
+# Emeld, ha a border crop / sRGB / maszk eloallitas logikaja valtozik
+KEY_VERSION = 1
+
+
+def cache_dir() -> Path:
+    return Path(os.environ.get(CACHE_DIR_ENV) or Path.home() / ".cache" / "photostack" / "portrait-masks")
+
+
+def cache_budget() -> int:
+    """Cache size limit in bytes (0 = cache disabled)."""
+    try:
+        return max(0, int(os.environ.get(CACHE_MB_ENV, DEFAULT_CACHE_MB))) * 1024 * 1024
+    except ValueError:
+        return DEFAULT_CACHE_MB * 1024 * 1024
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def source_key(digest: str, image_size: tuple, srgb_converted: bool) -> str:
+    """Input-side part of the key: file bytes + border-crop result + sRGB conversion."""
+    return f"v{KEY_VERSION}|{digest}|{image_size[0]}x{image_size[1]}|{'srgb' if srgb_converted else 'native'}"
+
+
+def make_key(source: str, engine_tag: str, max_side: Optional[int]) -> str:
+    """Full key: source_key() + model/engine + inference resolution cap."""
+    raw = f"{source}|{engine_tag}|cap{max_side or 0}"
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=20).hexdigest()
+
+
+def _entry_path(key: str) -> Path:
+    return cache_dir() / f"{key}.png"
+
+
+def get(key: str, size: tuple) -> Optional[Image.Image]:
+    """Return the cached alpha (mode L) for key, or None."""
+    if not cache_budget():
+        return None
+    path = _entry_path(key)
+    try:
+        with Image.open(path) as cached:
+            cached.load()
+            alpha = cached if cached.mode == "L" else cached.convert("L")
+        if alpha.size != tuple(size):
+            return None
+        os.utime(path)
+        return alpha
+    except (OSError, ValueError):
+        return None
+
+
+def put(key: str, alpha: Image.Image) -> None:
+    """Store an alpha mask, then evict least recently used entries over budget."""
+    budget = cache_budget()
+    if not budget:
+        return
+    path = _entry_path(key)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Atomikus csere: parhuzamos workerek ne lassanak felig irt fajlt
+        tmp = path.with_name(f".{key}.{os.getpid()}.tmp")
+        alpha.save(tmp, "PNG", compress_level=1)
+        os.replace(tmp, path)
+        _evict(budget)
+    except OSError as e:
+        logger.warning(f"Maszk cache írás sikertelen: {e}")
+
+
+def _evict(budget: int) -> None:
+    entries = []
+    total = 0
+    for entry in os.scandir(cache_dir()):
+        if not entry.name.endswith(".png"):
+            continue
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, entry.path))
+        total += st.st_size
+    if total <= budget:
+        return
+    entries.sort()
+    for _, size, path in entries:
+        if total <= budget:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
@@ -0,0 +1,762 @@
+"""Portrait pipeline: decode, inference, edges, composite, encode.
+
+Single images, previews and batches (staged in-process pipeline or a
+process pool). Imported by the process_portrait.py CLI only on the paths
+that process images, so --check / --help stay free of numpy, PIL and cv2.
+"""
+
+import hashlib
+import io
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageCms
+from sidecar_common.budget import MB, MemoryBudget, fit_workers
+from sidecar_common.duplicates import DuplicateInputs
+from sidecar_common.timings import StageTimings, stage as timed_stage
+
+import mask_cache
+import scheduler
+from manifest import BatchManifest, settings_hash as manifest_settings_hash
+from birefnet import (
+    remove_background, engine_cache_tag, resolve_engine_name, set_num_threads,
+    BiRefNetError, DEFAULT_ENGINE,
+)
+from border_crop import detect_and_crop_border
+from compositor import TILE_ROWS, Compositor, darken_background
+from constants import DEFAULT_PRESET, DEFAULT_SHADOW_BLUR, DEFAULT_SHADOW_OFFSET, PRESET_BACKGROUNDS, PREVIEW_SIZE
+from processing import EdgeProcessor, shrink_mask, feather_edges, smooth_edges
+
+logger = logging.getLogger(__name__)
+
+# Kepmeretkorlat: max 50 megapixel (vedelem image bomb ellen)
+Image.MAX_IMAGE_PIXELS = 50_000_000
+
+# Elonezet: memoriaban tartott proxy kepek szama
+PREVIEW_CACHE_ENTRIES = 8
+
+# Ennyi kulonbozo bemeneti ICC profil transzformacioja marad memoriaban
+ICC_CACHE_ENTRIES = 4
+
+# Pipeline sorok merete: ennyi dekodolt / inferalt kep varakozhat stage-enkent
+PIPELINE_DEPTH = 2
+
+# Batch: workerenkent ennyi elem fejlecebol meretezi a worker szamot
+SCHEDULER_LOOKAHEAD = 4
+
+# Engedelyezett utvonal prefixek (defense-in-depth)
+_ALLOWED_PREFIXES = [
+    os.path.realpath(os.path.expanduser("~")),
+    os.path.realpath(os.environ.get("TMPDIR", "/tmp")),
+]
+
+
+def _is_allowed_path(filepath: str) -> bool:
+    """Ellenorzi, hogy az utvonal az engedelyezett konyvtarakon belul van-e."""
+    try:
+        real = os.path.realpath(filepath)
+        return any(real.startswith(prefix + os.sep) for prefix in _ALLOWED_PREFIXES)
+    except (ValueError, OSError):
+        return False
+
+
+_srgb_profile = ImageCms.createProfile("sRGB")
+# ICC konverziok (profil bajt hash + kep mod szerint); None = mar sRGB
+_icc_conversions = OrderedDict()
+
+
+class _SrgbConversion:
+    """Built source-profile -> sRGB transform, reused for every image with that profile."""
+
+    def __init__(self, transform, srgb_bytes: bytes):
+        self.transform = transform
+        self.srgb_bytes = srgb_bytes
+
+    def apply(self, image: Image.Image) -> Image.Image:
+        if image.mode != "RGB":
+            return ImageCms.applyTransform(image, self.transform)
+        ImageCms.applyTransform(image, self.transform, inPlace=True)
+        return image
+
+
+def _srgb_conversion(icc_profile: bytes, mode: str):
+    """Cached _SrgbConversion for a source profile + image mode, None if already sRGB.
+
+    Keyed by a hash of the profile bytes, so the profile is parsed and the
+    transform built once per distinct profile, not once per image.
+    """
+    key = (hashlib.blake2b(icc_profile, digest_size=16).digest(), mode)
+    if key in _icc_conversions:
+        _icc_conversions.move_to_end(key)
+        return _icc_conversions[key]
+
+    conversion = None
+    try:
+        src_profile = ImageCms.ImageCmsProfile(io.BytesIO(icc_profile))
+        src_name = ImageCms.getProfileDescription(src_profile)
+        if "srgb" not in src_name.lower():
+            logger.info(f"ICC transzformáció építése: {src_name.strip()} -> sRGB ({mode})")
+            dst_profile = ImageCms.ImageCmsProfile(_srgb_profile)
+            transform = ImageCms.buildTransform(src_profile, dst_profile, mode, "RGB")
+            conversion = _SrgbConversion(transform, dst_profile.tobytes())
+    except Exception as e:
+        # A hibas profil is cache-be kerul: a kep valtozatlan marad, a hiba egyszer logolodik
+        logger.warning(f"ICC konverzió sikertelen: {e}")
+
+    _icc_conversions[key] = conversion
+    while len(_icc_conversions) > ICC_CACHE_ENTRIES:
+        _icc_conversions.popitem(last=False)
+    return conversion
+
+
+def ensure_srgb(image: Image.Image, icc_profile: bytes = None):
+    """Convert image to sRGB if it has a different color profile.
+
+    RGB images are converted in place; the caller must own image.
+    """
+    if not icc_profile:
+        return image, icc_profile
+    try:
+        conversion = _srgb_conversion(icc_profile, image.mode)
+        if conversion is None:
+            return image, icc_profile
+        return conversion.apply(image), conversion.srgb_bytes
+    except Exception as e:
+        logger.warning(f"ICC konverzió sikertelen: {e}")
+        return image, icc_profile
+
+
+def resolve_background(settings: dict):
+    """Resolve background from settings to a compositor-compatible value."""
+    bg_type = settings.get("background_type", "preset")
+
+    if bg_type == "preset":
+        preset = settings.get("preset_name", DEFAULT_PRESET)
+        if preset in PRESET_BACKGROUNDS:
+            return PRESET_BACKGROUNDS[preset]
+        return PRESET_BACKGROUNDS[DEFAULT_PRESET]
+
+    elif bg_type == "color":
+        r = int(settings.get("color_r", 0) or 0)
+        g = int(settings.get("color_g", 0) or 0)
+        b = int(settings.get("color_b", 0) or 0)
+        return (max(0, min(255, r)), max(0, min(255, g)), max(0, min(255, b)))
+
+    elif bg_type == "image":
+        bg_path = settings.get("background_image_path")
+        if bg_path and _is_allowed_path(bg_path) and Path(bg_path).exists():
+            return Path(bg_path)
+        logger.warning("Háttérkép nem található vagy nem engedélyezett, preset használata")
+        return PRESET_BACKGROUNDS[DEFAULT_PRESET]
+
+    elif bg_type == "gradient":
+        sr = int(settings.get("gradient_start_r", 0) or 0)
+        sg = int(settings.get("gradient_start_g", 0) or 0)
+        sb = int(settings.get("gradient_start_b", 0) or 0)
+        er = int(settings.get("gradient_end_r", 0) or 0)
+        eg = int(settings.get("gradient_end_g", 0) or 0)
+        eb = int(settings.get("gradient_end_b", 0) or 0)
+        direction = settings.get("gradient_direction", "vertical")
+        return {"type": "gradient", "start": (sr, sg, sb), "end": (er, eg, eb), "direction": direction}
+
+    return PRESET_BACKGROUNDS[DEFAULT_PRESET]
+
+
+def _check_paths(input_path: str, output_path: str):
+    """Path validacio (defense-in-depth). Hiba eseten kesz result dict, egyebkent None."""
+    if not _is_allowed_path(input_path):
+        return {"success": False, "input": input_path, "error": "Nem engedélyezett bemeneti útvonal", "processing_time": 0}
+    if not _is_allowed_path(output_path):
+        return {"success": False, "input": input_path, "error": "Nem engedélyezett kimeneti útvonal", "processing_time": 0}
+    return None
+
+
+def _error_result(input_path, error: Exception, start_time: float, timings: Optional[StageTimings] = None) -> dict:
+    message = f"AI hiba: {error}" if isinstance(error, BiRefNetError) else str(error)
+    result = {"success": False, "input": str(input_path), "error": message, "processing_time": round(time.time() - start_time, 2)}
+    if timings is not None:
+        # A hiba elotti stage-ek idejei is megmaradnak
+        result["timings"] = timings.as_dict()
+    return result
+
+
+def load_input(input_path: Path, timings: Optional[StageTimings] = None):
+    """Decode stage: open, border crop, sRGB.
+
+    Returns (image, icc_profile, mask_source) where mask_source is the
+    input-side mask cache key (content hash + crop + sRGB conversion).
+    """
+    with timed_stage(timings, "decode"):
+        data = input_path.read_bytes()
+        original = Image.open(io.BytesIO(data))
+        original.load()
+    source_icc = original.info.get("icc_profile")
+    with timed_stage(timings, "border_crop"):
+        original = detect_and_crop_border(original)
+    with timed_stage(timings, "srgb"):
+        original, icc_profile = ensure_srgb(original, source_icc)
+    source = mask_cache.source_key(mask_cache.content_hash(data), original.size, icc_profile != source_icc)
+    return original, icc_profile, source
+
+
+def infer(original: Image.Image, name: str, settings: dict, mask_source: str = None,
+          timings: Optional[StageTimings] = None):
+    """Inference stage: returns (foreground_rgba, alpha_mask).
+
+    With a mask_source the raw alpha is looked up in / stored to the mask
+    cache, so settings-only re-runs skip the model entirely.
+    """
+    with timed_stage(timings, "inference"):
+        return _infer(original, name, settings, mask_source)
+
+
+def _infer(original: Image.Image, name: str, settings: dict, mask_source: str = None):
+    max_side = int(settings.get("inference_max_side", 0) or 0)
+    engine = settings.get("inference_engine")
+
+    key = None
+    if mask_source:
+        key = mask_cache.make_key(mask_source, engine_cache_tag(engine), max_side)
+        alpha_mask = mask_cache.get(key, original.size)
+        if alpha_mask is not None:
+            logger.info(f"[1/3] Maszk cache találat: {name}")
+            foreground = original.convert("RGBA")
+            foreground.putalpha(alpha_mask)
+            return foreground, alpha_mask
+
+    # Croppolt kepet adjuk at, nem az eredeti fajlt
+    logger.info(f"[1/3] Háttér eltávolítás: {name}")
+    foreground, alpha_mask = remove_background(original, max_side=max_side or None, engine=engine)
+    if foreground.mode != "RGBA":
+        foreground = foreground.convert("RGBA")
+    if key:
+        mask_cache.put(key, alpha_mask)
+    return foreground, alpha_mask
+
+
+def _scale_px(value, scale: float) -> int:
+    # Nem nulla parameter nem tunhet el a proxy kepen
+    value = int(value or 0)
+    return max(1, int(round(value * scale))) if value > 0 else 0
+
+
+def scale_settings(settings: dict, scale: float) -> dict:
+    """Pixel-based edge parameters rescaled for an image `scale` times the full size."""
+    if scale == 1.0:
+        return settings
+    scaled = dict(settings)
+    for key, default in (("edge_inset", 2), ("feather_radius", 3), ("edge_smoothing", 2)):
+        scaled[key] = _scale_px(settings.get(key, default), scale)
+    # A haj zaj pixelenkenti: kisebb kepen a lekicsinyites atlagolna, ezert arányosan gyengebb
+    scaled["hair_refinement_strength"] = settings.get("hair_refinement_strength", 0.4) * min(1.0, scale)
+    return scaled
+
+
+def render(original: Image.Image, foreground: Image.Image, alpha_mask: Image.Image, settings: dict,
+           scale: float = 1.0, timings: Optional[StageTimings] = None) -> Image.Image:
+    """Post-inference stage: edge processing and compositing (or darkening).
+
+    scale < 1 means the inputs are a downscaled proxy of the final image;
+    pixel-sized parameters are scaled so the result matches the full render.
+    Timed as "edges" and "composite" (savos modban a dekontaminacio a composite resze).
+    """
+    settings = scale_settings(settings, scale)
+    mode = settings.get("mode", "replace")
+
+    if mode == "darken":
+        # Darken mode: light edge processing then darken
+        logger.info("[2/3] Háttér sötétítés")
+        with timed_stage(timings, "edges"):
+            processed_alpha = alpha_mask
+            if settings.get("edge_inset", 0) > 0:
+                processed_alpha = shrink_mask(processed_alpha, settings["edge_inset"])
+            if settings.get("edge_smoothing", 0) > 0:
+                processed_alpha = smooth_edges(processed_alpha, settings["edge_smoothing"])
+            if settings.get("feather_radius", 0) > 0:
+                processed_alpha = feather_edges(processed_alpha, settings["feather_radius"])
+
+        with timed_stage(timings, "composite"):
+            return darken_background(
+                original, processed_alpha,
+                darken_amount=settings.get("darken_amount", 0.7),
+                target_brightness=settings.get("target_brightness", 35),
+            )
+
+    # Replace mode: full processing
+    logger.info("[2/3] Él feldolgozás")
+    edge_processor = EdgeProcessor(
+        edge_inset=settings.get("edge_inset", 2),
+        feather_radius=settings.get("feather_radius", 3),
+        decontaminate=settings.get("decontaminate", True),
+        decontaminate_strength=settings.get("decontaminate_strength", 0.8),
+        hair_refinement=settings.get("hair_refinement", True),
+        hair_refinement_strength=settings.get("hair_refinement_strength", 0.4),
+        edge_smoothing=settings.get("edge_smoothing", 2),
+    )
+    # A hatter (fajl / gradiens) a folyamatszintu registry-bol jon, meretenkent egyszer kesz
+    compositor = Compositor(resolve_background(settings))
+
+    tile_rows = int(settings.get("tile_rows", TILE_ROWS) or 0)
+    if tile_rows > 0 and not settings.get("add_shadow", False):
+        # Savos mod: csak az alpha sik teljes meretu, a szin oldal (dekontaminacio +
+        # keveres) csikonkent megy az eredetibol, teljes RGBA eloter nelkul
+        with timed_stage(timings, "edges"):
+            alpha = np.array(alpha_mask, dtype=np.uint8)
+            decontaminate_alpha, bg_color = edge_processor.process_mask(alpha, original_image=original)
+
+        def decontaminate_strip(rgb, y0, y1):
+            edge_processor.decontaminate_rows(rgb, decontaminate_alpha[y0:y1], bg_color)
+        fg_filter = decontaminate_strip if decontaminate_alpha is not None else None
+
+        logger.info("[3/3] Kompozitálás (savos)")
+        with timed_stage(timings, "composite"):
+            return compositor.composite_tiled(original, alpha, tile_rows=tile_rows, fg_filter=fg_filter)
+
+    with timed_stage(timings, "edges"):
+        processed_fg, processed_alpha = edge_processor.process(foreground, alpha_mask, original_image=original)
+
+    logger.info("[3/3] Kompozitálás")
+    with timed_stage(timings, "composite"):
+        if settings.get("add_shadow", False):
+            return compositor.composite_with_shadow(
+                processed_fg, processed_alpha,
+                shadow_offset=tuple(_scale_px(v, scale) for v in DEFAULT_SHADOW_OFFSET),
+                shadow_blur=_scale_px(DEFAULT_SHADOW_BLUR, scale),
+                shadow_opacity=settings.get("shadow_opacity", 0.3),
+            )
+        return compositor.composite(processed_fg, processed_alpha)
+
+
+def save_output(result: Image.Image, output_path: Path, icc_profile, settings: dict,
+                timings: Optional[StageTimings] = None):
+    """Encode stage: JPEG save with the (converted) ICC profile."""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    save_kwargs = {}
+    if icc_profile:
+        save_kwargs["icc_profile"] = icc_profile
+
+    quality = max(50, min(100, settings.get("output_quality", 95)))
+    with timed_stage(timings, "encode"):
+        result.save(output_path, "JPEG", quality=quality, **save_kwargs)
+
+
+def _ok_result(input_path: Path, output_path: Path, start_time: float,
+               timings: Optional[StageTimings] = None) -> dict:
+    elapsed = time.time() - start_time
+    logger.info(f"Kész: {input_path.name} ({elapsed:.2f}s)")
+    result = {
+        "success": True,
+        "input": str(input_path),
+        "output": str(output_path),
+        "processing_time": round(elapsed, 2),
+    }
+    if timings is not None:
+        result["timings"] = timings.as_dict()
+    return result
+
+
+def process_single(input_path: str, output_path: str, settings: dict) -> dict:
+    """Process a single portrait image."""
+    start_time = time.time()
+
+    rejected = _check_paths(input_path, output_path)
+    if rejected:
+        return rejected
+
+    input_path = Path(input_path)
+    output_path = Path(output_path)
+
+    timings = StageTimings()
+    try:
+        original, icc_profile, mask_source = load_input(input_path, timings)
+        foreground, alpha_mask = infer(original, input_path.name, settings, mask_source, timings)
+        result = render(original, foreground, alpha_mask, settings, timings=timings)
+        save_output(result, output_path, icc_profile, settings, timings)
+        return _ok_result(input_path, output_path, start_time, timings)
+    except Exception as e:
+        return _error_result(input_path, e, start_time, timings)
+
+
+_preview_cache = OrderedDict()
+
+
+def _load_preview_proxy(input_path: Path, settings: dict, size: int):
+    """Proxy image + alpha for previews, memoized per file version and mask settings."""
+    stat = input_path.stat()
+    max_side = int(settings.get("inference_max_side", 0) or 0)
+    key = (
+        os.path.realpath(input_path), stat.st_mtime_ns, stat.st_size, size,
+        engine_cache_tag(settings.get("inference_engine")), max_side,
+    )
+    if key in _preview_cache:
+        _preview_cache.move_to_end(key)
+        return _preview_cache[key]
+
+    original, icc_profile, mask_source = load_input(input_path)
+    _, alpha_mask = infer(original, input_path.name, settings, mask_source)
+    scale = min(1.0, size / max(original.size))
+    if scale < 1.0:
+        proxy_size = (max(1, round(original.width * scale)), max(1, round(original.height * scale)))
+        proxy = original.resize(proxy_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        alpha_mask = alpha_mask.resize(proxy_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    else:
+        proxy = original
+
+    entry = (proxy, alpha_mask, icc_profile, scale)
+    _preview_cache[key] = entry
+    while len(_preview_cache) > PREVIEW_CACHE_ENTRIES:
+        _preview_cache.popitem(last=False)
+    return entry
+
+
+def render_preview(input_path: str, settings: dict, output_path: str = None, size: int = PREVIEW_SIZE) -> dict:
+    """Render a low-res preview JPEG with the full pipeline on a proxy image.
+
+    The mask comes from the mask cache when available (otherwise inference runs
+    once and fills it); the proxy image is memoized in-process, so repeated
+    calls with new settings (slider moves in serve mode) only re-render.
+    Without output_path the JPEG goes to a temp file, one per input (each
+    render replaces the previous one atomically); the path is returned.
+    """
+    start_time = time.time()
+    replace_output = output_path is None
+    if replace_output:
+        preview_dir = Path(tempfile.gettempdir()) / "photostack-portrait"
+        preview_dir.mkdir(parents=True, exist_ok=True)
+        # Bemenetenkent allando nev: a csuszka mozgatasa nem hagy maga utan fajlokat
+        input_key = hashlib.blake2b(os.path.realpath(input_path).encode("utf-8"), digest_size=8).hexdigest()
+        output_path = str(preview_dir / f"preview-{input_key}.jpg")
+
+    rejected = _check_paths(input_path, output_path)
+    if rejected:
+        return rejected
+
+    input_path = Path(input_path)
+    output_path = Path(output_path)
+    try:
+        proxy, proxy_alpha, icc_profile, scale = _load_preview_proxy(input_path, settings, max(64, int(size)))
+        foreground = proxy.convert("RGBA")
+        foreground.putalpha(proxy_alpha)
+        result = render(proxy, foreground, proxy_alpha, settings, scale=scale)
+        if replace_output:
+            # Az elozo elonezetet olvaso UI ne lasson felig irt fajlt
+            tmp_path = output_path.with_name(f".{output_path.stem}-{uuid.uuid4().hex}.jpg")
+            try:
+                save_output(result, tmp_path, icc_profile, settings)
+                os.replace(tmp_path, output_path)
+            finally:
+                tmp_path.unlink(missing_ok=True)
+        else:
+            save_output(result, output_path, icc_profile, settings)
+        response = _ok_result(input_path, output_path, start_time)
+        response["width"], response["height"] = result.size
+        return response
+    except Exception as e:
+        return _error_result(input_path, e, start_time)
+
+
+def run_pipelined(jobs, settings: dict, report, budget: Optional[MemoryBudget] = None) -> None:
+    """Staged single-process batch: decode | inference | render+encode.
+
+    jobs yields (index, item, estimated bytes) and is only pulled as decoding
+    proceeds. Decoding (border crop, sRGB) of the next images and
+    rendering/JPEG saving of previous results run in their own threads,
+    overlapped with inference on the current image. Bounded queues cap how many
+    decoded images are in flight; with a budget, an item is only decoded once
+    its estimated peak memory fits. report(index, result) is called from the
+    encode thread as items finish. An exception raised by jobs itself ends the
+    batch after the items already decoded and is re-raised here.
+    """
+    decoded = queue.Queue(maxsize=PIPELINE_DEPTH)
+    inferred = queue.Queue(maxsize=PIPELINE_DEPTH)
+    decode_error = []
+
+    def decode_stage():
+        try:
+            for index, item, estimate in jobs:
+                if budget is not None:
+                    budget.acquire(estimate)
+                job = {"index": index, "estimate": estimate, "start": time.time(),
+                       "result": _check_paths(item["input"], item["output"]), "timings": StageTimings()}
+                job["input"], job["output"] = Path(item["input"]), Path(item["output"])
+                if job["result"] is None:
+                    try:
+                        job["original"], job["icc_profile"], job["mask_source"] = load_input(job["input"], job["timings"])
+                    except Exception as e:
+                        job["result"] = _error_result(job["input"], e, job["start"], job["timings"])
+                decoded.put(job)
+        except BaseException as e:
+            decode_error.append(e)
+        finally:
+            # A lezaro None mindig megjon, kulonben a fo szal orokre a decoded.get()-en varna
+            decoded.put(None)
+
+    def encode_stage():
+        while (job := inferred.get()) is not None:
+            if job["result"] is None:
+                try:
+                    result = render(job.pop("original"), job.pop("foreground"), job.pop("alpha_mask"), settings,
+                                    timings=job["timings"])
+                    save_output(result, job["output"], job["icc_profile"], settings, job["timings"])
+                    job["result"] = _ok_result(job["input"], job["output"], job["start"], job["timings"])
+                except Exception as e:
+                    job["result"] = _error_result(job["input"], e, job["start"], job["timings"])
+            if budget is not None:
+                budget.release(job["estimate"])
+            report(job["index"], job["result"])
+
+    decoder = threading.Thread(target=decode_stage, name="portrait-decode", daemon=True)
+    encoder = threading.Thread(target=encode_stage, name="portrait-encode", daemon=True)
+    decoder.start()
+    encoder.start()
+
+    try:
+        while (job := decoded.get()) is not None:
+            if job["result"] is None:
+                try:
+                    job["foreground"], job["alpha_mask"] = infer(
+                        job["original"], job["input"].name, settings, job["mask_source"], job["timings"],
+                    )
+                except Exception as e:
+                    job["result"] = _error_result(job["input"], e, job["start"], job["timings"])
+            inferred.put(job)
+    finally:
+        inferred.put(None)
+        encoder.join()
+    decoder.join()
+    if decode_error:
+        raise decode_error[0]
+
+
+def _init_batch_worker(threads: int):
+    """Pool initializer: bound native thread pools before torch/cv2 spin them up."""
+    # Progress sorokat csak a fo folyamat ir; a worker kimenete (pl. modell print) stderr-re
+    sys.stdout = sys.stderr
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    import cv2
+    cv2.setNumThreads(threads)
+    set_num_threads(threads)
+
+
+def _process_batch_item(job):
+    index, item, settings = job
+    return index, process_single(item["input"], item["output"], settings)
+
+
+def _engine_name(settings: dict) -> str:
+    try:
+        return resolve_engine_name(settings.get("inference_engine"))
+    except BiRefNetError:
+        return DEFAULT_ENGINE
+
+
+def run_batch(items, settings: dict, workers: int = 1, memory_budget: Optional[int] = None,
+              on_result=None, resume: bool = True) -> Optional[list]:
+    """Process batch items, printing one progress line per finished item.
+
+    items is a list of {input, output} dicts or any sized iterable of them
+    (e.g. sidecar_common.sources.BatchSource); it is consumed lazily, as items are admitted.
+
+    A single worker runs the staged in-process pipeline; with workers > 1 the
+    items fan out to a process pool; every worker loads the model once and
+    gets cpu_count // workers intra-op threads.
+
+    Items are admitted against a memory budget (bytes, default see
+    scheduler.default_budget): each one's peak is estimated from its header
+    dimensions, and the worker count is capped so the models plus the
+    largest of the first items fit. Small images keep every worker busy,
+    large ones wait. Returns the results in input order.
+
+    With on_result(index, result, done) every result is handed over in
+    completion order instead and not kept (streaming); returns None.
+
+    Written outputs are recorded in the batch manifest (manifest.py). With
+    resume, items whose output it records for the same input bytes and
+    settings are not reprocessed; they are reported right away as
+    {"success": True, "skipped": True, ...}.
+
+    Items whose input bytes equal an earlier item's (duplicates.py) are not
+    processed again: the earlier output is copied to theirs once it is
+    written, reported with {"duplicate_of": <earlier input>}.
+    """
+    total = len(items)
+    done = skipped = copies = 0
+    results = None
+    if on_result is None:
+        results = [None] * total
+
+        def on_result(index, result, done):
+            results[index] = result
+            # Flush progress per item
+            print(json.dumps({"progress": done, "total": total, "current": result}), flush=True)
+
+    # Kihagyott elemek a dekodolo szalrol, kesz elemek az encode szalrol is jonnek (a manifest is kozos)
+    report_lock = threading.Lock()
+    in_flight = {}
+    duplicates = DuplicateInputs()
+    # kesz elem indexe -> (sikeres, bemenet, kimenet vagy hiba): a duplikatumai ebbol masolnak,
+    # akar kesobb is (egy tuple elemenkent, nem a teljes eredmeny)
+    firsts = {}
+    waiting = {}  # meg futo elem indexe -> [(index, item)] duplikatumai
+
+    def finish(index, result, item):
+        # report_lock alatt hivando
+        nonlocal done
+        if item is not None and result.get("success"):
+            manifest.record(item)
+        done += 1
+        on_result(index, result, done)
+
+    def report(index, result):
+        with report_lock:
+            finish(index, result, in_flight.pop(index, None))
+            success = bool(result.get("success"))
+            firsts[index] = (success, result.get("input"), result.get("output" if success else "error"))
+            for copy_index, copy_item in waiting.pop(index, ()):
+                finish(copy_index, _copy_duplicate(firsts[index], copy_item), copy_item)
+
+    def pending():
+        nonlocal skipped, copies
+        for index, item in enumerate(items):
+            error = _item_error(item)
+            if error:
+                with report_lock:
+                    finish(index, {"success": False, "input": _item_input(item), "error": error,
+                                   "processing_time": 0}, None)
+                continue
+            # Nem engedelyezett utvonalat sem a manifest, sem a duplikatum kereses nem olvas; az elem hibaval zarul
+            if _check_paths(item["input"], item["output"]) is None:
+                first = duplicates.first_of(index, item["input"])
+                if resume:
+                    with report_lock:
+                        result = manifest.lookup(item)
+                    if result:
+                        skipped += 1
+                        report(index, result)
+                        continue
+                if first is not None:
+                    copies += 1
+                    with report_lock:
+                        if first in firsts:
+                            finish(index, _copy_duplicate(firsts[first], item), item)
+                        else:
+                            waiting.setdefault(first, []).append((index, item))
+                    continue
+            in_flight[index] = item
+            yield index, item
+
+    # A manifest resume nelkul is frissul: a kovetkezo futas mar folytathato
+    manifest = BatchManifest(manifest_settings_hash(settings, engine_cache_tag(_engine_name(settings))))
+    try:
+        _run_scheduled(pending(), settings, workers, memory_budget, report)
+    finally:
+        manifest.close()
+    if skipped:
+        logger.info(f"Batch folytatás: {skipped} kész elem kihagyva")
+    if copies:
+        logger.info(f"Batch: {copies} ismétlődő bemenet, a kimenetük másolat")
+    return results
+
+
+def _item_input(item) -> Optional[str]:
+    return item.get("input") if isinstance(item, dict) else None
+
+
+def _item_error(item) -> Optional[str]:
+    """Error of an item that cannot be processed (its own "error", or a malformed item), else None."""
+    if not isinstance(item, dict) or not isinstance(item.get("input"), str) or not isinstance(item.get("output"), str):
+        return "Az elemnek input és output útvonal szükséges"
+    return item.get("error")
+
+
+def _copy_duplicate(first: tuple, item: dict) -> dict:
+    """Result of an item whose input equals an earlier one's: that item's output, copied.
+
+    first is (success, input, output or error) of the earlier item.
+    """
+    start_time = time.time()
+    success, first_input, first_output = first
+    if not success:
+        return {"success": False, "input": item["input"], "error": first_output, "processing_time": 0}
+    output_path = Path(item["output"])
+    try:
+        if os.path.realpath(first_output) != os.path.realpath(output_path):
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            # Masolat, nem hard link: egy kimenet kesobbi szerkesztese ne irja at a tobbit
+            shutil.copyfile(first_output, output_path)
+    except OSError as e:
+        return _error_result(item["input"], e, start_time)
+    logger.info(f"Másolat: {output_path.name} <- {Path(first_output).name} (azonos bemenet)")
+    return {
+        "success": True, "input": item["input"], "output": str(output_path),
+        "processing_time": round(time.time() - start_time, 2), "duplicate_of": first_input,
+    }
+
+
+def _run_scheduled(jobs, settings: dict, workers: int, memory_budget: Optional[int], report) -> None:
+    """Run (index, item) jobs under the memory budget; report(index, result) per finished item."""
+    if memory_budget is None:
+        memory_budget = scheduler.default_budget()
+
+    def estimate_bytes(item):
+        # Nem engedelyezett utvonal fejlecet sem olvassuk: az elem ugyis azonnal hibaval zarul
+        return scheduler.estimate_item_bytes(item["input"], settings) if _is_allowed_path(item["input"]) else 0
+
+    estimated = ((index, item, estimate_bytes(item)) for index, item in jobs)
+    # A worker szamot az elso elemekhez merjuk; egy kesobbi nagyobb elem is lefut, csak var (akar egyedul)
+    lookahead = list(itertools.islice(estimated, max(1, workers) * SCHEDULER_LOOKAHEAD))
+    if not lookahead:
+        return
+    estimated = itertools.chain(lookahead, estimated)
+
+    engine_base = scheduler.engine_base_bytes(_engine_name(settings))
+    workers = max(1, min(workers, len(lookahead)))
+    if workers > 1:
+        workers = fit_workers(workers, memory_budget, engine_base, max(e for _, _, e in lookahead))
+    budget = MemoryBudget(memory_budget - workers * engine_base)
+
+    if workers == 1:
+        run_pipelined(estimated, settings, report, budget)
+        return
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    logger.info(f"Batch: {workers} worker x {threads} szál, keret {memory_budget // MB} MB")
+    finished = queue.SimpleQueue()
+
+    def failed(index, input_path, error):
+        finished.put((index, {"success": False, "input": input_path, "error": str(error), "processing_time": 0}))
+
+    # spawn: a torch/OpenMP allapot fork utan nem megbizhato
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(workers, initializer=_init_batch_worker, initargs=(threads,)) as pool:
+        running = {}  # index -> becsult bajtok
+        upcoming = next(estimated, None)
+        while upcoming is not None or running:
+            # Sorrendben enged be, amig van szabad worker es belefer a keretbe
+            while upcoming is not None and len(running) < workers and budget.acquire(upcoming[2], block=False):
+                index, item, estimate = upcoming
+                running[index] = estimate
+                pool.apply_async(
+                    _process_batch_item, ((index, item, settings),),
+                    callback=finished.put,
+                    error_callback=lambda e, i=index, path=item["input"]: failed(i, path, e),
+                )
+                upcoming = next(estimated, None)
+            index, result = finished.get()
+            budget.release(running.pop(index))
+            report(index, result)
@@ -3,7 +3,32 @@
 
 Usage:
   python3 process_portrait.py --input photo.jpg --output result.jpg --settings-json /tmp/settings.json
-  python3 process_portrait.py --check  # Check if InSPyReNet is available
+  python3 process_portrait.py --check  # Packages + model weights present (no model load)
+  python3 process_portrait.py --warmup [--settings-json /tmp/settings.json]  # Load model + one dummy inference
+  python3 process_portrait.py --batch-json /tmp/batch.json --settings-json /tmp/settings.json --workers 4
+  python3 process_portrait.py --batch-json /tmp/batch.json --stream  # NDJSON records only, see below
+  python3 process_portrait.py --batch-json /tmp/batch.json --no-resume  # reprocess items the output manifest (manifest.py) marks done
+  python3 process_portrait.py --batch-dir "/photos/**/*.jpg" --output-template "/out/{dir}/{stem}.jpg" --stream
+  python3 process_portrait.py --serve [--settings-json /tmp/settings.json]  # Long-lived worker
+  python3 process_portrait.py --preview --input photo.jpg [--output preview.jpg] [--preview-size 800]
+
+Serve mode: the model is loaded once, then newline-delimited JSON jobs are read
+from stdin and every job gets exactly one JSON line on stdout:
+  -> {"id": 1, "input": "a.jpg", "output": "b.jpg", "settings": {...}}
+  <- {"id": 1, "success": true, "input": "a.jpg", "output": "b.jpg", "processing_time": 1.2}
+The first stdout line is {"ready": true} (or {"ready": false, "error": ...}).
+{"command": "preview", "input": "a.jpg", "settings": {...}, "size": 800} renders a
+low-res preview (see render_preview). {"command": "shutdown"} or EOF stops the worker.
+
+Stream mode (--stream, batch only): stdout carries NDJSON records and nothing
+else, one per finished item in completion order, then a summary without the
+results, so output size and memory do not grow with the batch:
+  <- {"type": "result", "index": 3, "progress": 1, "total": 500, "result": {...}}
+  <- {"type": "summary", "success": true, "total": 500, "successful": 498, "failed": 2, "timings_summary": {...}}
+
+--batch-dir takes a directory or a glob pattern instead of a JSON array (no
+MAX_BATCH_SIZE limit); items are rendered lazily, see sources.py for the
+--output-template fields.
 
 Settings JSON structure:
 {
@@ -19,251 +44,153 @@ Settings JSON structure:
   "edge_smoothing": 2,
   "add_shadow": false, "shadow_opacity": 0.3,
   "darken_amount": 0.7, "target_brightness": 35,
-  "output_quality": 95
+  "output_quality": 95,
+  "inference_max_side": 0,  # >0: segmentation at this longest side + guided alpha upsampling
+  "inference_engine": null,  # torch | onnx | stub (default: PORTRAIT_ENGINE env, then torch)
+  "tile_rows": 512  # replace mode without shadow: row strip height of the streamed composite (0 = untiled)
 }
 """
 
 import argparse
-import io
 import json
 import logging
-import os
 import sys
-import time
+from contextlib import redirect_stdout
 from pathlib import Path
 
-import numpy as np
-from PIL import Image, ImageCms
-
-# Kepmeretkorlat: max 50 megapixel (vedelem image bomb ellen)
-Image.MAX_IMAGE_PIXELS = 50_000_000
-
-MAX_BATCH_SIZE = 500
-
-# Engedelyezett utvonal prefixek (defense-in-depth)
-_ALLOWED_PREFIXES = [
-    os.path.realpath(os.path.expanduser("~")),
-    os.path.realpath(os.environ.get("TMPDIR", "/tmp")),
-]
-
-
-def _is_allowed_path(filepath: str) -> bool:
-    """Ellenorzi, hogy az utvonal az engedelyezett konyvtarakon belul van-e."""
-    try:
-        real = os.path.realpath(filepath)
-        return any(real.startswith(prefix + os.sep) for prefix in _ALLOWED_PREFIXES)
-    except (ValueError, OSError):
-        return False
-
-# Add parent to path for relative imports
+# Add parent to path for relative imports; a kozos batch segedek (sidecar_common) az electron/scripts/common alatt
 sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(1, str(Path(__file__).resolve().parents[2] / "common"))
 
-from birefnet import remove_background, check_available, BiRefNetError
-from border_crop import detect_and_crop_border
-from compositor import Compositor, darken_background
-from constants import PRESET_BACKGROUNDS, DEFAULT_PRESET
-from processing import EdgeProcessor, shrink_mask, feather_edges, smooth_edges
+# Csak konnyu modulok: numpy / PIL / cv2 / torch a pipeline importjaval jon, ott ahol kell
+from constants import PREVIEW_SIZE
+from sidecar_common.sources import BatchSource
+from sidecar_common.timings import TimingsSummary, summarize as summarize_timings
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
 
-_srgb_profile = ImageCms.createProfile("sRGB")
+MAX_BATCH_SIZE = 500
 
 
-def ensure_srgb(image: Image.Image, icc_profile: bytes = None):
-    """Convert image to sRGB if it has a different color profile."""
-    if not icc_profile:
-        return image, icc_profile
-    try:
-        src_profile = ImageCms.ImageCmsProfile(io.BytesIO(icc_profile))
-        src_name = ImageCms.getProfileDescription(src_profile)
-        if "srgb" in src_name.lower():
-            return image, icc_profile
-        logger.info(f"ICC konverzió: {src_name} -> sRGB")
-        dst_profile = ImageCms.ImageCmsProfile(_srgb_profile)
-        converted = ImageCms.profileToProfile(image, src_profile, dst_profile, outputMode="RGB")
-        return converted, dst_profile.tobytes()
-    except Exception as e:
-        logger.warning(f"ICC konverzió sikertelen: {e}")
-        return image, icc_profile
-
-
-def resolve_background(settings: dict):
-    """Resolve background from settings to a compositor-compatible value."""
-    bg_type = settings.get("background_type", "preset")
-
-    if bg_type == "preset":
-        preset = settings.get("preset_name", DEFAULT_PRESET)
-        if preset in PRESET_BACKGROUNDS:
-            return PRESET_BACKGROUNDS[preset]
-        return PRESET_BACKGROUNDS[DEFAULT_PRESET]
-
-    elif bg_type == "color":
-        r = int(settings.get("color_r", 0) or 0)
-        g = int(settings.get("color_g", 0) or 0)
-        b = int(settings.get("color_b", 0) or 0)
-        return (max(0, min(255, r)), max(0, min(255, g)), max(0, min(255, b)))
-
-    elif bg_type == "image":
-        bg_path = settings.get("background_image_path")
-        if bg_path and _is_allowed_path(bg_path) and Path(bg_path).exists():
-            return Path(bg_path)
-        logger.warning("Háttérkép nem található vagy nem engedélyezett, preset használata")
-        return PRESET_BACKGROUNDS[DEFAULT_PRESET]
-
-    elif bg_type == "gradient":
-        sr = int(settings.get("gradient_start_r", 0) or 0)
-        sg = int(settings.get("gradient_start_g", 0) or 0)
-        sb = int(settings.get("gradient_start_b", 0) or 0)
-        er = int(settings.get("gradient_end_r", 0) or 0)
-        eg = int(settings.get("gradient_end_g", 0) or 0)
-        eb = int(settings.get("gradient_end_b", 0) or 0)
-        direction = settings.get("gradient_direction", "vertical")
-        return {"type": "gradient", "start": (sr, sg, sb), "end": (er, eg, eb), "direction": direction}
-
-    return PRESET_BACKGROUNDS[DEFAULT_PRESET]
-
-
-def create_gradient_image(size, start_color, end_color, direction="vertical"):
-    """Create a gradient image."""
-    w, h = size
-    arr = np.zeros((h, w, 3), dtype=np.float32)
-
-    if direction == "radial":
-        cx, cy = w / 2, h / 2
-        max_dist = ((cx ** 2) + (cy ** 2)) ** 0.5
-        y_coords, x_coords = np.mgrid[0:h, 0:w]
-        distances = np.sqrt((x_coords - cx) ** 2 + (y_coords - cy) ** 2) / max_dist
-        distances = np.clip(distances, 0, 1)
-        for i in range(3):
-            arr[:, :, i] = start_color[i] * (1 - distances) + end_color[i] * distances
-    elif direction == "horizontal":
-        for i in range(3):
-            arr[:, :, i] = np.linspace(start_color[i], end_color[i], w)[np.newaxis, :]
-    else:  # vertical
-        for i in range(3):
-            arr[:, :, i] = np.linspace(start_color[i], end_color[i], h)[:, np.newaxis]
-
-    return Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8), mode="RGB")
-
-
-def process_single(input_path: str, output_path: str, settings: dict) -> dict:
-    """Process a single portrait image."""
-    start_time = time.time()
-
-    # Path validacio (defense-in-depth)
-    if not _is_allowed_path(input_path):
-        return {"success": False, "input": input_path, "error": "Nem engedélyezett bemeneti útvonal", "processing_time": 0}
-    if not _is_allowed_path(output_path):
-        return {"success": False, "input": input_path, "error": "Nem engedélyezett kimeneti útvonal", "processing_time": 0}
-
-    input_path = Path(input_path)
-    output_path = Path(output_path)
+def serve(default_settings: dict) -> int:
+    """Long-lived worker loop: NDJSON jobs on stdin, one NDJSON result per job on stdout."""
+    # A stdout csak a protokollé: minden mas kimenet (pl. transparent_background
+    # print-jei) stderr-re megy, kulonben az Electron oldali parser osszezavarodik
+    out = sys.stdout
+    sys.stdout = sys.stderr
+
+    from birefnet import warmup
+    from pipeline import process_single, render_preview
+
+    def respond(payload: dict):
+        out.write(json.dumps(payload) + "\n")
+        out.flush()
 
     try:
-        # Load and prepare image
-        original = Image.open(input_path)
-        icc_profile = original.info.get("icc_profile")
-        original = detect_and_crop_border(original)
-        original, icc_profile = ensure_srgb(original, icc_profile)
-
-        # Remove background (croppolt kepet adjuk at, nem az eredeti fajlt)
-        logger.info(f"[1/3] Háttér eltávolítás: {input_path.name}")
-        foreground, alpha_mask = remove_background(original)
-
-        if foreground.mode != "RGBA":
-            foreground = foreground.convert("RGBA")
-
-        mode = settings.get("mode", "replace")
-
-        if mode == "darken":
-            # Darken mode: light edge processing then darken
-            logger.info("[2/3] Háttér sötétítés")
-            processed_alpha = alpha_mask
-            if settings.get("edge_inset", 0) > 0:
-                processed_alpha = shrink_mask(processed_alpha, settings["edge_inset"])
-            if settings.get("edge_smoothing", 0) > 0:
-                processed_alpha = smooth_edges(processed_alpha, settings["edge_smoothing"])
-            if settings.get("feather_radius", 0) > 0:
-                processed_alpha = feather_edges(processed_alpha, settings["feather_radius"])
-
-            result = darken_background(
-                original, processed_alpha,
-                darken_amount=settings.get("darken_amount", 0.7),
-                target_brightness=settings.get("target_brightness", 35),
-            )
-        else:
-            # Replace mode: full processing
-            logger.info("[2/3] Él feldolgozás")
-            edge_processor = EdgeProcessor(
-                edge_inset=settings.get("edge_inset", 2),
-                feather_radius=settings.get("feather_radius", 3),
-                decontaminate=settings.get("decontaminate", True),
-                decontaminate_strength=settings.get("decontaminate_strength", 0.8),
-                hair_refinement=settings.get("hair_refinement", True),
-                hair_refinement_strength=settings.get("hair_refinement_strength", 0.4),
-                edge_smoothing=settings.get("edge_smoothing", 2),
-            )
-            processed_fg, processed_alpha = edge_processor.process(foreground, alpha_mask, original_image=original)
-
-            # Resolve background
-            background = resolve_background(settings)
-            if isinstance(background, dict) and background.get("type") == "gradient":
-                gradient_img = create_gradient_image(
-                    original.size, background["start"], background["end"], background["direction"]
-                )
-                compositor = Compositor(gradient_img)
-            else:
-                compositor = Compositor(background)
-
-            logger.info("[3/3] Kompozitálás")
-            if settings.get("add_shadow", False):
-                result = compositor.composite_with_shadow(
-                    processed_fg, processed_alpha,
-                    shadow_opacity=settings.get("shadow_opacity", 0.3),
-                )
-            else:
-                result = compositor.composite(processed_fg, processed_alpha)
-
-        # Save
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        save_kwargs = {}
-        if icc_profile:
-            save_kwargs["icc_profile"] = icc_profile
-
-        quality = max(50, min(100, settings.get("output_quality", 95)))
-        result.save(output_path, "JPEG", quality=quality, **save_kwargs)
-
-        elapsed = time.time() - start_time
-        logger.info(f"Kész: {input_path.name} ({elapsed:.2f}s)")
-
-        return {
-            "success": True,
-            "input": str(input_path),
-            "output": str(output_path),
-            "processing_time": round(elapsed, 2),
-        }
-
-    except BiRefNetError as e:
-        return {"success": False, "input": str(input_path), "error": f"AI hiba: {e}", "processing_time": round(time.time() - start_time, 2)}
+        warmup(default_settings.get("inference_engine"))
     except Exception as e:
-        return {"success": False, "input": str(input_path), "error": str(e), "processing_time": round(time.time() - start_time, 2)}
+        respond({"ready": False, "error": str(e)})
+        return 1
+    respond({"ready": True})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except json.JSONDecodeError:
+            respond({"success": False, "error": "Érvénytelen JSON sor"})
+            continue
+        if not isinstance(job, dict):
+            respond({"success": False, "error": "Érvénytelen feladat"})
+            continue
+        if job.get("command") == "shutdown":
+            break
+
+        job_id = job.get("id")
+        settings = {**default_settings, **(job.get("settings") or {})}
+
+        if job.get("command") == "preview":
+            if not isinstance(job.get("input"), str):
+                respond({"id": job_id, "success": False, "error": "input szükséges", "processing_time": 0})
+                continue
+            output = job.get("output") if isinstance(job.get("output"), str) else None
+            result = render_preview(job["input"], settings, output, job.get("size") or PREVIEW_SIZE)
+            result["id"] = job_id
+            respond(result)
+            continue
+
+        if not isinstance(job.get("input"), str) or not isinstance(job.get("output"), str):
+            respond({"id": job_id, "success": False, "error": "input és output szükséges", "processing_time": 0})
+            continue
+
+        result = process_single(job["input"], job["output"], settings)
+        result["id"] = job_id
+        respond(result)
+
+    return 0
+
+
+def stream_batch(items, settings: dict, workers: int, memory_budget, resume: bool = True) -> int:
+    """Batch in stream mode: one NDJSON record per item, then a summary record."""
+    import pipeline
+
+    # A stdout csak a protokolle (modell print-ek stderr-re)
+    out = sys.stdout
+    sys.stdout = sys.stderr
+
+    def emit(record: dict):
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+
+    total = len(items)
+    successful = 0
+    summary = TimingsSummary()
+
+    def on_result(index, result, done):
+        nonlocal successful
+        successful += 1 if result.get("success") else 0
+        summary.add(result)
+        emit({"type": "result", "index": index, "progress": done, "total": total, "result": result})
+
+    pipeline.run_batch(items, settings, workers=workers, memory_budget=memory_budget,
+                       on_result=on_result, resume=resume)
+    emit({
+        "type": "summary", "success": True, "total": total, "successful": successful,
+        "failed": total - successful, "timings_summary": summary.as_dict(),
+    })
+    return 0
 
 
 def main():
     parser = argparse.ArgumentParser(description="Portrait background replacement")
-    parser.add_argument("--check", action="store_true", help="Check if InSPyReNet is available")
+    parser.add_argument("--check", action="store_true", help="Check packages and model weights (no model load)")
+    parser.add_argument("--warmup", action="store_true", help="Load the model and run one dummy inference")
     parser.add_argument("--input", help="Input image path")
     parser.add_argument("--output", help="Output image path")
     parser.add_argument("--settings-json", help="Path to settings JSON file")
     parser.add_argument("--batch-json", help="Path to batch JSON file (array of {input, output})")
+    parser.add_argument("--batch-dir", help="Batch over the images of a directory or glob pattern")
+    parser.add_argument("--output-template", help="--batch-dir output path, e.g. /out/{dir}/{stem}.jpg")
+    parser.add_argument("--serve", action="store_true", help="Long-lived worker: NDJSON jobs on stdin")
+    parser.add_argument("--preview", action="store_true", help="Render a low-res preview of --input")
+    parser.add_argument("--preview-size", type=int, default=PREVIEW_SIZE, help="Preview longest side in px")
+    parser.add_argument("--workers", type=int, default=1, help="Parallel batch worker processes (default: 1)")
+    parser.add_argument("--memory-budget-mb", type=int, help="Batch memory budget in MB (default: 60%% of RAM)")
+    parser.add_argument("--stream", action="store_true", help="Batch: NDJSON result records + final summary only")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Batch: reprocess every item (the output manifest is still updated)")
 
     args = parser.parse_args()
 
     if args.check:
-        available = check_available()
-        print(json.dumps({"available": available}))
-        sys.exit(0 if available else 1)
+        # Csak find_spec + sulyfajl: a motor modulja (torch / onnxruntime) sem toltodik be
+        from birefnet import check_status
+        status = check_status()
+        print(json.dumps(status))
+        sys.exit(0 if status["available"] else 1)
 
     # Load settings
     settings = {}
@@ -272,8 +199,43 @@ def main():
         if settings_path.exists():
             settings = json.loads(settings_path.read_text("utf-8"))
 
+    # Warmup: sulyfajl es kernelek az OS page cache-be, mielott az elso valodi keres jon
+    if args.warmup:
+        from birefnet import warmup
+        try:
+            # transparent_background print-jei ne keveredjenek a JSON valaszba
+            with redirect_stdout(sys.stderr):
+                timing = warmup(settings.get("inference_engine"))
+        except Exception as e:
+            print(json.dumps({"success": False, "error": str(e)}))
+            sys.exit(1)
+        print(json.dumps({"success": True, **timing}))
+        sys.exit(0)
+
+    # Serve mode
+    if args.serve:
+        sys.exit(serve(settings))
+
+    # Argumentum hibak meg a pipeline (numpy / PIL / cv2) importja elott
+    if args.batch_dir and not args.output_template:
+        parser.error("--batch-dir mellé --output-template szükséges")
+    if not args.batch_json and not args.batch_dir:
+        if args.preview and not args.input:
+            parser.error("--preview mellé --input szükséges")
+        if not args.preview and (not args.input or not args.output):
+            parser.error("--input és --output szükséges (vagy --check / --warmup / --batch-json / --serve)")
+
+    import pipeline
+    import scheduler
+
     # Batch mode
-    if args.batch_json:
+    if args.batch_dir:
+        try:
+            items = BatchSource(args.batch_dir, args.output_template)
+        except ValueError as e:
+            print(json.dumps({"success": False, "error": str(e)}))
+            sys.exit(1)
+    elif args.batch_json:
         batch_path = Path(args.batch_json)
         if not batch_path.exists():
             print(json.dumps({"success": False, "error": "Batch JSON nem található"}))
@@ -282,21 +244,27 @@ def main():
         if len(items) > MAX_BATCH_SIZE:
             print(json.dumps({"success": False, "error": f"Túl sok elem (max {MAX_BATCH_SIZE})"}))
             sys.exit(1)
-        results = []
-        for item in items:
-            result = process_single(item["input"], item["output"], settings)
-            results.append(result)
-            # Flush progress per item
-            print(json.dumps({"progress": len(results), "total": len(items), "current": result}), flush=True)
+    if args.batch_dir or args.batch_json:
+        budget = args.memory_budget_mb * scheduler.MB if args.memory_budget_mb else None
+        if args.stream:
+            sys.exit(stream_batch(items, settings, args.workers, budget, resume=not args.no_resume))
+        results = pipeline.run_batch(items, settings, workers=args.workers, memory_budget=budget,
+                                     resume=not args.no_resume)
         successful = sum(1 for r in results if r["success"])
-        print(json.dumps({"success": True, "results": results, "total": len(results), "successful": successful}))
+        print(json.dumps({
+            "success": True, "results": results, "total": len(results), "successful": successful,
+            "timings_summary": summarize_timings(results),
+        }))
         sys.exit(0)
 
-    # Single mode
-    if not args.input or not args.output:
-        parser.error("--input és --output szükséges (vagy --check / --batch-json)")
+    # Preview mode
+    if args.preview:
+        result = pipeline.render_preview(args.input, settings, args.output, args.preview_size)
+        print(json.dumps(result))
+        sys.exit(0 if result["success"] else 1)
 
-    result = process_single(args.input, args.output, settings)
+    # Single mode
+    result = pipeline.process_single(args.input, args.output, settings)
     print(json.dumps(result))
     sys.exit(0 if result["success"] else 1)
 
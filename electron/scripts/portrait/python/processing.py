@@ -1,9 +1,9 @@
-"""Edge processing: shrink, feather, decontaminate, hair refinement, smooth."""
+"""Edge processing: shrink, feather, decontaminate, hair refinement, smooth, guided upsampling."""
 
 from __future__ import annotations
 
 import logging
-from typing import Optional
+from typing import Optional, Union
 
 import cv2
 import numpy as np
@@ -14,86 +14,265 @@ from constants import DEFAULT_DECONTAMINATE_STRENGTH, DEFAULT_FEATHER_RADIUS
 logger = logging.getLogger(__name__)
 
 
-def detect_background_color(original: Image.Image, alpha_mask: Image.Image) -> tuple[int, int, int]:
-    img_array = np.array(original.convert("RGB"))
-    mask_array = np.array(alpha_mask)
-    bg_mask = mask_array < 30
-    if not np.any(bg_mask):
+_HAIR_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+_HAIR_NOISE_KERNEL = np.array([[0.1], [0.2], [0.4], [0.2], [0.1]], dtype=np.float32)
+
+# color_decontaminate atmeneti sava: 0.05 < alpha/255 < 0.95, egesz kuszobokkel
+_DECONTAMINATE_MIN = 13
+_DECONTAMINATE_MAX = 242
+
+_rng = np.random.default_rng()
+
+# Atmeneti sav: ekkora csempekre bontjuk a kepet, es ha a sav ennel nagyobb
+# hanyadat fedi, egyszerubb a teljes kepen futtatni
+BAND_TILE = 64
+BAND_FULL_FRAME_RATIO = 0.6
+
+# guided_upsample: ennyi soronkent keszul a felskalazott kimenet
+GUIDED_STRIP_ROWS = 256
+
+_CROSS_3 = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
+
+# ============ Array-native lepesek (uint8 pufferek, ahol lehet helyben) ============
+
+def _background_color(img_rgb: Union[np.ndarray, Image.Image], alpha: np.ndarray) -> tuple[int, int, int]:
+    # 1000 mintahoz eleg egy ritkitott racs (~250k pixel), nem kell a teljes kep hatter pixeleit kigyujteni
+    step = max(1, int((alpha.size / 250_000) ** 0.5))
+    if isinstance(img_rgb, Image.Image):
+        # Soronkenti crop: csak a racs sorai kerulnek tombbe, nem a teljes RGB kep
+        w = img_rgb.width
+        img_rgb = np.stack([np.asarray(img_rgb.crop((0, y, w, y + 1)))[0, ::step]
+                            for y in range(0, img_rgb.height, step)])
+    else:
+        img_rgb = img_rgb[::step, ::step]
+    alpha = alpha[::step, ::step]
+    bg_pixels = img_rgb[alpha < 30]
+    if len(bg_pixels) == 0:
         return (128, 128, 128)
-    bg_pixels = img_array[bg_mask]
     if len(bg_pixels) > 1000:
-        indices = np.random.choice(len(bg_pixels), 1000, replace=False)
-        bg_pixels = bg_pixels[indices]
+        bg_pixels = bg_pixels[_rng.choice(len(bg_pixels), 1000, replace=False)]
     median_color = np.median(bg_pixels, axis=0).astype(int)
     return (int(median_color[0]), int(median_color[1]), int(median_color[2]))
 
 
+def _shrink(alpha: np.ndarray, pixels: int) -> np.ndarray:
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (pixels * 2 + 1, pixels * 2 + 1))
+    return cv2.erode(alpha, kernel, dst=alpha)
+
+
+def _smooth(alpha: np.ndarray, smoothness: int) -> np.ndarray:
+    smoothed = alpha
+    for _ in range(smoothness):
+        smoothed = cv2.bilateralFilter(smoothed, 5, 50, 50)
+    return np.minimum(alpha, smoothed, out=alpha)
+
+
+def _feather(alpha: np.ndarray, radius: int) -> np.ndarray:
+    blur_size = radius * 2 + 1
+    blurred = cv2.GaussianBlur(alpha, (blur_size, blur_size), 0)
+    return np.minimum(alpha, blurred, out=alpha)
+
+
+def _decontaminate(fg_rgba: np.ndarray, alpha: np.ndarray, bg_color: tuple[int, int, int],
+                   strength: float) -> np.ndarray:
+    # Csak az atmeneti sav pixeleit szamoljuk (float32), a tobbi erintetlen marad
+    ys, xs = np.nonzero((alpha >= _DECONTAMINATE_MIN) & (alpha <= _DECONTAMINATE_MAX))
+    if len(ys) == 0:
+        return fg_rgba
+    a = alpha[ys, xs].astype(np.float32) / 255.0
+    safe_alpha = np.maximum(a, 0.01)
+    inv_alpha = 1 - a
+    for c in range(3):
+        channel = fg_rgba[ys, xs, c].astype(np.float32)
+        decontaminated = (channel - inv_alpha * bg_color[c] * strength) / safe_alpha
+        fg_rgba[ys, xs, c] = np.clip(decontaminated, 0, 255).astype(np.uint8)
+    return fg_rgba
+
+
+def _refine_hair(alpha: np.ndarray, strength: float) -> np.ndarray:
+    smoothed = cv2.bilateralFilter(alpha, 7, 50, 50)
+    eroded = cv2.erode(smoothed, _HAIR_KERNEL, iterations=1)
+
+    # Sulyzas: 1 - |a/255 - 0.5| * 2, csak a szel-regioban
+    weight = smoothed.astype(np.float32)
+    weight *= 1.0 / 255.0
+    weight -= 0.5
+    np.abs(weight, out=weight)
+    weight *= -2.0
+    weight += 1.0
+    weight[(smoothed <= 10) | (eroded >= 245)] = 0.0
+    del eroded
+
+    noise = _rng.random(alpha.shape, dtype=np.float32)
+    noise = cv2.filter2D(noise, -1, _HAIR_NOISE_KERNEL)
+    noise -= 0.5
+    noise *= strength * 15
+    np.minimum(noise, 0, out=noise)
+    noise *= weight
+    del weight
+    noise += smoothed
+    np.clip(noise, 0, 255, out=noise)
+    return np.minimum(alpha, noise.astype(np.uint8), out=alpha)
+
+
+def transition_band(alpha: np.ndarray, halo: int, tile: int = BAND_TILE) -> list[tuple[int, int, int, int]]:
+    """Rectangles (y0, y1, x0, x1) covering every pixel the edge stages can change.
+
+    Only soft pixels (0 < alpha < 255) and hard 0/255 boundaries are affected
+    by the filters; everything farther than `halo` px from them is constant and
+    stays bit-identical. Occupied tiles are dilated by the halo and merged into
+    horizontal runs, so each rect is filtered once with its own halo.
+    """
+    h, w = alpha.shape
+    # Nagy halonal a csempe se legyen kisebb, kulonben a padding sokszorosan atfed
+    tile = max(tile, -(-halo // 32) * 32)
+    band = (alpha > 0) & (alpha < 255)
+    band |= cv2.dilate(alpha, _CROSS_3) != cv2.erode(alpha, _CROSS_3)
+
+    rows, cols = -(-h // tile), -(-w // tile)
+    starts = np.arange(0, w, tile)
+    occupied = np.zeros((rows, cols), dtype=np.uint8)
+    for ty in range(rows):
+        col_any = band[ty * tile:(ty + 1) * tile].any(axis=0)
+        occupied[ty] = np.add.reduceat(col_any, starts) > 0
+    if not occupied.any():
+        return []
+
+    reach = -(-halo // tile)
+    if reach:
+        occupied = cv2.dilate(occupied, np.ones((2 * reach + 1, 2 * reach + 1), np.uint8))
+    if occupied.mean() > BAND_FULL_FRAME_RATIO:
+        return [(0, h, 0, w)]
+
+    rects = []
+    for ty in range(rows):
+        tx = 0
+        while tx < cols:
+            if not occupied[ty, tx]:
+                tx += 1
+                continue
+            run_start = tx
+            while tx < cols and occupied[ty, tx]:
+                tx += 1
+            rects.append((ty * tile, min(h, (ty + 1) * tile), run_start * tile, min(w, tx * tile)))
+    return rects
+
+
+def _run_banded(rects, halo: int, step, *arrays: np.ndarray) -> None:
+    """Run step(*regions) on each rect padded by halo, write back only the rect.
+
+    Results are written after all rects ran, so no halo reads already
+    processed pixels of a neighbouring rect.
+    """
+    h, w = arrays[0].shape[:2]
+    done = []
+    for y0, y1, x0, x1 in rects:
+        py0, py1 = max(0, y0 - halo), min(h, y1 + halo)
+        px0, px1 = max(0, x0 - halo), min(w, x1 + halo)
+        regions = [arr[py0:py1, px0:px1].copy() for arr in arrays]
+        step(*regions)
+        done.append((y0, y1, x0, x1, [r[y0 - py0:y1 - py0, x0 - px0:x1 - px0] for r in regions]))
+    for y0, y1, x0, x1, cores in done:
+        for arr, core in zip(arrays, cores):
+            arr[y0:y1, x0:x1] = core
+
+
+def _rgba_array(foreground: Image.Image) -> np.ndarray:
+    if foreground.mode != "RGBA":
+        foreground = foreground.convert("RGBA")
+    return np.array(foreground)
+
+
+# ============ PIL API (egyedi lepesek, pl. darken mod) ============
+
+def detect_background_color(original: Image.Image, alpha_mask: Image.Image) -> tuple[int, int, int]:
+    return _background_color(np.asarray(original.convert("RGB")), np.asarray(alpha_mask))
+
+
 def shrink_mask(alpha_mask: Image.Image, pixels: int = 2) -> Image.Image:
     if pixels <= 0:
         return alpha_mask
-    mask_array = np.array(alpha_mask).astype(np.uint8)
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (pixels * 2 + 1, pixels * 2 + 1))
-    eroded = cv2.erode(mask_array, kernel, iterations=1)
-    return Image.fromarray(eroded, mode="L")
+    return Image.fromarray(_shrink(np.array(alpha_mask, dtype=np.uint8), pixels), mode="L")
 
 
 def feather_edges(alpha_mask: Image.Image, radius: int = DEFAULT_FEATHER_RADIUS) -> Image.Image:
     if radius <= 0:
         return alpha_mask
-    mask_array = np.array(alpha_mask).astype(np.float32)
-    blur_size = radius * 2 + 1
-    blurred = cv2.GaussianBlur(mask_array, (blur_size, blur_size), 0)
-    result = np.minimum(mask_array, blurred)
-    return Image.fromarray(result.astype(np.uint8), mode="L")
+    return Image.fromarray(_feather(np.array(alpha_mask, dtype=np.uint8), radius), mode="L")
 
 
 def refine_hair_edges(foreground: Image.Image, alpha_mask: Image.Image, strength: float = 0.5) -> tuple[Image.Image, Image.Image]:
-    mask_array = np.array(alpha_mask).astype(np.float32)
-    original_mask = mask_array.copy()
-    mask_uint8 = mask_array.astype(np.uint8)
-    smoothed = cv2.bilateralFilter(mask_uint8, 7, 50, 50)
-    mask_array = smoothed.astype(np.float32)
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-    eroded = cv2.erode(mask_array, kernel, iterations=1)
-    edge_region = ((mask_array > 10) & (eroded < 245)).astype(np.float32)
-    alpha_weight = 1.0 - np.abs(mask_array / 255.0 - 0.5) * 2
-    edge_region = edge_region * alpha_weight
-    noise = np.random.rand(*mask_array.shape).astype(np.float32)
-    kernel_v = np.array([[0.1], [0.2], [0.4], [0.2], [0.1]], dtype=np.float32)
-    noise = cv2.filter2D(noise, -1, kernel_v)
-    noise_effect = (noise - 0.5) * strength * 15
-    noise_effect = np.minimum(noise_effect, 0)
-    refined_mask = mask_array + (noise_effect * edge_region)
-    refined_mask = np.clip(refined_mask, 0, 255)
-    refined_mask = np.minimum(refined_mask, original_mask)
-    refined_mask = refined_mask.astype(np.uint8)
-    fg_array = np.array(foreground)
-    fg_array[:, :, 3] = refined_mask
-    return Image.fromarray(fg_array, mode="RGBA"), Image.fromarray(refined_mask, mode="L")
+    refined = _refine_hair(np.array(alpha_mask, dtype=np.uint8), strength)
+    fg_array = _rgba_array(foreground)
+    fg_array[:, :, 3] = refined
+    return Image.fromarray(fg_array, mode="RGBA"), Image.fromarray(refined, mode="L")
 
 
 def smooth_edges(alpha_mask: Image.Image, smoothness: int = 2) -> Image.Image:
-    mask_array = np.array(alpha_mask).astype(np.float32)
-    original = mask_array.copy()
-    mask_uint8 = mask_array.astype(np.uint8)
-    for _ in range(smoothness):
-        mask_uint8 = cv2.bilateralFilter(mask_uint8, 5, 50, 50)
-    result = np.minimum(original, mask_uint8.astype(np.float32))
-    return Image.fromarray(result.astype(np.uint8), mode="L")
+    return Image.fromarray(_smooth(np.array(alpha_mask, dtype=np.uint8), smoothness), mode="L")
 
 
 def color_decontaminate(foreground: Image.Image, alpha_mask: Image.Image, bg_color: tuple[int, int, int], strength: float = DEFAULT_DECONTAMINATE_STRENGTH) -> Image.Image:
-    fg_array = np.array(foreground).astype(np.float32)
-    alpha_array = np.array(alpha_mask).astype(np.float32) / 255.0
-    r, g, b, a = fg_array[:, :, 0], fg_array[:, :, 1], fg_array[:, :, 2], fg_array[:, :, 3]
-    edge_mask = (alpha_array > 0.05) & (alpha_array < 0.95)
-    bg_r, bg_g, bg_b = bg_color
-    for channel, bg_val in [(r, bg_r), (g, bg_g), (b, bg_b)]:
-        safe_alpha = np.maximum(alpha_array, 0.01)
-        decontaminated = (channel - (1 - alpha_array) * bg_val * strength) / safe_alpha
-        channel[edge_mask] = np.clip(decontaminated[edge_mask], 0, 255)
-    result = np.stack([r, g, b, a], axis=2).astype(np.uint8)
-    return Image.fromarray(result, mode="RGBA")
+    fg_array = _decontaminate(_rgba_array(foreground), np.asarray(alpha_mask), bg_color, strength)
+    return Image.fromarray(fg_array, mode="RGBA")
+
+
+def guided_upsample(alpha_low: Image.Image, guide: Image.Image, radius: int = 8, eps: float = 1e-4) -> Image.Image:
+    """Upsample a low-res alpha to the guide's size with a fast guided filter.
+
+    The linear coefficients are fitted on the low-res grid against a grayscale
+    copy of the guide, then bilinearly upsampled and applied to the full-res
+    guide, so edges (hair) follow the full-res image instead of the blurry mask.
+    Upsampling and the output run in row strips: besides the uint8 gray guide
+    and output, only GUIDED_STRIP_ROWS rows of float planes exist at a time.
+    """
+    full_w, full_h = guide.size
+    low_w, low_h = alpha_low.size
+    scale = max(full_w / low_w, full_h / low_h)
+    r = max(1, int(round(radius / scale)))
+    ksize = (2 * r + 1, 2 * r + 1)
+
+    guide_gray = np.asarray(guide.convert("L"))
+    guide_low = cv2.resize(guide_gray, (low_w, low_h), interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+    p = np.asarray(alpha_low, dtype=np.float32) / 255.0
+
+    mean_i = cv2.boxFilter(guide_low, -1, ksize)
+    mean_p = cv2.boxFilter(p, -1, ksize)
+    cov_ip = cv2.boxFilter(guide_low * p, -1, ksize) - mean_i * mean_p
+    var_i = cv2.boxFilter(guide_low * guide_low, -1, ksize) - mean_i * mean_i
+    a = cov_ip / (var_i + eps)
+    b = mean_p - a * mean_i
+    mean_a = cv2.boxFilter(a, -1, ksize) / 255.0  # a szurke vezeto 0..255 marad
+    mean_b = cv2.boxFilter(b, -1, ksize)
+
+    # cv2.resize (INTER_LINEAR) savonkent: vizszintesen cv2, fuggolegesen a sav sorainak sulyai
+    src_y = (np.arange(full_h, dtype=np.float64) + 0.5) * (low_h / full_h) - 0.5
+    np.clip(src_y, 0, low_h - 1, out=src_y)
+    row0 = np.floor(src_y).astype(np.intp)
+    row1 = np.minimum(row0 + 1, low_h - 1)
+    weight1 = (src_y - row0).astype(np.float32)[:, None]
+
+    out = np.empty((full_h, full_w), dtype=np.uint8)
+    for y in range(0, full_h, GUIDED_STRIP_ROWS):
+        rows = slice(y, min(y + GUIDED_STRIP_ROWS, full_h))
+        lo, hi = row0[rows][0], row1[rows][-1] + 1
+        r0, r1, w1 = row0[rows] - lo, row1[rows] - lo, weight1[rows]
+
+        def upsample(coef):
+            wide = cv2.resize(coef[lo:hi], (full_w, hi - lo), interpolation=cv2.INTER_LINEAR)
+            strip = wide[r1] - wide[r0]
+            strip *= w1
+            strip += wide[r0]
+            return strip
+
+        q = upsample(mean_a)
+        q *= guide_gray[rows]
+        q += upsample(mean_b)
+        q *= 255.0
+        np.clip(q, 0, 255, out=q)
+        out[rows] = q
+    return Image.fromarray(out, mode="L")
 
 
 class EdgeProcessor:
@@ -112,17 +291,71 @@ class EdgeProcessor:
 
     def process(self, foreground: Image.Image, alpha_mask: Image.Image,
                 original_image: Optional[Image.Image] = None) -> tuple[Image.Image, Image.Image]:
-        if self.edge_inset > 0:
-            alpha_mask = shrink_mask(alpha_mask, self.edge_inset)
-        if self.edge_smoothing > 0:
-            alpha_mask = smooth_edges(alpha_mask, self.edge_smoothing)
+        # Egy RGBA es egy uint8 alpha puffer vegig a lepeseken; PIL csak a hataron
+        fg = _rgba_array(foreground)
+        alpha = np.array(alpha_mask, dtype=np.uint8)
+        self.process_arrays(fg, alpha, original_image)
+        return Image.fromarray(fg, mode="RGBA"), Image.fromarray(alpha, mode="L")
+
+    def _mask_halo(self) -> int:
+        # shrink: ellipszis sugar, smooth: 5-os bilateral (r=2) iteracionkent
+        return self.edge_inset + 2 * self.edge_smoothing
+
+    def _edge_halo(self) -> int:
+        # feather: Gauss sugar, haj: 7-es bilateral (r=3) + 5x5 erozio (r=2)
+        return self.feather_radius + (5 if self.hair_refinement else 0)
+
+    def process_arrays(self, fg: np.ndarray, alpha: np.ndarray,
+                       original_image: Optional[Image.Image] = None) -> None:
+        """In-place variant: fg (H, W, 4) and alpha (H, W) uint8 buffers are modified.
+
+        All filters run only inside the alpha transition band (see
+        transition_band); fully opaque / transparent areas are not touched.
+        """
+        decontaminate_alpha, bg_color = self.process_mask(alpha, original_image)
+        if decontaminate_alpha is not None:
+            self.decontaminate_rows(fg, decontaminate_alpha, bg_color)
+        fg[:, :, 3] = alpha
+
+    def process_mask(self, alpha: np.ndarray, original_image: Optional[Image.Image] = None):
+        """Alpha-only part of the pipeline, in place on alpha.
+
+        Returns (decontaminate_alpha, bg_color): the mask as it was before
+        feathering (what decontamination thresholds on) — None when
+        decontamination is off — so the color side can run later, row strip
+        by row strip, via decontaminate_rows().
+        """
+        mask_halo, edge_halo = self._mask_halo(), self._edge_halo()
+        rects = transition_band(alpha, mask_halo + edge_halo)
+
+        def mask_step(a):
+            if self.edge_inset > 0:
+                _shrink(a, self.edge_inset)
+            if self.edge_smoothing > 0:
+                _smooth(a, self.edge_smoothing)
+
+        if mask_halo:
+            _run_banded(rects, mask_halo, mask_step, alpha)
+
+        decontaminate_alpha, bg_color = None, (128, 128, 128)
         if self.decontaminate:
-            bg_color = detect_background_color(original_image, alpha_mask) if original_image else (128, 128, 128)
-            foreground = color_decontaminate(foreground, alpha_mask, bg_color, self.decontaminate_strength)
-        alpha_mask = feather_edges(alpha_mask, self.feather_radius)
-        if self.hair_refinement:
-            foreground, alpha_mask = refine_hair_edges(foreground, alpha_mask, self.hair_refinement_strength)
-        fg_array = np.array(foreground)
-        fg_array[:, :, 3] = np.array(alpha_mask)
-        foreground = Image.fromarray(fg_array, mode="RGBA")
-        return foreground, alpha_mask
+            # Pixelenkenti lepes: a feather elotti maszk eleg hozza, az RGB kesobb, savonkent jon
+            decontaminate_alpha = alpha.copy()
+            if original_image is not None:
+                # A hatterszin a teljes (mar szukitett) maszkbol mintaz
+                rgb = original_image if original_image.mode == "RGB" else original_image.convert("RGB")
+                bg_color = _background_color(rgb, alpha)
+
+        def edge_step(a):
+            if self.feather_radius > 0:
+                _feather(a, self.feather_radius)
+            if self.hair_refinement:
+                _refine_hair(a, self.hair_refinement_strength)
+
+        _run_banded(rects, edge_halo, edge_step, alpha)
+        return decontaminate_alpha, bg_color
+
+    def decontaminate_rows(self, fg: np.ndarray, decontaminate_alpha: np.ndarray,
+                           bg_color: tuple[int, int, int]) -> np.ndarray:
+        """Decontaminate fg (H, W, 3 or 4) in place; rows must match decontaminate_alpha."""
+        return _decontaminate(fg, decontaminate_alpha, bg_color, self.decontaminate_strength)
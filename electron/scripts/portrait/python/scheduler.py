@@ -0,0 +1,61 @@
+"""Memory-budget admission control for batch items.
+
+Each item's peak memory is estimated from its header dimensions (PIL reads
+only the header, nothing is decoded) and the pipeline selected by the
+settings. Items are handed to workers only while the running total of the
+in-flight estimates fits into the budget (sidecar_common.budget).
+"""
+
+from sidecar_common.budget import MB, FALLBACK_BUDGET_MB, default_budget as _default_budget, image_pixels
+
+BUDGET_ENV = "PORTRAIT_MEMORY_BUDGET_MB"
+
+# Mert csucs RSS / pixel (2 MP -> 24 MP kulonbseg, stub motorral)
+BYTES_PER_PIXEL = {
+    "replace": 21,           # savos kompozitalas
+    "replace_untiled": 30,   # tile_rows = 0
+    "shadow": 39,            # add_shadow: teljes RGBA kep + elmosott arnyek
+    "darken": 16,
+}
+# Inference szakasz csucsa inference_max_side mellett: dekodolt RGB + RGBA eloter + alpha,
+# plusz a savos guided_upsample (szurke vezeto + kimenet + savok); a fenti ertekek alatt marad
+INFERENCE_BYTES_PER_PIXEL = 13
+ITEM_BASE_BYTES = 32 * MB
+
+# Workerenkent fix: interpreter + betoltott modell
+ENGINE_BASE_BYTES = {
+    "torch": 1200 * MB,
+    "onnx": 700 * MB,
+    "stub": 150 * MB,
+}
+
+
+def _render_bytes_per_pixel(settings: dict) -> int:
+    if settings.get("mode", "replace") == "darken":
+        return BYTES_PER_PIXEL["darken"]
+    if settings.get("add_shadow", False):
+        return BYTES_PER_PIXEL["shadow"]
+    if not int(settings.get("tile_rows", 1) or 0):
+        return BYTES_PER_PIXEL["replace_untiled"]
+    return BYTES_PER_PIXEL["replace"]
+
+
+def bytes_per_pixel(settings: dict) -> int:
+    """Peak bytes per input pixel: the larger of the inference and the render stage."""
+    render = _render_bytes_per_pixel(settings)
+    if int(settings.get("inference_max_side", 0) or 0) > 0:
+        return max(render, INFERENCE_BYTES_PER_PIXEL)
+    return render
+
+
+def estimate_item_bytes(path, settings: dict) -> int:
+    return ITEM_BASE_BYTES + image_pixels(path) * bytes_per_pixel(settings)
+
+
+def engine_base_bytes(engine: str) -> int:
+    return ENGINE_BASE_BYTES.get(engine, ENGINE_BASE_BYTES["torch"])
+
+
+def default_budget() -> int:
+    """Budget in bytes: BUDGET_ENV, else a share of physical RAM."""
+    return _default_budget(BUDGET_ENV, FALLBACK_BUDGET_MB)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Cold-start report for the Python sidecars.
+
+Every entry point runs in a fresh interpreter under `-X importtime`; the
+report has the wall time (median of --repeat runs), the time spent in
+imports, the slowest top-level imports and which heavy modules (numpy,
+cv2, torch, ...) got loaded at all. Run it with the sidecar's venv python.
+
+Usage:
+  python3 startup_report.py                       # default entry points, JSON on stdout
+  python3 startup_report.py --repeat 5 --max-ms 250
+  python3 startup_report.py -- portrait/python/process_portrait.py --check
+
+With --max-ms the exit code is 1 if any entry point is slower.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).parent
+
+# (nev, script a SCRIPTS_DIR-hez kepest, argumentumok) — a gyors utak, amiket az app indit
+ENTRY_POINTS = [
+    ("portrait --check", "portrait/python/process_portrait.py", ["--check"]),
+    ("portrait --help", "portrait/python/process_portrait.py", ["--help"]),
+    ("crop --check", "crop/python/auto_crop.py", ["--check"]),
+    ("crop --help", "crop/python/auto_crop.py", ["--help"]),
+    ("psd --help", "photoshop/python/tasks/generate_psd.py", ["--help"]),
+]
+
+HEAVY_MODULES = (
+    "numpy", "PIL", "cv2", "torch", "torchvision", "transparent_background",
+    "onnxruntime", "mediapipe", "psd_tools",
+)
+TOP_IMPORTS = 10
+DEFAULT_REPEAT = 3
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Top-level imports and loaded heavy modules from `-X importtime` output."""
+    top_level = []
+    loaded = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # fejlec sor
+        module = name.strip()
+        loaded.add(module.split(".")[0])
+        # A beagyazott importok ket szokozzel beljebb kezdodnek
+        if not name[1:].startswith(" "):
+            top_level.append((module, int(cumulative) / 1000))
+    top_level.sort(key=lambda item: item[1], reverse=True)
+    return {
+        "import_ms": round(sum(ms for _, ms in top_level), 1),
+        "modules": len(loaded),
+        "heavy_modules": sorted(m for m in HEAVY_MODULES if m in loaded),
+        "top_imports": [{"module": m, "ms": round(ms, 1)} for m, ms in top_level[:TOP_IMPORTS]],
+    }
+
+
+def measure(python: str, script: Path, args: list, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [python, "-X", "importtime", str(script), *args],
+            capture_output=True, text=True, cwd=script.parent,
+        )
+        wall_ms = (time.perf_counter() - start) * 1000
+        runs.append((wall_ms, proc.returncode, parse_importtime(proc.stderr)))
+
+    median_wall = statistics.median(r[0] for r in runs)
+    # A median futas import reszletei (nem atlag: a modul lista futasonkent azonos)
+    wall_ms, exit_code, imports = min(runs, key=lambda r: abs(r[0] - median_wall))
+    return {"wall_ms": round(median_wall, 1), "exit_code": exit_code, **imports}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start report for the Python sidecars")
+    parser.add_argument("--python", default=sys.executable, help="Interpreter to measure (default: this one)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per entry point (median is reported)")
+    parser.add_argument("--max-ms", type=float, help="Fail if any entry point's wall time exceeds this")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="-- script [args...] instead of the default entry points")
+    args = parser.parse_args()
+
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if command:
+        entries = [(" ".join(command), command[0], command[1:])]
+    else:
+        entries = ENTRY_POINTS
+
+    report = []
+    for name, script, script_args in entries:
+        script_path = Path(script) if Path(script).is_absolute() else (Path.cwd() / script)
+        if not script_path.exists():
+            script_path = SCRIPTS_DIR / script
+        result = measure(args.python, script_path.resolve(), script_args, max(1, args.repeat))
+        report.append({"name": name, "script": script, "args": script_args, **result})
+
+    over = [r["name"] for r in report if args.max_ms and r["wall_ms"] > args.max_ms]
+    print(json.dumps({"python": args.python, "entry_points": report, "over_budget": over}, indent=2))
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+/**
+ * Python sidecar batch futtatasa a `--stream` NDJSON protokollal.
+ *
+ * Soronkent egy `{"type": "result", "index", "progress", "total", "result"}` rekord,
+ * a vegen egy `{"type": "summary", ...}`. A stdout soronkent olvasodik, igy nincs
+ * maxBuffer korlat; az elemenkenti eredmenyek az `onResult` callbacken mennek tovabb,
+ * itt csak a hibas elemek maradnak meg.
+ */
+import { spawn } from 'child_process';
+import * as readline from 'readline';
+import log from 'electron-log/main';
+
+/** Ennyi stderr marad meg hibauzenethez / loghoz */
+const STDERR_TAIL = 64 * 1024;
+
+export interface StreamedBatchFailure {
+  /** Bemeneti index */
+  index: number;
+  error: string;
+}
+
+export interface StreamedBatch {
+  success: boolean;
+  error?: string;
+  /** Sikertelen elemek (index szerint novekvo sorrendben) */
+  failures: StreamedBatchFailure[];
+  /** Az utolso (summary) rekord, `type` nelkul */
+  summary: Record<string, unknown>;
+}
+
+export function runStreamedBatch<T>(
+  command: string,
+  args: string[],
+  timeoutMs: number,
+  onResult?: (result: T, index: number, progress: number, total: number) => void,
+): Promise<StreamedBatch> {
+  return new Promise((resolve) => {
+    const failures: StreamedBatchFailure[] = [];
+    let summary: Record<string, unknown> | null = null;
+    let stderrTail = '';
+    let timedOut = false;
+
+    const proc = spawn(command, args);
+
+    const timer = setTimeout(() => {
+      timedOut = true;
+      proc.kill();
+    }, timeoutMs);
+
+    proc.stderr.on('data', (chunk: Buffer) => {
+      stderrTail = (stderrTail + chunk.toString()).slice(-STDERR_TAIL);
+    });
+
+    readline.createInterface({ input: proc.stdout }).on('line', (line) => {
+      let record: Record<string, unknown>;
+      try {
+        record = JSON.parse(line);
+      } catch {
+        return;
+      }
+      if (!record || typeof record !== 'object') return;
+
+      if (record['type'] === 'result' && typeof record['index'] === 'number') {
+        const index = record['index'];
+        const result = record['result'] as T;
+        const outcome = result as Record<string, unknown> | null;
+        if (outcome?.['success'] !== true) {
+          failures.push({ index, error: String(outcome?.['error'] ?? 'Ismeretlen hiba') });
+        }
+        onResult?.(result, index, Number(record['progress']) || 0, Number(record['total']) || 0);
+      } else if ('success' in record) {
+        // summary rekord, vagy a batch elotti hiba ({"success": false, "error": ...})
+        summary = { ...record };
+        delete summary['type'];
+      }
+    });
+
+    const finish = (error?: string) => {
+      clearTimeout(timer);
+      if (error && stderrTail) log.error('stderr:', stderrTail);
+      resolve({
+        success: !error && summary?.['success'] === true,
+        error: error ?? (summary?.['success'] === true ? undefined : String(summary?.['error'] ?? 'Ismeretlen hiba')),
+        failures: failures.sort((a, b) => a.index - b.index),
+        summary: summary ?? {},
+      });
+    };
+
+    proc.on('error', (err) => finish(err.message));
+    proc.on('close', (code) => {
+      if (timedOut) finish('Idotullepes a feldolgozas soran');
+      else if (!summary) finish(`Ervenytelen valasz a Python scripttol (code=${code})`);
+      else finish();
+    });
+  });
+}
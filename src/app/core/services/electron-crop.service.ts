@@ -68,14 +68,28 @@ export class ElectronCropService {
     return window.electronAPI!.crop.detectFaces({ inputPath });
   }
 
-  /** Kötegelt arc detektálás */
-  async detectBatch(items: Array<{ input: string }>): Promise<CropBatchDetectResult> {
+  /**
+   * Kötegelt arc detektálás.
+   * Az elemek eredménye befejezéskor az onResult-on jön (bemeneti indexszel),
+   * a végső eredményben csak a számlálók és a hibás elemek maradnak.
+   */
+  async detectBatch(
+    items: Array<{ input: string }>,
+    onResult?: (index: number, result: CropDetectResult) => void,
+  ): Promise<CropBatchDetectResult> {
     if (!this.isElectron) {
       return { success: false, error: 'Csak Electron alkalmazásban érhető el' };
     }
 
     this.logger.info(`Crop kötegelt detektálás: ${items.length} elem`);
-    return window.electronAPI!.crop.detectBatch({ items });
+    const unsub = onResult
+      ? window.electronAPI!.crop.onBatchProgress((data) => onResult(data.index, data.result))
+      : null;
+    try {
+      return await window.electronAPI!.crop.detectBatch({ items });
+    } finally {
+      unsub?.();
+    }
   }
 
   // ============ Vágás Végrehajtás ============
@@ -37,6 +37,11 @@ describe('ElectronPortraitService', () => {
       expect(result.success).toBe(false);
     });
 
+    it('preview not available', async () => {
+      const result = await service.preview('/in.jpg', {} as any, 800);
+      expect(result.success).toBe(false);
+    });
+
     it('processBatch not available', async () => {
       const result = await service.processBatch([], {} as any);
       expect(result.success).toBe(false);
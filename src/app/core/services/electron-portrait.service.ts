@@ -1,6 +1,6 @@
 import { Injectable, inject, signal } from '@angular/core';
 import { LoggerService } from './logger.service';
-import { PortraitProcessResult, PortraitBatchResult, PortraitProcessingSettings } from './electron.types';
+import { PortraitProcessResult, PortraitBatchResult, PortraitBatchItemResult, PortraitPreviewResult, PortraitProcessingSettings } from './electron.types';
 
 /**
  * ElectronPortraitService - Lokalis portre hatter feldolgozas
@@ -8,6 +8,7 @@ import { PortraitProcessResult, PortraitBatchResult, PortraitProcessingSettings
  * Funkcionalitas:
  * - Python + InSPyReNet elérhetoseg ellenorzese
  * - Egyedi es kotegelt portre feldolgozas
+ * - Alacsony felbontasu elonezet (beallitas csuszkakhoz)
  * - Hatterkep letoltese API-bol
  * - Temp konyvtar kezeles
  */
@@ -64,17 +65,42 @@ export class ElectronPortraitService {
     return window.electronAPI!.portrait.processSingle({ inputPath, outputPath, settings });
   }
 
-  /** Kötegelt portré feldolgozás */
+  /** Gyors, alacsony felbontású előnézet (proxy kép, cache-elt maszk) */
+  async preview(
+    inputPath: string,
+    settings: PortraitProcessingSettings,
+    size?: number,
+  ): Promise<PortraitPreviewResult> {
+    if (!this.isElectron) {
+      return { success: false, error: 'Csak Electron alkalmazásban érhető el' };
+    }
+
+    return window.electronAPI!.portrait.preview({ inputPath, settings, size });
+  }
+
+  /**
+   * Kötegelt portré feldolgozás.
+   * Az elemek eredménye befejezéskor az onResult-on jön (bemeneti indexszel),
+   * a végső eredményben csak a számlálók és a hibás elemek maradnak.
+   */
   async processBatch(
     items: Array<{ input: string; output: string }>,
     settings: PortraitProcessingSettings,
+    onResult?: (index: number, result: PortraitBatchItemResult) => void,
   ): Promise<PortraitBatchResult> {
     if (!this.isElectron) {
       return { success: false, error: 'Csak Electron alkalmazásban érhető el' };
     }
 
     this.logger.info(`Portrait kötegelt feldolgozás: ${items.length} elem`);
-    return window.electronAPI!.portrait.processBatch({ items, settings });
+    const unsub = onResult
+      ? window.electronAPI!.portrait.onBatchProgress((data) => onResult(data.index, data.result))
+      : null;
+    try {
+      return await window.electronAPI!.portrait.processBatch({ items, settings });
+    } finally {
+      unsub?.();
+    }
   }
 
   // ============ Háttérkép Kezelés ============
@@ -257,6 +257,9 @@ export class ElectronService {
   processPortraitSingle(...args: Parameters<ElectronPortraitService['processSingle']>) {
     return this.portraitService.processSingle(...args);
   }
+  previewPortrait(...args: Parameters<ElectronPortraitService['preview']>) {
+    return this.portraitService.preview(...args);
+  }
   processPortraitBatch(...args: Parameters<ElectronPortraitService['processBatch']>) {
     return this.portraitService.processBatch(...args);
   }
@@ -314,18 +314,76 @@ interface FinalizerAPI {
 
 // ============ Portrait API ============
 
+/** Egy feldolgozasi lepes ideje es a folyamat csucs RSS novekmenye (Windows-on null) */
+export interface StageTiming {
+  wall_ms: number;
+  peak_rss_delta_mb: number | null;
+}
+
+/** Batch osszesites lepesenkent */
+export interface StageTimingSummary {
+  count: number;
+  p50_ms: number;
+  p95_ms: number;
+  max_peak_rss_delta_mb: number | null;
+}
+
 export interface PortraitProcessResult {
   success: boolean;
   error?: string;
   processing_time?: number;
+  /** decode, border_crop, srgb, inference, edges, composite, encode */
+  timings?: Record<string, StageTiming>;
+}
+
+export interface PortraitPreviewResult {
+  success: boolean;
+  error?: string;
+  outputPath?: string;
+  width?: number;
+  height?: number;
+  processing_time?: number;
+}
+
+/** Batch sikertelen eleme (a vegso eredmenyben csak ezek maradnak meg) */
+export interface BatchItemFailure {
+  /** Bemeneti index */
+  index: number;
+  error: string;
+}
+
+/** Elemenkenti batch eredmeny, feldolgozas kozben (befejezesi sorrendben) */
+export interface BatchItemProgress<T> {
+  /** Bemeneti index */
+  index: number;
+  /** Eddig befejezett elemek szama */
+  progress: number;
+  total: number;
+  result: T;
+}
+
+export interface PortraitBatchItemResult {
+  success: boolean;
+  input: string;
+  output?: string;
+  error?: string;
+  processing_time?: number;
+  timings?: Record<string, StageTiming>;
+  /** Korabbi futas kimenete ervenyes (manifest), nem dolgozodott fel ujra */
+  skipped?: boolean;
+  /** Ugyanazon bemenet korabbi elemenek kimenete, masolva */
+  duplicate_of?: string;
 }
 
+/** Az elemenkenti eredmenyek az onBatchProgress esemenyen jonnek */
 export interface PortraitBatchResult {
   success: boolean;
   error?: string;
-  results?: Array<{ success: boolean; input: string; output?: string; error?: string; processing_time?: number }>;
   total?: number;
   successful?: number;
+  failed?: number;
+  failures?: BatchItemFailure[];
+  timings_summary?: Record<string, StageTimingSummary>;
 }
 
 /** Electron IPC portrait settings (csak a feldolgozashoz szukseges mezok) */
@@ -459,6 +517,10 @@ export interface CropDetectResult {
   face_count?: number;
   quality?: CropQualityScores;
   processing_time?: number;
+  /** decode, resize, quality, face_mesh, landmarks */
+  timings?: Record<string, StageTiming>;
+  /** Batch: ugyanazon bemenet korabbi elemenek eredmenye */
+  duplicate_of?: string;
 }
 
 export interface CropExecuteResult {
@@ -469,12 +531,15 @@ export interface CropExecuteResult {
   crop?: { left: number; top: number; width: number; height: number };
 }
 
+/** Az elemenkenti eredmenyek az onBatchProgress esemenyen jonnek */
 export interface CropBatchDetectResult {
   success: boolean;
   error?: string;
-  results?: CropDetectResult[];
   total?: number;
   successful?: number;
+  failed?: number;
+  failures?: BatchItemFailure[];
+  timings_summary?: Record<string, StageTimingSummary>;
 }
 
 export interface CropBatchExecuteResult {
@@ -508,6 +573,7 @@ interface CropAPI {
   checkPython: () => Promise<{ available: boolean; error?: string }>;
   detectFaces: (params: { inputPath: string }) => Promise<CropDetectResult>;
   detectBatch: (params: { items: Array<{ input: string }> }) => Promise<CropBatchDetectResult>;
+  onBatchProgress: (callback: (data: BatchItemProgress<CropDetectResult>) => void) => () => void;
   executeCrop: (params: {
     inputPath: string;
     outputPath: string;
@@ -538,10 +604,16 @@ interface PortraitAPI {
     outputPath: string;
     settings: PortraitProcessingSettings;
   }) => Promise<PortraitProcessResult>;
+  preview: (params: {
+    inputPath: string;
+    settings: PortraitProcessingSettings;
+    size?: number;
+  }) => Promise<PortraitPreviewResult>;
   processBatch: (params: {
     items: Array<{ input: string; output: string }>;
     settings: PortraitProcessingSettings;
   }) => Promise<PortraitBatchResult>;
+  onBatchProgress: (callback: (data: BatchItemProgress<PortraitBatchItemResult>) => void) => () => void;
   downloadBackground: (params: {
     url: string;
     outputPath: string;
@@ -5,7 +5,7 @@ import { ElectronCropService } from '../../../../../core/services/electron-crop.
 import { LoggerService } from '../../../../../core/services/logger.service';
 import { TabloPersonItem } from '../persons-modal.types';
 import { CropSettings } from '../../../models/crop.models';
-import type { CropFaceLandmarks } from '../../../../../core/services/electron.types';
+import type { CropDetectResult, CropFaceLandmarks } from '../../../../../core/services/electron.types';
 import { type CropPhase, type CropReviewItem, type CropUploadResult, UPLOAD_CONCURRENCY } from './batch-crop.types';
 
 export type { CropPhase, CropReviewItem } from './batch-crop.types';
@@ -96,13 +96,21 @@ export class BatchCropActionsService {
       this.progress.set(25);
       this.currentStep.set('Arc detektálás...');
 
+      // Elemenkénti eredmények bemeneti sorrendben (befejezési sorrendben érkeznek)
+      const detectResults: CropDetectResult[] = [];
+      let detected = 0;
       const batchDetect = await this.cropService.detectBatch(
         downloadedItems.map(item => ({ input: item.inputPath })),
+        (index, result) => {
+          detectResults[index] = result;
+          detected++;
+          this.progress.set(25 + Math.round((detected / downloadedItems.length) * 25));
+        },
       );
 
       this.progress.set(50);
 
-      if (!batchDetect.success || !batchDetect.results) {
+      if (!batchDetect.success) {
         this.phase.set('error');
         this.currentStep.set('Arc detektálás sikertelen: ' + (batchDetect.error || 'ismeretlen hiba'));
         return;
@@ -120,8 +128,8 @@ export class BatchCropActionsService {
 
       const reviewList: CropReviewItem[] = [];
 
-      for (let i = 0; i < batchDetect.results.length; i++) {
-        const detectResult = batchDetect.results[i];
+      for (let i = 0; i < downloadedItems.length; i++) {
+        const detectResult = detectResults[i] ?? { success: false, error: 'Nincs detektálási eredmény' };
         const item = downloadedItems[i];
 
         if (!detectResult.success || !detectResult.faces?.length) {
@@ -154,35 +154,39 @@ export class BatchPortraitActionsService {
         output: item.outputPath,
       }));
 
-      const batchResult = await this.portraitService.processBatch(batchItems, processingSettings);
+      // Feldolgozás eredmények párosítása, ahogy az elemek elkészülnek
+      const processedItems: Array<{
+        person: TabloPersonItem;
+        outputPath: string;
+      }> = [];
+      const failedItems: Array<{ person: TabloPersonItem; error: string }> = [];
+      let finished = 0;
+
+      const batchResult = await this.portraitService.processBatch(batchItems, processingSettings, (index, result) => {
+        const item = downloadedItems[index];
+        if (!item) return;
+        if (result.success && result.output) {
+          processedItems.push({ person: item.person, outputPath: result.output });
+        } else {
+          failedItems.push({ person: item.person, error: result.error || 'Feldolgozás sikertelen' });
+        }
+        finished++;
+        this.progress.set(30 + Math.round((finished / batchItems.length) * 35));
+      });
 
       this.progress.set(65);
 
-      if (!batchResult.success && !batchResult.results) {
+      if (!batchResult.success) {
         this.phase.set('error');
         this.currentStep.set('Feldolgozás sikertelen: ' + (batchResult.error || 'ismeretlen hiba'));
         return { successful: 0, failed: persons.length };
       }
 
-      // Feldolgozás eredmények párosítása
-      const processedItems: Array<{
-        person: TabloPersonItem;
-        outputPath: string;
-      }> = [];
-
-      if (batchResult.results) {
-        for (let i = 0; i < batchResult.results.length; i++) {
-          const result = batchResult.results[i];
-          const item = downloadedItems[i];
-          if (result.success && result.output) {
-            processedItems.push({ person: item.person, outputPath: result.output });
-          } else {
-            this.results.update(r => [...r, {
-              personId: item.person.id, personName: item.person.name,
-              success: false, error: result.error || 'Feldolgozás sikertelen',
-            }]);
-          }
-        }
+      for (const failed of failedItems) {
+        this.results.update(r => [...r, {
+          personId: failed.person.id, personName: failed.person.name,
+          success: false, error: failed.error,
+        }]);
       }
 
       // 6. Feldolgozott képek feltöltése (concurrency-limited)